@@ -0,0 +1,151 @@
+"""Streaming window statistics of the sensor channels.
+
+Every window keeps, per channel, the sample count, min, max, running mean
+and sum of squared deviations from it (Welford's method), so its memory does
+not grow with the number of samples and the variance stays accurate with
+the single precision floats of the ESP32 port. Windows are aligned to
+multiples of their length in wall-clock time, e.g. whole minutes; a window
+is summarised once the first sample of the next one arrives.
+
+>>> aggregator = Aggregator(windows=(60, 300))
+>>> class Reading:
+...     temperature, humidity, pressure, gas = 21.0, 40.0, 1013.0, 90000
+>>> for timestamp, co2 in ((1600000200, 600.0), (1600000207, 640.0), (1600000214, 620.0)):
+...     aggregator.add(timestamp, None, {'co2_ppm': co2}, Reading)
+[]
+[]
+[]
+>>> summaries = aggregator.add(1600000260, None, {'co2_ppm': 700.0}, Reading)
+>>> [(summary.window, summary.start, summary.samples) for summary in summaries]
+[(60, 1600000200, 3)]
+>>> summaries[0].stats[CHANNELS.index('co2')]
+(3, 600.0, 640.0, 620.0, 400.0)
+>>> summaries[0].stats[CHANNELS.index('pm2.5')] is None
+True
+>>> Aggregator(windows=(60, 86400))
+Traceback (most recent call last):
+...
+ValueError: window of 86400 s is not in 1..65535
+"""
+try:
+    from collections import namedtuple
+except ImportError:
+    from ucollections import namedtuple
+
+MAX_WINDOW = 0xFFFF # s, the longest window a summary payload describes
+
+CHANNELS = ('pm1.0', 'pm2.5', 'pm4.0', 'pm10', 'co2', 'temperature', 'humidity', 'pressure', 'gas')
+
+# Position of every SPS30 mass density key in CHANNELS
+_MASS_DENSITY = (('pm1.0', 0), ('pm2.5', 1), ('pm4.0', 2), ('pm10', 3))
+_CO2 = 4
+_TEMPERATURE = 5
+_HUMIDITY = 6
+_PRESSURE = 7
+_GAS = 8
+
+Summary = namedtuple('Summary', ('window', 'start', 'samples', 'stats'))
+"""A closed window: its length and start in seconds, the number of samples
+and, per channel, (count, min, max, mean, variance) or None without values."""
+
+
+def channel_values(values: list, sps30_data, scd30_data, bme680) -> list:
+    """Fills 'values' with the sample's value of every channel in CHANNELS,
+    None where a sensor gave none, and returns it. Driver results holding an
+    error instead of values are skipped, like in payload.encode()."""
+    for i in range(len(values)):
+        values[i] = None
+    if isinstance(sps30_data, dict) and sps30_data.get("mass_density"):
+        mass_density = sps30_data["mass_density"]
+        for key, i in _MASS_DENSITY:
+            values[i] = mass_density[key]
+    if isinstance(scd30_data, dict):
+        values[_CO2] = scd30_data["co2_ppm"]
+    if bme680 is not None:
+        values[_TEMPERATURE] = bme680.temperature
+        values[_HUMIDITY] = bme680.humidity
+        values[_PRESSURE] = bme680.pressure
+        values[_GAS] = bme680.gas
+    return values
+
+
+class Stats:
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0 # sum of squared deviations from the mean
+        self.min = 0.0
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        if self.count == 1:
+            self.min = self.max = value
+        elif value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self) -> float:
+        """Sample variance, 0 for a single sample."""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def summary(self):
+        if not self.count:
+            return None
+        return (self.count, self.min, self.max, self.mean, self.variance)
+
+
+class Window:
+
+    def __init__(self, seconds: int):
+        self.seconds = seconds
+        self.start = None
+        self.samples = 0
+        self.stats = [Stats() for _ in CHANNELS]
+
+    def summary(self) -> Summary:
+        return Summary(self.seconds, self.start, self.samples, tuple(stats.summary() for stats in self.stats))
+
+    def clear(self, start: int) -> None:
+        self.start = start
+        self.samples = 0
+        for stats in self.stats:
+            stats.clear()
+
+
+class Aggregator:
+
+    def __init__(self, windows=(60, 300)):
+        for seconds in windows:
+            if not 0 < seconds <= MAX_WINDOW:
+                raise ValueError("window of {} s is not in 1..{}".format(seconds, MAX_WINDOW))
+        self.windows = [Window(seconds) for seconds in windows]
+        self.values = [None] * len(CHANNELS) # the sample being added, reused
+
+    def add(self, timestamp: int, sps30_data, scd30_data, bme680) -> list:
+        """Adds a sample taken at 'timestamp' (seconds) and returns the
+        Summary of every window it closed, usually none."""
+        closed = []
+        values = channel_values(self.values, sps30_data, scd30_data, bme680)
+        for window in self.windows:
+            start = timestamp - timestamp % window.seconds
+            if start != window.start:
+                if window.samples:
+                    closed.append(window.summary())
+                window.clear(start)
+            window.samples += 1
+            stats = window.stats
+            for i in range(len(values)):
+                if values[i] is not None:
+                    stats[i].add(values[i])
+        return closed
@@ -0,0 +1,245 @@
+"""AT command engine for the cellular modem.
+
+LineReader buffers whatever the UART has received and hands out complete
+lines as soon as they arrive, so a command returns on its final result code
+instead of after a fixed sleep. ATEngine sends commands, matches each one's
+expected response, retries with a delay and passes unsolicited result codes
+(URCs) to a handler.
+
+>>> from sim.serial import ScriptedUART
+>>> uart = ScriptedUART({
+...     'AT': ['OK'],
+...     'AT+CPIN?': ['+CPIN: READY', '', 'OK'],
+...     'AT+CREG?': [['+CREG: 0,2', 'OK'], ['RDY', '+CREG: 0,1', 'OK']],
+...     'AT+COPS=9': ['+CME ERROR: 3'],
+... })
+>>> urcs = []
+>>> modem = ATEngine(uart, urc=urcs.append, log=None)
+>>> modem.run((
+...     Command('AT'),
+...     Command('AT+CPIN?', expect=('+CPIN: READY',)),
+...     Command('AT+CREG?', expect=('+CREG: 0,1', '+CREG: 0,5'), retries=3, delay_ms=10),
+... ))
+['+CREG: 0,1', 'OK']
+>>> urcs, modem.retried
+(['RDY'], 1)
+>>> try:
+...     modem.command(Command('AT+COPS=9', retries=0))
+... except ATError as e:
+...     print(e.reason)
++CME ERROR: 3
+"""
+import time
+
+from ticks import ticks_ms, ticks_diff
+
+OK = ('OK',)
+# Final result codes, a command is over once one of them is received
+FINAL = ('OK', 'ERROR', 'CONNECT', 'NO CARRIER', 'NO DIALTONE', 'BUSY', 'NO ANSWER', '+CME ERROR', '+CMS ERROR')
+# Unsolicited result codes of the modem
+URC = ('RDY', '+CPIN:', '+CFUN:', 'Call Ready', 'SMS Ready', '+CREG:', '+CGREG:', '+QIURC:', 'NORMAL POWER DOWN')
+
+# Delay between two UART polls while waiting for a line
+POLL_MS = 5
+
+
+def _startswith(line: str, prefixes: tuple) -> bool:
+    # MicroPython's str.startswith() does not take a tuple
+    for prefix in prefixes:
+        if line.startswith(prefix):
+            return True
+    return False
+
+
+class ATError(Exception):
+    def __init__(self, command: str, reason: str):
+        super().__init__("{}: {}".format(command, reason))
+        self.command = command
+        self.reason = reason
+
+
+class Command:
+    """One AT command, the response substrings that mean success, how long to
+    wait for a final result code and how many times to retry, 'delay_ms'
+    apart, when the command fails or times out.
+    """
+    __slots__ = ('command', 'expect', 'timeout_ms', 'retries', 'delay_ms')
+
+    def __init__(self, command: str, expect: tuple = OK, timeout_ms: int = 1000, retries: int = 2, delay_ms: int = 200):
+        self.command = command
+        self.expect = expect
+        self.timeout_ms = timeout_ms
+        self.retries = retries
+        self.delay_ms = delay_ms
+
+
+class LineReader:
+    """Splits the UART input into lines in a preallocated buffer."""
+
+    def __init__(self, uart, size: int = 256):
+        self.uart = uart
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.length = 0
+        self.scanned = 0 # bytes already searched for a line end
+        self.overflows = 0
+        self.discard = False # dropping the rest of an overflowed line
+
+    def __fill(self) -> int:
+        available = self.uart.any()
+        if not available:
+            return 0
+        if self.length == len(self.buffer):
+            # A line longer than the buffer, drop it up to its end
+            self.overflows += 1
+            self.discard = True
+            self.length = self.scanned = 0
+        n = min(available, len(self.buffer) - self.length)
+        n = self.uart.readinto(self.view[self.length:self.length + n]) or 0
+        self.length += n
+        return n
+
+    def __next_line(self):
+        buffer = self.buffer
+        for i in range(self.scanned, self.length):
+            if buffer[i] == 0x0A: # '\n'
+                line = bytes(self.view[:i]).strip()
+                rest = self.length - i - 1
+                self.view[:rest] = self.view[i + 1:self.length]
+                self.length = rest
+                self.scanned = 0
+                if self.discard:
+                    self.discard = False
+                    return b''
+                return line
+        self.scanned = self.length
+        return None
+
+    def readline(self, timeout_ms: int):
+        """Returns the next non-empty line as a str, or None after 'timeout_ms'."""
+        start = ticks_ms()
+        while True:
+            line = self.__next_line()
+            if line:
+                return line.decode('ascii', 'replace')
+            if line is None and not self.__fill():
+                if ticks_diff(ticks_ms(), start) >= timeout_ms:
+                    return None
+                time.sleep(POLL_MS / 1000)
+
+    def clear(self) -> None:
+        """Drops everything received so far."""
+        while self.__fill():
+            self.length = self.scanned = 0
+        self.length = self.scanned = 0
+
+
+class ATEngine:
+
+    def __init__(self, uart, urc=None, log=print, sleep=time.sleep):
+        self.uart = uart
+        self.reader = LineReader(uart)
+        self.urc = urc
+        self.log = log
+        self.sleep = sleep # between retries, e.g. one that feeds a watchdog
+        self.retried = 0 # commands sent again
+        self.timeouts = 0
+
+    def __handle_urc(self, line: str) -> None:
+        if self.urc is not None:
+            self.urc(line)
+        elif self.log is not None:
+            self.log('URC: {}'.format(line))
+
+    def __attempt(self, command: Command) -> list:
+        """Sends the command once and returns its response lines."""
+        if self.log is not None:
+            self.log('Send: {}'.format(command.command))
+        self.uart.write(command.command + '\r\n')
+        # Information responses of the command itself, e.g. '+CREG' for 'AT+CREG?'
+        prefix = command.command[2:].split('=')[0].rstrip('?')
+        lines = []
+        matched = False
+        start = ticks_ms()
+        while True:
+            remaining = command.timeout_ms - ticks_diff(ticks_ms(), start)
+            line = self.reader.readline(max(0, remaining))
+            if line is None:
+                self.timeouts += 1
+                raise ATError(command.command, 'timeout')
+            if line == command.command:
+                continue # echo
+            expected = False
+            for pattern in command.expect:
+                if pattern in line:
+                    expected = True
+                    break
+            final = _startswith(line, FINAL)
+            if not expected and not final and _startswith(line, URC) and not (prefix and line.startswith(prefix)):
+                self.__handle_urc(line)
+                continue
+            lines.append(line)
+            matched = matched or expected
+            if final:
+                if matched:
+                    return lines
+                raise ATError(command.command, line)
+
+    def command(self, command: Command) -> list:
+        """Sends 'command' until it gets its expected response and returns
+        the response lines; raises ATError once the retries are used up.
+        """
+        attempt = 0
+        while True:
+            try:
+                lines = self.__attempt(command)
+                if self.log is not None:
+                    self.log('Received: {}'.format(lines))
+                return lines
+            except ATError as e:
+                if self.log is not None:
+                    self.log(str(e))
+                if attempt >= command.retries:
+                    raise
+                attempt += 1
+                self.retried += 1
+                self.sleep(command.delay_ms / 1000)
+
+    def run(self, script) -> list:
+        """Runs the commands in order and returns the response of the last one."""
+        self.reader.clear()
+        lines = None
+        for command in script:
+            lines = self.command(command)
+        return lines
+
+
+def ppp_bringup(apn: str) -> tuple:
+    """Commands bringing the modem from power-on to PPP data mode on 'apn'."""
+    return (
+        Command('AT', timeout_ms=300, retries=50, delay_ms=200), # until the modem has booted
+        Command('ATE0'),
+        Command('ATI'),
+        Command('AT+CPIN?', expect=('+CPIN: READY',), retries=10, delay_ms=500),
+        Command('AT+CREG=0'),
+        Command('AT+CGREG=0'),
+        Command('AT+CREG?', expect=('+CREG: 0,1', '+CREG: 0,5'), retries=120, delay_ms=500),
+        Command('AT+CGREG?', expect=('+CGREG: 0,1', '+CGREG: 0,5'), retries=120, delay_ms=500),
+        Command('AT+COPS?'),
+        Command('AT+CSQ'),
+        Command('AT+QICSGP=1,1,"{}","","",0'.format(apn)),
+        Command('ATD*99#', expect=('CONNECT',), timeout_ms=10000),
+    )
+
+
+def ppp_redial(apn: str) -> tuple:
+    """Commands dialling PPP again on a modem that is already registered,
+    once the previous PPP session has been closed."""
+    return (
+        Command('AT', timeout_ms=300, retries=5, delay_ms=200),
+        Command('ATH'),
+        Command('AT+CGREG?', expect=('+CGREG: 0,1', '+CGREG: 0,5'), retries=20, delay_ms=500),
+        Command('AT+QICSGP=1,1,"{}","","",0'.format(apn)),
+        Command('ATD*99#', expect=('CONNECT',), timeout_ms=10000),
+    )
+
@@ -0,0 +1,149 @@
+"""Buffers encoded samples and publishes them as one batched message.
+
+Samples are kept in a ring preallocated for 'max_count' entries. Once the
+ring is full the oldest sample is overwritten, which only happens when
+flushing keeps failing. A batch is due when it holds 'max_count' samples,
+when its oldest sample is 'max_age' seconds old or when it has reached
+'max_bytes'. It is packed into a preallocated buffer:
+
+* binary payloads into the batch container of payload.py, which records
+  the time every sample was taken at in seconds after the first one, at
+  most MAX_DELTA. A sample taken before the last one queued, e.g. a spooled
+  one or one after the RTC was set back, or more than MAX_DELTA after the
+  first one does not fit: the batch is flushed and the sample starts a new
+  one. The container counts at most MAX_COUNT samples;
+* JSON-like messages into a list, every message carrying its own timestamp.
+"""
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+from payload import BATCH_VERSION, BATCH_HEADER_FORMAT, BATCH_ENTRY_FORMAT
+
+BATCH_HEADER_SIZE = struct.calcsize(BATCH_HEADER_FORMAT)
+BATCH_ENTRY_SIZE = struct.calcsize(BATCH_ENTRY_FORMAT)
+MAX_DELTA = 0xFFFF # s, the largest time offset of an entry
+MAX_COUNT = 0xFF # the most entries the header can count
+
+
+class Batch:
+    """
+    >>> batch = Batch(max_count=3, max_age=60, max_bytes=64)
+    >>> batch.add(1000, b'{"a":1}'); batch.add(1007, b'{"a":2}')
+    >>> batch.due(1010), batch.due(1060)
+    (False, True)
+    >>> bytes(batch.pack())
+    b'[{"a":1},{"a":2}]'
+    >>> batch.add(1014, b'{"a":3}'); batch.add(1021, b'{"a":4}')
+    >>> len(batch), batch.dropped, bytes(batch.pack())
+    (3, 1, b'[{"a":2},{"a":3},{"a":4}]')
+    >>> batch.clear(); len(batch)
+    0
+    >>> batch = Batch(max_count=3, max_age=60, max_bytes=64, binary=True)
+    >>> batch.add(1000, b'a'); batch.add(1007, b'b')
+    >>> batch.fits(1014, b'c'), batch.fits(1003, b'c'), batch.fits(1000 + MAX_DELTA + 1, b'c')
+    (True, False, False)
+    >>> Batch(max_count=300)
+    Traceback (most recent call last):
+    ...
+    ValueError: max_count 300 is not in 1..255
+    >>> from payload import BATCH_ENTRY_FORMAT
+    >>> packed = bytes(batch.pack())
+    >>> [struct.unpack_from(BATCH_ENTRY_FORMAT, packed, offset)[0] for offset in (6, 11)]
+    [0, 7]
+    """
+
+    def __init__(self, max_count: int = 10, max_age: int = 300, max_bytes: int = 4096, binary: bool = False):
+        if not 1 <= max_count <= MAX_COUNT:
+            raise ValueError("max_count {} is not in 1..{}".format(max_count, MAX_COUNT))
+        self.max_count = max_count
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.binary = binary
+        self.timestamps = [0] * max_count
+        self.payloads = [None] * max_count
+        self.head = 0 # index of the oldest sample
+        self.count = 0
+        self.size = 0 # bytes of the queued payloads
+        self.dropped = 0
+        self.__buffer = bytearray(max_bytes + BATCH_HEADER_SIZE + max_count * (BATCH_ENTRY_SIZE + 1))
+        self.__view = memoryview(self.__buffer)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def fits(self, timestamp: int, payload) -> bool:
+        """False if adding 'payload', taken at 'timestamp', would drop a
+        sample: the batch holds 'max_count' samples, would go over
+        'max_bytes' or, binary, cannot record 'timestamp'."""
+        if self.count == 0:
+            return True
+        if self.binary:
+            last = self.timestamps[(self.head + self.count - 1) % self.max_count]
+            if not last <= timestamp <= self.timestamps[self.head] + MAX_DELTA:
+                return False
+        return self.count < self.max_count and self.size + len(payload) <= self.max_bytes
+
+    def add(self, timestamp: int, payload) -> None:
+        """Queues 'payload', taken at 'timestamp'. Samples are dropped, oldest
+        first, until it fits."""
+        if len(payload) > self.max_bytes:
+            raise ValueError("payload of {} bytes exceeds the batch size {}".format(len(payload), self.max_bytes))
+        while self.count and not self.fits(timestamp, payload):
+            self.__drop_oldest()
+        index = (self.head + self.count) % self.max_count
+        self.timestamps[index] = timestamp
+        self.payloads[index] = payload
+        self.count += 1
+        self.size += len(payload)
+
+    def __drop_oldest(self) -> None:
+        self.size -= len(self.payloads[self.head])
+        self.payloads[self.head] = None
+        self.head = (self.head + 1) % self.max_count
+        self.count -= 1
+        self.dropped += 1
+
+    def due(self, now: int) -> bool:
+        if self.count == 0:
+            return False
+        return (self.count >= self.max_count or self.size >= self.max_bytes
+                or now - self.timestamps[self.head] >= self.max_age)
+
+    def pack(self) -> memoryview:
+        """The queued samples as one message, valid until the next pack()."""
+        buffer = self.__buffer
+        if self.binary:
+            base = self.timestamps[self.head]
+            struct.pack_into(BATCH_HEADER_FORMAT, buffer, 0, BATCH_VERSION, self.count, base)
+            offset = BATCH_HEADER_SIZE
+        else:
+            buffer[0] = ord('[')
+            offset = 1
+        for i in range(self.count):
+            index = (self.head + i) % self.max_count
+            payload = self.payloads[index]
+            if self.binary:
+                struct.pack_into(BATCH_ENTRY_FORMAT, buffer, offset, self.timestamps[index] - base, len(payload))
+                offset += BATCH_ENTRY_SIZE
+            elif i:
+                buffer[offset] = ord(',')
+                offset += 1
+            buffer[offset:offset + len(payload)] = payload
+            offset += len(payload)
+        if not self.binary:
+            buffer[offset] = ord(']')
+            offset += 1
+        return self.__view[:offset]
+
+    def queued(self) -> list:
+        """The queued payloads, oldest first."""
+        return [self.payloads[(self.head + i) % self.max_count] for i in range(self.count)]
+
+    def clear(self) -> None:
+        """Forgets the queued samples, once they have been published."""
+        for i in range(self.max_count):
+            self.payloads[i] = None
+        self.head = 0
+        self.count = 0
+        self.size = 0
@@ -0,0 +1,86 @@
+"""Checks aggregate.Aggregator against a two-pass computation and compares the
+traffic of raw samples with window summaries.
+
+Runs on the device or a host::
+
+    import bench.aggregate
+    bench.aggregate.run()
+
+``check()`` feeds an hour of samples with a large offset and small noise,
+where the naive sum of squares loses the variance in single precision
+floats, and compares every window with the mean and variance computed in
+two passes over the same samples.
+"""
+import payload
+from aggregate import Aggregator, CHANNELS
+from bench.payload import SPS30_DATA, SCD30_DATA, GPS_DATA, BME680
+from bench.timing import measure, allocated, report
+
+PUBLISH_INTERVAL = 7 # s, AirPoll.PUBLISH_INTERVAL
+START = 1600000000
+
+
+def _samples(count):
+    """(timestamp, co2) pairs, a 100000 ppm offset with a few ppm of noise"""
+    seed = 12345
+    for i in range(count):
+        seed = (seed * 1103515245 + 12345) & 0x7fffffff
+        yield START + i * PUBLISH_INTERVAL, 100000.0 + (seed % 1000) / 100
+
+
+def _two_pass(values):
+    mean = sum(values) / len(values)
+    variance = sum((value - mean) ** 2 for value in values) / (len(values) - 1) if len(values) > 1 else 0.0
+    return mean, variance
+
+
+def check():
+    aggregator = Aggregator(windows=(60, 300))
+    windows = {60: {}, 300: {}}
+    co2 = CHANNELS.index('co2')
+    summaries = []
+    for timestamp, value in _samples(3600 // PUBLISH_INTERVAL):
+        for seconds, values in windows.items():
+            values.setdefault(timestamp - timestamp % seconds, []).append(value)
+        summaries += aggregator.add(timestamp, None, {'co2_ppm': value}, None)
+    assert summaries, 'no window closed'
+    for summary in summaries:
+        values = windows[summary.window][summary.start]
+        count, minimum, maximum, mean, variance = summary.stats[co2]
+        expected_mean, expected_variance = _two_pass(values)
+        assert count == summary.samples == len(values), summary
+        assert (minimum, maximum) == (min(values), max(values)), summary
+        assert abs(mean - expected_mean) < 0.01, (summary, expected_mean)
+        assert abs(variance - expected_variance) < 0.01 * expected_variance + 0.01, (summary, expected_variance)
+        assert all(stats is None for i, stats in enumerate(summary.stats) if i != co2), summary
+    print('aggregate: ok, {} windows'.format(len(summaries)))
+
+
+def run(rounds=200):
+    check()
+    sample = (SPS30_DATA, SCD30_DATA, BME680)
+    raw = {'json': 0, 'binary': len(payload.encode(START, START, 128, SPS30_DATA, SCD30_DATA, GPS_DATA, BME680))}
+    from bench.payload import json_message
+    raw['json'] = len(json_message(SPS30_DATA, SCD30_DATA, GPS_DATA, BME680))
+
+    samples = 3600 // PUBLISH_INTERVAL
+    aggregator = Aggregator(windows=(60, 300))
+    messages = summary_bytes = 0
+    for i in range(samples):
+        closed = aggregator.add(START + i * PUBLISH_INTERVAL, *sample)
+        if closed:
+            messages += 1
+            summary_bytes += len(payload.encode_summary(START, START, closed))
+    print('per hour at {} s: raw {} messages, json {} B, binary {} B; summaries {} messages, {} B'.format(
+        PUBLISH_INTERVAL, samples, samples * raw['json'], samples * raw['binary'], messages, summary_bytes))
+
+    timestamps = [START]
+    def add():
+        timestamps[0] += PUBLISH_INTERVAL
+        aggregator.add(timestamps[0], *sample)
+    report('Aggregator.add', measure(add, rounds))
+    print('{:<32} {:>12.0f} B'.format('allocated per add', allocated(add, rounds)))
+
+
+if __name__ == '__main__':
+    run()
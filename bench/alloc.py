@@ -0,0 +1,35 @@
+"""Bytes allocated per sensor read and per AirPoll.compose_message.
+
+Run on the device, after interrupting the publish loop::
+
+    import bench.alloc
+    bench.alloc.run(oAirPoll)
+
+Without an AirPoll instance only the SPS30 and SCD30 read paths are measured,
+on freshly created drivers.
+"""
+from bench.timing import allocated
+
+
+def run(airpoll=None, rounds=5):
+    if airpoll is None:
+        from sps30 import SPS30
+        from scd30 import SCD30
+        pm_sensor = SPS30()
+        co2_sensor = SCD30()
+        pm_sensor.start_measurement()
+        co2_sensor.start_measurement()
+    else:
+        pm_sensor = airpoll.pm_sensor
+        co2_sensor = airpoll.co2_sensor
+
+    print('bytes allocated per call ({} rounds)'.format(rounds))
+    print('{:<32} {:>8.0f}'.format('SPS30.read_data_ready_flag', allocated(pm_sensor.read_data_ready_flag, rounds)))
+    print('{:<32} {:>8.0f}'.format('SPS30.get_measurement', allocated(pm_sensor.get_measurement, rounds)))
+    print('{:<32} {:>8.0f}'.format('SCD30.read_measurement', allocated(co2_sensor.read_measurement, rounds)))
+    if airpoll is not None:
+        print('{:<32} {:>8.0f}'.format('AirPoll.compose_message', allocated(airpoll.compose_message, rounds)))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,57 @@
+"""Modem attach timing for the AT command engine, against the scripted
+modem of sim.serial.
+
+Runs on a host::
+
+    python -m bench.at
+"""
+from at import ATEngine, ATError, Command, ppp_bringup
+from bench.timing import ticks_us, ticks_diff
+from sim.serial import ScriptedUART, modem_script
+
+
+def check():
+    urcs = []
+    modem = ATEngine(ScriptedUART(modem_script(), echo=True), urc=urcs.append, log=None)
+    lines = modem.run(ppp_bringup('uinternet'))
+    assert lines == ['CONNECT 150000000'], lines
+    assert urcs == ['RDY'], urcs
+
+    modem = ATEngine(ScriptedUART({'AT+CPIN?': ['+CPIN: SIM PIN', 'OK']}), log=None)
+    try:
+        modem.command(Command('AT+CPIN?', expect=('+CPIN: READY',), retries=1, delay_ms=0))
+        raise AssertionError('missing SIM not reported')
+    except ATError as e:
+        assert e.reason == 'OK' and modem.retried == 1, (e.reason, modem.retried)
+
+    modem = ATEngine(ScriptedUART({'AT': []}), log=None)
+    try:
+        modem.command(Command('AT', timeout_ms=20, retries=0))
+        raise AssertionError('timeout not reported')
+    except ATError as e:
+        assert e.reason == 'timeout' and modem.timeouts == 1, e.reason
+
+    # Several lines in one read, split across reads, and a line overflowing the buffer
+    uart = ScriptedUART({'AT+CSQ': ['x' * 300, '+CSQ: 20,99', 'OK']})
+    modem = ATEngine(uart, log=None)
+    assert modem.command(Command('AT+CSQ')) == ['+CSQ: 20,99', 'OK']
+    assert modem.reader.overflows == 1
+    print('at: ok')
+
+
+def run(latency_ms=20):
+    check()
+    script = ppp_bringup('uinternet')
+    uart = ScriptedUART(modem_script(), latency_ms=latency_ms)
+    modem = ATEngine(uart, log=None)
+    start = ticks_us()
+    modem.run(script)
+    micros = ticks_diff(ticks_us(), start)
+    sent = len(uart.written)
+    print('modem attach, {} ms response latency, {} commands sent'.format(latency_ms, sent))
+    print('{:<32} {:>12.0f} ms'.format('fixed 0.3 s per command', sent * 300))
+    print('{:<32} {:>12.0f} ms'.format('ATEngine', micros / 1000))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,58 @@
+"""Per-frame CRC cost of a 60-byte SPS30 measurement response.
+
+Compares the old bit-by-bit checksum (one call per 3-byte packet, on a
+sliced copy) with the table-driven i2c.crc module. Run on the device::
+
+    import bench.crc
+    bench.crc.run()
+"""
+from i2c.crc import crc8, verify_words, PACKET_SIZE
+
+from bench.timing import measure, report
+
+# A valid SPS30 IEEE754 measurement frame (20 words, 60 bytes)
+FRAME = bytes([
+    0x3f, 0xc0, 0xed, 0x00, 0x00, 0x81, 0x40, 0x10, 0x4b, 0x00, 0x00, 0x81,
+    0x40, 0x48, 0x8c, 0x00, 0x00, 0x81, 0x40, 0x80, 0x72, 0x00, 0x00, 0x81,
+    0x41, 0x28, 0xc3, 0x00, 0x00, 0x81, 0x41, 0x30, 0x39, 0x00, 0x00, 0x81,
+    0x41, 0x4c, 0xbc, 0x00, 0x00, 0x81, 0x41, 0x50, 0x82, 0x00, 0x00, 0x81,
+    0x41, 0x60, 0x47, 0x00, 0x00, 0x81, 0x3f, 0x20, 0x2c, 0x00, 0x00, 0x81,
+])
+
+
+def bitwise_crc(data):
+    crc = 0xFF
+    for i in range(2):
+        crc ^= data[i]
+        for _ in range(8, 0, -1):
+            if crc & 0x80:
+                crc = (crc << 1) ^ 0x31
+            else:
+                crc = crc << 1
+    return crc & 0x0000FF
+
+
+def bitwise_frame(data):
+    for i in range(0, len(data), PACKET_SIZE):
+        if bitwise_crc(data[i:i+2]) != data[i+2]:
+            raise ValueError('CRC mismatched')
+
+
+def table_frame(data):
+    for i in range(0, len(data), PACKET_SIZE):
+        if crc8(data, i, i + 2) != data[i+2]:
+            raise ValueError('CRC mismatched')
+
+
+def run(rounds=200):
+    words = [0] * (len(FRAME) // PACKET_SIZE)
+    print('CRC per 60-byte frame ({} rounds)'.format(rounds))
+    baseline = measure(lambda: bitwise_frame(FRAME), rounds)
+    report('bit-by-bit per packet', baseline)
+    report('crc8 table per packet', measure(lambda: table_frame(FRAME), rounds), baseline)
+    report('verify_words', measure(lambda: verify_words(FRAME), rounds), baseline)
+    report('verify_words (out=)', measure(lambda: verify_words(FRAME, words), rounds), baseline)
+
+
+if __name__ == '__main__':
+    run()
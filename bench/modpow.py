@@ -0,0 +1,66 @@
+"""Checks and times the modular exponentiation backends of rsa.core.
+
+Run on the device::
+
+    import bench.modpow
+    bench.modpow.run()
+
+``check()`` runs every available backend against known vectors and an RSA
+round trip before anything is timed, so a broken backend never gets
+reported as fast.
+"""
+from third_party.rsa import core
+
+from bench.rsa_sign import load_test_key
+from bench.timing import measure, report
+
+# (x, e, m, x ** e % m)
+VECTORS = (
+    (4, 13, 497, 445),
+    (3, 0, 7, 1),
+    (3, 5, 1, 0),
+    (0, 5, 7, 0),
+    (2, 1000, 1000000007, 688423210),
+    (0xdeadbeefcafebabe, 0x10001, (1 << 127) - 1,
+     73617776043233282924643073789452314237),
+    (7, (1 << 64) - 1, (1 << 61) - 1, 4747561509943),
+    (65537, (1 << 200) + 3, 3 ** 100,
+     159952138660235838713619944473479724589698543451),
+)
+
+
+def check(bits=(1024,)):
+    for name in sorted(core.BACKENDS):
+        backend = core.BACKENDS[name]
+        for x, e, m, expected in VECTORS:
+            result = backend(x, e, m)
+            if result != expected:
+                raise AssertionError('%s(%r, %r, %r) = %r, expected %r' %
+                                     (name, x, e, m, result, expected))
+        for size in bits:
+            key = load_test_key(size)
+            message = (key.n - 1) // 7
+            signed = backend(message, key.d, key.n)
+            if backend(signed, key.e, key.n) != message:
+                raise AssertionError('%s: RSA-%d round trip failed' % (name, size))
+        print('{}: ok'.format(name))
+
+
+def run(rounds=3):
+    check()
+    for size in (1024, 2048):
+        key = load_test_key(size)
+        message = (key.n - 1) // 3
+        print('RSA-{} private exponent ({} rounds)'.format(size, rounds))
+        baseline = None
+        for name in ('binary', 'window', 'native'):
+            if name not in core.BACKENDS:
+                continue
+            backend = core.BACKENDS[name]
+            micros = measure(lambda: backend(message, key.d, key.n), rounds)
+            report(name, micros, baseline)
+            baseline = baseline or micros
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,75 @@
+"""Checks the NMEA parser against the streams in bench/nmea_streams and
+times it.
+
+Runs on a host, or on the device with the streams copied to its filesystem::
+
+    python -m bench.nmea
+
+``check()`` feeds every stream whole and again in chunks of varying sizes,
+so sentences split across UART reads are covered, and compares the latest
+fix and the counters with the expected ones.
+"""
+from nmea import NMEAParser, GPSFix
+from bench.timing import measure, report
+
+STREAMS = 'bench/nmea_streams'
+
+# stream: (latest fix, valid sentences, checksum errors, overflows)
+EXPECTED = {
+    # u-blox style GP talker, RMC/VTG/GGA/GSA/GSV/GLL, three epochs
+    'ublox_fix.nmea': (GPSFix(53.361342, -6.505627, 62.1, 34072.0, 0.98), 24, 0, 0),
+    # receiver without a fix yet: empty GGA fields, quality 0
+    'cold_start.nmea': (None, 15, 0, 0),
+    # GN talker, south/east hemispheres, DGPS quality, fix lost at the end,
+    # so no fix is reported
+    'gnss_south_east.nmea': (None, 5, 0, 0),
+    # garbage bytes, a corrupted sentence, a truncated one, an overlong one,
+    # a lower case checksum and a sentence cut off at the end
+    'noisy.nmea': (GPSFix(48.117305, 11.516672, 545.8, 43203.0, 1.3), 3, 2, 1),
+}
+
+CHUNKS = (1, 7, 3, 64, 13, 2, 31, 5)
+
+
+def load(name):
+    with open('{}/{}'.format(STREAMS, name), 'rb') as f:
+        return f.read()
+
+
+def parse(data, chunks=None):
+    gps = NMEAParser()
+    if chunks is None:
+        gps.feed(data)
+        return gps
+    offset = 0
+    i = 0
+    while offset < len(data):
+        n = chunks[i % len(chunks)]
+        gps.feed(data[offset:offset + n])
+        offset += n
+        i += 1
+    return gps
+
+
+def check():
+    for name in sorted(EXPECTED):
+        data = load(name)
+        for chunks in (None, CHUNKS):
+            gps = parse(data, chunks)
+            result = (gps.fix, gps.sentences, gps.checksum_errors, gps.overflows)
+            if result != EXPECTED[name]:
+                raise AssertionError('{} (chunks {}): {!r}, expected {!r}'.format(name, chunks, result, EXPECTED[name]))
+        print('{}: ok'.format(name))
+
+
+def run(rounds=20):
+    check()
+    data = load('ublox_fix.nmea')
+    micros = measure(lambda: parse(data), rounds)
+    report('parse {} bytes'.format(len(data)), micros)
+    # One second of GPS output at 9600 baud is at most 960 bytes
+    print('{:<32} {:>12.0f} bytes/s'.format('throughput', len(data) * 1000000 / micros))
+
+
+if __name__ == '__main__':
+    run()
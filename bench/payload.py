@@ -0,0 +1,63 @@
+"""Payload size and encode time, JSON-like message versus binary payload.
+
+Run on the device, after interrupting the publish loop::
+
+    import bench.payload
+    bench.payload.run(oAirPoll)
+
+Without an AirPoll instance a fixed sample is encoded, so it also runs on a
+host. The JSON-like message then mirrors AirPoll.format_message.
+"""
+import payload
+from bme680 import BME680Reading
+from nmea import GPSFix
+from bench.timing import measure, report
+
+SPS30_DATA = {
+    "mass_density": {"pm1.0": 5.123, "pm2.5": 7.456, "pm4.0": 8.789, "pm10": 9.012},
+    "particle_count": {"pm0.5": 30.125, "pm1.0": 38.5, "pm2.5": 40.25, "pm4.0": 40.5, "pm10": 40.625},
+    "particle_size": 0.543,
+    "mass_density_unit": "ug/m3",
+    "particle_count_unit": "#/cm3",
+    "particle_size_unit": "um"
+}
+SCD30_DATA = {"co2_ppm": 612.4983, "temp_celsius": 23.251, "rh_percent": 41.0627}
+GPS_DATA = GPSFix(53.361337, -6.50562, 61.7, 34070.0, 1.03)
+BME680 = BME680Reading(21.54, 40.27, 1013.58, 120345.6)
+
+
+def json_message(sps30_data, scd30_data, gps_data, bme680):
+    if gps_data is not None:
+        gps_data = '{{"latitude":{},"longitude":{},"altitude":{},"time":{},"hdop":{}}}'.format(*gps_data)
+    return '{{"device_id":{0},"boot_time":{1},"timestamp":{2},"esp32_temp":{3},"esp32_gc_free_mem":0,"sps30_data":{4},"scd30_data":{5},"gps_data":{6},"bme680":{{"bme680_temperature":{7},"bme680_humidity":{8},"bme680_pressure":{9},"bme680_gas":{10}}}}}'.format(
+        'airpoll-1', 1600000000, 1600000300, 128, sps30_data, scd30_data, gps_data,
+        bme680.temperature, bme680.humidity, bme680.pressure, bme680.gas).encode('utf-8')
+
+
+def binary_message(sps30_data, scd30_data, gps_data, bme680):
+    return payload.encode(1600000000, 1600000300, 128, sps30_data, scd30_data, gps_data, bme680)
+
+
+def run(airpoll=None, rounds=50):
+    if airpoll is None:
+        sample = (SPS30_DATA, SCD30_DATA, GPS_DATA, BME680)
+        encode_json = lambda: json_message(*sample)
+    else:
+        airpoll.bme680.start_reading()
+        sample = (airpoll.pm_sensor.get_measurement(), airpoll.co2_sensor.get_measurement(),
+                  airpoll.gps.update(airpoll.gps_uart), airpoll.bme680.collect_reading())
+        encode_json = lambda: airpoll.format_message(*sample).encode('utf-8')
+    encode_binary = lambda: binary_message(*sample)
+
+    json_size = len(encode_json())
+    binary_size = len(encode_binary())
+    print('payload bytes: json {}, binary v{} {}  x{:.2f}'.format(
+        json_size, payload.VERSION, binary_size, json_size / binary_size))
+    print('encode time ({} rounds)'.format(rounds))
+    baseline = measure(encode_json, rounds)
+    report('json-like str.format', baseline)
+    report('binary struct', measure(encode_binary, rounds), baseline)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,57 @@
+"""Benchmarks RSA signing: full-width exponentiation vs the CRT path.
+
+Run on the device::
+
+    import bench.rsa_sign
+    bench.rsa_sign.run()
+
+The keys below are throw-away test keys, only the primes are stored and the
+rest of the key is derived at import time.
+"""
+from third_party.rsa import common, core
+from third_party.rsa.key import BlindingPool, PrivateKey, DEFAULT_EXPONENT
+
+from bench.timing import measure, report
+
+# (p, q) hex pairs of test keys, keyed by modulus size in bits.
+TEST_PRIMES = {
+    1024: ('ee2645f3b215b99e20f3d5dc2cf5de9b6449393eb56eeea173badd1246c079be'
+           '68e8384ec39fcf235267fdc267d4b6a25f48c1843143c572b98c8e22bfe6f679',
+           'da574258f5107257098656ae150fed03e809f7e7fd5abb9e5a267c769670de8a'
+           '66a0523a60ed9121bf2c05c023fb24a36d7993483280973d2bf6cdb93dccabd3'),
+    2048: ('e251be8c2110d5893f8e2df7406da8816b0f4c495ab94f28107a6872d99a48fb'
+           'd48f803b51c0d0d96144c509181cec19acece21a0b56fc255d2af83e717297fb'
+           '824def4f99bda280feec33f232d4ec70919c7d41fc4f5695b511f1421c038213'
+           '23af56cd05cdc4ad80094c2de69c4becdb85c6778bacb3fce46447f2b048145d',
+           'd3b172cbffbd2f1ad588a68b29181094670d6b18979ddd01789293c519861388'
+           '179bc2c6a7ae002099f122609ec33585ae37aa89504c6172a451dbfabb7eabfc'
+           'fe0f9a6b8f1267713a3ea23bc80c667f6a8ff2f8e8ec6db7d5e6376c97abf82a'
+           'a87f7be90163e8eab47597990cd2c6f3c51ac10ee361c8d3c7c88a8983d1c7d1'),
+}
+
+
+def load_test_key(bits):
+    p, q = (int(h, 16) for h in TEST_PRIMES[bits])
+    d = common.inverse(DEFAULT_EXPONENT, (p - 1) * (q - 1))
+    return PrivateKey(p * q, DEFAULT_EXPONENT, d, p, q)
+
+
+def run(rounds=3):
+    for bits in sorted(TEST_PRIMES):
+        key = load_test_key(bits)
+        message = (key.n - 1) // 3
+        print('RSA-{} ({} rounds)'.format(bits, rounds))
+        baseline = measure(lambda: core.encrypt_int(message, key.d, key.n), rounds)
+        report('fast_pow(m, d, n)', baseline)
+        report('decrypt_int_crt', measure(lambda: core.decrypt_int_crt(
+            message, key.p, key.q, key.exp1, key.exp2, key.coef), rounds), baseline)
+        report('blinded_encrypt (CRT)', measure(lambda: key.blinded_encrypt(message), rounds),
+               baseline)
+        key.blinding = BlindingPool(key, size=rounds)
+        key.blinding.fill()
+        report('blinded_encrypt (CRT + pool)', measure(lambda: key.blinded_encrypt(message), rounds),
+               baseline)
+
+
+if __name__ == '__main__':
+    run()
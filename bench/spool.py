@@ -0,0 +1,128 @@
+"""Checks power-loss recovery of spool.SegmentLog and times it for large backlogs.
+
+Run on the device (it writes to /bench_spool and removes it afterwards)::
+
+    import bench.spool
+    bench.spool.run()
+
+``check()`` cuts the write of a record, and of the cursor, after every
+possible number of bytes and checks that the reopened log holds exactly the
+records written before, in order, and keeps appending after them.
+"""
+import os
+
+from spool import SegmentLog, CURSOR_FILES, RECORD_HEADER_SIZE
+from bench.timing import measure, report
+
+RECORD_SIZE = 64
+SEGMENT_RECORDS = 16
+
+
+def _path():
+    try:
+        import tempfile
+        return tempfile.mkdtemp()
+    except ImportError:
+        return '/bench_spool'
+
+
+def _clear(path):
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return
+    for name in names:
+        os.remove('{}/{}'.format(path, name))
+
+
+def _open(path, max_segments=4):
+    return SegmentLog(path, RECORD_SIZE, SEGMENT_RECORDS, max_segments)
+
+
+def _sample(i):
+    return 'sample {:05d}'.format(i).encode()
+
+
+def _expect(log, first, count):
+    drained = []
+    log.drain(drained.append, count + 1)
+    expected = [_sample(i) for i in range(first, first + count)]
+    if drained != expected:
+        raise AssertionError('drained {!r}, expected {!r}'.format(drained, expected))
+
+
+def _read(path, name, offset, size):
+    with open('{}/{}'.format(path, name), 'rb') as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+def _write(path, name, offset, data):
+    with open('{}/{}'.format(path, name), 'r+b') as f:
+        f.seek(offset)
+        f.write(data)
+
+
+def check(path=None, count=SEGMENT_RECORDS + 3):
+    path = path or _path()
+    index = count % SEGMENT_RECORDS
+    segment = '{:08d}.seg'.format(count // SEGMENT_RECORDS + 1)
+    try:
+        # The record that a power loss cuts short
+        _clear(path)
+        log = _open(path)
+        for i in range(count + 1):
+            log.append(_sample(i))
+        record = _read(path, segment, index * RECORD_SIZE, RECORD_SIZE)
+
+        for cut in range(RECORD_SIZE):
+            _clear(path)
+            log = _open(path)
+            for i in range(count):
+                log.append(_sample(i))
+            _write(path, segment, index * RECORD_SIZE, record[:cut])
+            log = _open(path)
+            # Only the padding is missing past the payload, the record is whole
+            written = count + (cut >= RECORD_HEADER_SIZE + len(_sample(count)))
+            if len(log) != written:
+                raise AssertionError('cut at {}: {} records, expected {}'.format(cut, len(log), written))
+            for i in range(written, count + 2):
+                log.append(_sample(i))
+            _expect(_open(path), 0, count + 2)
+        print('record cut after 0..{} bytes: ok'.format(RECORD_SIZE - 1))
+
+        # The cursor write that a power loss cuts short
+        for cut in range(16):
+            _clear(path)
+            log = _open(path)
+            for i in range(count):
+                log.append(_sample(i))
+            log.drain(lambda payload: None, 3)
+            log.drain(lambda payload: None, 2)
+            name = CURSOR_FILES[(log.generation + 1) % 2]
+            saved = _read(path, CURSOR_FILES[log.generation % 2], 0, 16)
+            _write(path, name, 0, saved[:cut])
+            _expect(_open(path), 5, count - 5)
+        print('cursor cut after 0..15 bytes: ok')
+    finally:
+        _clear(path)
+
+
+def run(backlogs=(64, 256, 1024), rounds=3):
+    check()
+    path = _path()
+    try:
+        for backlog in backlogs:
+            _clear(path)
+            log = _open(path, max_segments=backlog // SEGMENT_RECORDS + 1)
+            micros = measure(lambda: log.append(_sample(0)), backlog) # one append per record
+            print('backlog of {} records'.format(backlog))
+            report('append', micros)
+            report('recover', measure(lambda: _open(path, backlog // SEGMENT_RECORDS + 1), rounds))
+            report('drain 32 records', measure(lambda: log.drain(lambda payload: None, 32), 1))
+    finally:
+        _clear(path)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,53 @@
+"""Timing helpers shared by the benchmark scripts.
+
+Uses the MicroPython ``ticks_us`` clock on the device and falls back to
+``perf_counter`` when the scripts are run with CPython on a host.
+"""
+import gc
+
+from ticks import ticks_us, ticks_diff
+
+
+def measure(func, rounds=1):
+    """Runs 'func' 'rounds' times and returns the mean duration in microseconds."""
+    start = ticks_us()
+    for _ in range(rounds):
+        func()
+    return ticks_diff(ticks_us(), start) / rounds
+
+
+def report(name, micros, baseline=None):
+    if baseline:
+        print('{:<32} {:>12.0f} us  x{:.2f}'.format(name, micros, baseline / micros))
+    else:
+        print('{:<32} {:>12.0f} us'.format(name, micros))
+
+
+def allocated(func, rounds=1):
+    """Returns the mean number of bytes allocated by one call of 'func'.
+
+    On MicroPython this is the gc.mem_alloc() delta with the collector
+    disabled. CPython does not count cumulative allocations, so on a host the
+    tracemalloc peak of each call is used instead.
+    """
+    gc.collect()
+    if hasattr(gc, 'mem_alloc'):
+        gc.disable()
+        try:
+            start = gc.mem_alloc()
+            for _ in range(rounds):
+                func()
+            return (gc.mem_alloc() - start) / rounds
+        finally:
+            gc.enable()
+
+    import tracemalloc
+    total = 0
+    for _ in range(rounds):
+        tracemalloc.start()
+        try:
+            func()
+            total += tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return total / rounds
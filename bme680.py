@@ -40,6 +40,10 @@ try:
     import struct
 except ImportError:
     import ustruct as struct
+try:
+    from collections import namedtuple
+except ImportError:
+    from ucollections import namedtuple
 
 #    I2C ADDRESS/BITS/SETTINGS
 #    -----------------------------------------------------------------------
@@ -69,6 +73,9 @@ _BME680_FILTERSIZES = (0, 1, 3, 7, 15, 31, 63, 127)
 
 _BME680_RUNGAS = const(0x10)
 
+# Heater-on time written to GAS_WAIT_0: 0x65 = 37 * 4 = 148 ms
+_BME680_GAS_WAIT = const(0x65)
+
 _LOOKUP_TABLE_1 = (2147483647, 2147483647, 2147483647, 2147483647, 2147483647,
                    2126008810, 2147483647, 2130303777, 2147483647, 2147483647,
                    2143188679, 2136746228, 2147483647, 2126008810, 2147483647,
@@ -79,6 +86,10 @@ _LOOKUP_TABLE_2 = (4096000000, 2048000000, 1024000000, 512000000, 255744255, 127
                    500000, 250000, 125000)
 
 
+BME680Reading = namedtuple('BME680Reading', ('temperature', 'humidity', 'pressure', 'gas'))
+"""All compensated values of one conversion: degrees celsius, RH %, hectoPascals, ohms."""
+
+
 def _read24(arr):
     """Parse an unsigned 24-bit value as a floating point and return it."""
     ret = 0
@@ -109,7 +120,7 @@ class Adafruit_BME680:
 
         # set up heater
         self._write(_BME680_BME680_RES_HEAT_0, [0x73])
-        self._write(_BME680_BME680_GAS_WAIT_0, [0x65])
+        self._write(_BME680_BME680_GAS_WAIT_0, [_BME680_GAS_WAIT])
 
         self.sea_level_pressure = 1013.25
         """Pressure in hectoPascals at sea level. Used to calibrate ``altitude``."""
@@ -130,6 +141,13 @@ class Adafruit_BME680:
         self._last_reading = 0
         self._min_refresh_time = 1000 / refresh_rate
 
+        # Settings last written to the config registers, None until the first reading
+        self._config_written = None
+
+        # ticks_ms() when the pending conversion was triggered and its expected duration
+        self._conversion_start = None
+        self._conversion_time = 0
+
     @property
     def pressure_oversample(self):
         """The oversampling for pressure sensor"""
@@ -182,14 +200,95 @@ class Adafruit_BME680:
     def temperature(self):
         """The compensated temperature in degrees celsius."""
         self._perform_reading()
-        calc_temp = (((self._t_fine * 5) + 128) // 256)
-        return calc_temp / 100
+        return self._calc_temperature()
 
     @property
     def pressure(self):
         """The barometric pressure in hectoPascals"""
         self._perform_reading()
-        
+        return self._calc_pressure()
+
+    @property
+    def humidity(self):
+        """The relative humidity in RH %"""
+        self._perform_reading()
+        return self._calc_humidity()
+
+    @property
+    def altitude(self):
+        """The altitude based on current ``pressure`` vs the sea level pressure
+           (``sea_level_pressure``) - which you must enter ahead of time)"""
+        pressure = self.pressure # in Si units for hPascal
+        return 44330 * (1.0 - math.pow(pressure / self.sea_level_pressure, 0.1903))
+
+    @property
+    def gas(self):
+        """The gas resistance in ohms"""
+        self._perform_reading()
+        return self._calc_gas()
+
+    @property
+    def measurement_duration(self):
+        """Expected duration of a single-shot conversion in milliseconds, from the
+           oversampling settings and the gas heater wait time (Bosch BME68x API formula)."""
+        cycles = (_BME680_SAMPLERATES[self._temp_oversample] +
+                  _BME680_SAMPLERATES[self._pressure_oversample] +
+                  _BME680_SAMPLERATES[self._humidity_oversample])
+        duration_us = cycles * 1963 + 477 * 4 + 477 * 5 # TPH switching + gas measurement
+        duration_ms = (duration_us + 500) // 1000 + 1 # round, plus wake up
+        # GAS_WAIT: 6-bit value times a multiplication factor of 1, 4, 16 or 64
+        heat_ms = (_BME680_GAS_WAIT & 0x3F) << (2 * (_BME680_GAS_WAIT >> 6))
+        return duration_ms + heat_ms
+
+    def start_reading(self):
+        """Trigger a single-shot conversion and return at once, without polling the bus.
+           Returns the expected conversion time in milliseconds; call ``collect_reading()``
+           any time afterwards."""
+        ctrl = self._write_config()
+        self._write(_BME680_REG_CTRL_MEAS, [ctrl | 0x01])  # enable single shot!
+        self._conversion_start = time.ticks_ms()
+        self._conversion_time = self.measurement_duration
+        return self._conversion_time
+
+    @property
+    def reading_ready(self):
+        """True once the expected conversion time of the pending reading has passed."""
+        return (self._conversion_start is not None and
+                time.ticks_diff(time.ticks_ms(), self._conversion_start) >= self._conversion_time)
+
+    def collect_reading(self):
+        """Fetch the result of ``start_reading()`` as a ``BME680Reading``, all four values
+           compensated from the same conversion. Sleeps only for whatever is left of the
+           expected conversion time, then reads the data registers (polling only if the
+           sensor is unexpectedly not done yet). Without a pending reading it starts one, so
+           a single call makes exactly one conversion."""
+        self._collect()
+        return BME680Reading(self._calc_temperature(), self._calc_humidity(),
+                             self._calc_pressure(), self._calc_gas())
+
+    def _collect(self):
+        """Wait for the pending conversion and load its ADC snapshot"""
+        if self._conversion_start is None:
+            self.start_reading()
+        remaining = self._conversion_time - time.ticks_diff(time.ticks_ms(), self._conversion_start)
+        if remaining > 0:
+            time.sleep(remaining / 1000)
+        self._conversion_start = None
+
+        data = self._read(_BME680_REG_MEAS_STATUS, 15)
+        while data[0] & 0x80 == 0:
+            time.sleep(0.005)
+            data = self._read(_BME680_REG_MEAS_STATUS, 15)
+        self._last_reading = time.ticks_ms()
+        self._load_adc(data)
+
+    def _calc_temperature(self):
+        """Compensate the temperature from the last ADC snapshot"""
+        calc_temp = (((self._t_fine * 5) + 128) // 256)
+        return calc_temp / 100
+
+    def _calc_pressure(self):
+        """Compensate the pressure from the last ADC snapshot"""
         var1 = (int(self._t_fine) >> 1) - 64000
         var2 = ((var1 >> 2) * (var1 >> 2 )) >> 11
         var2 = (var2 * self._pressure_calibration[5]) >> 2
@@ -209,11 +308,8 @@ class Adafruit_BME680:
         calc_pres += ((var1 + var2 + var3 + (self._pressure_calibration[6] << 7)) >> 4)
         return calc_pres / 100
 
-    @property
-    def humidity(self):
-        """The relative humidity in RH %"""
-        self._perform_reading()
-
+    def _calc_humidity(self):
+        """Compensate the humidity from the last ADC snapshot"""
         temp_scaled = ((self._t_fine * 5) + 128) >> 8
         var1 = ((self._adc_hum - (self._humidity_calibration[0] * 16)) -
                 (((temp_scaled * self._humidity_calibration[2]) // 100) >> 1))
@@ -234,17 +330,8 @@ class Adafruit_BME680:
             calc_hum = 0
         return calc_hum
 
-    @property
-    def altitude(self):
-        """The altitude based on current ``pressure`` vs the sea level pressure
-           (``sea_level_pressure``) - which you must enter ahead of time)"""
-        pressure = self.pressure # in Si units for hPascal
-        return 44330 * (1.0 - math.pow(pressure / self.sea_level_pressure, 0.1903))
-
-    @property
-    def gas(self):
-        """The gas resistance in ohms"""
-        self._perform_reading()
+    def _calc_gas(self):
+        """Compensate the gas resistance from the last ADC snapshot"""
         var1 = ((1340 + (5 * self._sw_err)) * (_LOOKUP_TABLE_1[self._gas_range])) >> 16
         var2 = ((self._adc_gas << 15) - 16777216) + var1
         var3 = (_LOOKUP_TABLE_2[self._gas_range] * var1) >> 9
@@ -258,26 +345,11 @@ class Adafruit_BME680:
                 < self._min_refresh_time):
             return
 
-        # set filter
-        self._write(_BME680_REG_CONFIG, [self._filter << 2])
-        # turn on temp oversample & pressure oversample
-        self._write(_BME680_REG_CTRL_MEAS,
-                    [(self._temp_oversample << 5)|(self._pressure_oversample << 2)])
-        # turn on humidity oversample
-        self._write(_BME680_REG_CTRL_HUM, [self._humidity_oversample])
-        # gas measurements enabled
-        self._write(_BME680_REG_CTRL_GAS, [_BME680_RUNGAS])
-
-        ctrl = self._read_byte(_BME680_REG_CTRL_MEAS)
-        ctrl = (ctrl & 0xFC) | 0x01  # enable single shot!
-        self._write(_BME680_REG_CTRL_MEAS, [ctrl])
-        new_data = False
-        while not new_data:
-            data = self._read(_BME680_REG_MEAS_STATUS, 15)
-            new_data = data[0] & 0x80 != 0
-            time.sleep(0.005)
-        self._last_reading = time.ticks_ms()
+        self.start_reading()
+        self._collect()
 
+    def _load_adc(self, data):
+        """Parse the 15 bytes read from MEAS_STATUS onwards into the ADC snapshot"""
         self._adc_pres = _read24(data[2:5]) / 16
         self._adc_temp = _read24(data[5:8]) / 16
         self._adc_hum = struct.unpack('>H', bytes(data[8:10]))[0]
@@ -290,6 +362,21 @@ class Adafruit_BME680:
         var3 = (var3 * self._temp_calibration[2] << 4) >> 14
         self._t_fine = int(var2 + var3)
 
+    def _write_config(self):
+        """Write the filter, oversampling and gas control registers in one burst, but only
+           when a setting changed since the last write. Returns the CTRL_MEAS value (sleep mode)
+           so a single shot can be triggered without reading the register back."""
+        ctrl_meas = (self._temp_oversample << 5) | (self._pressure_oversample << 2)
+        settings = (self._filter << 16) | (self._humidity_oversample << 8) | ctrl_meas
+        if settings != self._config_written:
+            # ctrl_hum only takes effect after the following ctrl_meas write
+            self._write_many(((_BME680_REG_CTRL_GAS, _BME680_RUNGAS),
+                              (_BME680_REG_CTRL_HUM, self._humidity_oversample),
+                              (_BME680_REG_CTRL_MEAS, ctrl_meas),
+                              (_BME680_REG_CONFIG, self._filter << 2)))
+            self._config_written = settings
+        return ctrl_meas
+
     def _read_calibration(self):
         """Read & save the calibration coefficients"""
         coeff = self._read(_BME680_BME680_COEFF_ADDR1, 25)
@@ -321,6 +408,11 @@ class Adafruit_BME680:
     def _write(self, register, values):
         raise NotImplementedError()
 
+    def _write_many(self, pairs):
+        """Write a sequence of (register, value) pairs, which need not be contiguous"""
+        for register, value in pairs:
+            self._write(register, [value])
+
 class BME680_I2C(Adafruit_BME680):
     """Driver for I2C connected BME680.
 
@@ -348,9 +440,23 @@ class BME680_I2C(Adafruit_BME680):
         """Writes an array of 'length' bytes to the 'register'"""
         if self._debug:
             print("\t${:x} write".format(register), " ".join(["{:02x}".format(i) for i in values]))
-        for value in values:
-            self._i2c.writeto_mem(self._address, register, bytearray([value & 0xFF]))
-            register += 1
+        # The BME680 does not auto-increment on I2C writes, but takes
+        # (register, value) pairs in a single burst transaction
+        buffer = bytearray(2 * len(values))
+        for i, value in enumerate(values):
+            buffer[2 * i] = (register + i) & 0xFF
+            buffer[2 * i + 1] = value & 0xFF
+        self._i2c.writeto(self._address, buffer)
+
+    def _write_many(self, pairs):
+        """Writes (register, value) pairs in a single burst transaction"""
+        if self._debug:
+            print("\twrite", " ".join(["${:x}={:02x}".format(r, v) for r, v in pairs]))
+        buffer = bytearray(2 * len(pairs))
+        for i, (register, value) in enumerate(pairs):
+            buffer[2 * i] = register & 0xFF
+            buffer[2 * i + 1] = value & 0xFF
+        self._i2c.writeto(self._address, buffer)
 
 
 class BME680_SPI(Adafruit_BME680):
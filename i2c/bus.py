@@ -0,0 +1,98 @@
+from machine import I2C as HardI2C, SoftI2C, Pin
+try:
+    from _thread import allocate_lock
+except ImportError:
+    allocate_lock = None
+
+DEFAULT_SCL = 22
+DEFAULT_SDA = 21
+
+STANDARD_MODE = 100000
+FAST_MODE = 400000
+
+# The ESP32 has two I2C controllers that can be routed to any GPIO pair
+HARDWARE_IDS = (0, 1)
+
+
+class _NoLock:
+
+    def acquire(self, *args):
+        return True
+
+    def release(self):
+        pass
+
+
+class SharedBus:
+    """One I2C bus per (scl, sda) pin pair, shared by every driver on it.
+
+    Uses a hardware controller when one is free and accepts the pins, and
+    falls back to bit-banged SoftI2C otherwise. The bus always runs at the
+    lowest frequency any of its devices asked for, see limit_freq().
+
+    Use ``with bus as i2c:`` around transactions that must not be split,
+    e.g. a command write and the read of its response.
+    """
+
+    def __init__(self, scl: int, sda: int, freq: int, hardware_id: int = None):
+        self.scl = scl
+        self.sda = sda
+        self.freq = freq
+        self.hardware_id = hardware_id
+        self.lock = allocate_lock() if allocate_lock else _NoLock()
+        if hardware_id is None:
+            self.i2c = SoftI2C(scl=Pin(scl), sda=Pin(sda), freq=freq)
+        else:
+            self.i2c = HardI2C(hardware_id, scl=Pin(scl), sda=Pin(sda), freq=freq)
+
+    @property
+    def hardware(self) -> bool:
+        return self.hardware_id is not None
+
+    def limit_freq(self, freq: int) -> None:
+        """Lowers the bus clock to 'freq' if it is currently faster; the
+        underlying object is re-initialised in place, so drivers holding
+        bus.i2c keep working."""
+        if freq < self.freq:
+            self.freq = freq
+            self.i2c.init(scl=Pin(self.scl), sda=Pin(self.sda), freq=freq)
+
+    def __enter__(self):
+        self.lock.acquire()
+        return self.i2c
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+
+
+_buses = {}
+
+
+def get_bus(scl: int = DEFAULT_SCL, sda: int = DEFAULT_SDA, freq: int = FAST_MODE,
+            hardware: bool = True) -> SharedBus:
+    """Returns the shared bus on (scl, sda), creating it on first use.
+
+    :param freq: the fastest clock the calling device supports; the bus is
+        slowed down to it if needed, never sped up.
+    :param hardware: try a hardware controller before falling back to SoftI2C.
+    """
+    bus = _buses.get((scl, sda))
+    if bus is not None:
+        bus.limit_freq(freq)
+        return bus
+
+    if hardware:
+        in_use = [b.hardware_id for b in _buses.values()]
+        for hardware_id in HARDWARE_IDS:
+            if hardware_id in in_use:
+                continue
+            try:
+                bus = SharedBus(scl, sda, freq, hardware_id)
+                break
+            except (ValueError, OSError):
+                continue
+    if bus is None:
+        bus = SharedBus(scl, sda, freq)
+
+    _buses[(scl, sda)] = bus
+    return bus
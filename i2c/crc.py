@@ -0,0 +1,105 @@
+"""CRC-8 used by the Sensirion sensors (SPS30, SCD30).
+
+Every 16-bit word on the bus is followed by a checksum byte, polynomial 0x31
+(x^8 + x^5 + x^4 + 1), initial value 0xFF, no reflection, no final XOR.
+The lookup table is built once at import.
+"""
+
+CRC8_POLYNOMIAL = 0x31
+CRC8_INIT = 0xFF
+
+# Packet size including checksum byte [data1, data2, checksum]
+PACKET_SIZE = 3
+
+
+def _build_table() -> bytes:
+    table = bytearray(256)
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            if crc & 0x80:
+                crc = ((crc << 1) ^ CRC8_POLYNOMIAL) & 0xFF
+            else:
+                crc = (crc << 1) & 0xFF
+        table[i] = crc
+    return bytes(table)
+
+
+CRC8_TABLE = _build_table()
+
+
+class CRCError(ValueError):
+    def __init__(self, offset: int, calculated: int, expected: int):
+        super().__init__("CRC mismatched at byte {}: calculated 0x{:02x}, expected 0x{:02x}".format(
+            offset, calculated, expected))
+        self.offset = offset
+        self.calculated = calculated
+        self.expected = expected
+
+
+def crc8(data, start: int = 0, end: int = None) -> int:
+    """Checksum of data[start:end], without slicing the buffer.
+
+    >>> crc8(b'\\xbe\\xef')
+    146
+    """
+    if end is None:
+        end = len(data)
+    table = CRC8_TABLE
+    crc = CRC8_INIT
+    for i in range(start, end):
+        crc = table[crc ^ data[i]]
+    return crc
+
+
+def verify_words(buf, out=None) -> list:
+    """Checks every [msb, lsb, crc] packet of a response in one pass and
+    returns the decoded 16-bit words.
+
+    :param buf: the raw response, a multiple of PACKET_SIZE bytes long
+    :param out: optional preallocated list/array to fill instead of a new list
+    :raises CRCError: on the first packet whose checksum does not match
+
+    >>> verify_words(b'\\xbe\\xef\\x92\\x00\\x01\\xb0')
+    [48879, 1]
+    """
+    table = CRC8_TABLE
+    nwords = len(buf) // PACKET_SIZE
+    if out is None:
+        out = [0] * nwords
+    for i in range(nwords):
+        offset = i * PACKET_SIZE
+        msb = buf[offset]
+        lsb = buf[offset + 1]
+        crc = table[table[CRC8_INIT ^ msb] ^ lsb]
+        if crc != buf[offset + 2]:
+            raise CRCError(offset, crc, buf[offset + 2])
+        out[i] = (msb << 8) | lsb
+    return out
+
+
+def strip_crc(buf, out=None) -> bytearray:
+    """Checks every [msb, lsb, crc] packet of a response like verify_words,
+    and returns the data bytes with the checksum bytes removed, ready for
+    struct.unpack.
+
+    :param out: optional preallocated bytearray of 2 / 3 * len(buf) bytes
+    :raises CRCError: on the first packet whose checksum does not match
+
+    >>> bytes(strip_crc(b'\\xbe\\xef\\x92\\x00\\x01\\xb0'))
+    b'\\xbe\\xef\\x00\\x01'
+    """
+    table = CRC8_TABLE
+    nwords = len(buf) // PACKET_SIZE
+    if out is None:
+        out = bytearray(2 * nwords)
+    for i in range(nwords):
+        offset = i * PACKET_SIZE
+        msb = buf[offset]
+        lsb = buf[offset + 1]
+        crc = table[table[CRC8_INIT ^ msb] ^ lsb]
+        if crc != buf[offset + 2]:
+            raise CRCError(offset, crc, buf[offset + 2])
+        out[2 * i] = msb
+        out[2 * i + 1] = lsb
+    return out
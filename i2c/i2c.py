@@ -1,16 +1,73 @@
-from machine import SoftI2C, Pin
+from time import sleep
+from i2c.bus import SharedBus, get_bus, STANDARD_MODE
+from i2c.crc import crc8
 
 class I2C:
 
-    def __init__(self, bus: int, address: int = 105):
+    def __init__(self, bus=None, address: int = 105, freq: int = STANDARD_MODE):
+        """'bus' is a SharedBus; anything else (e.g. the legacy bus number)
+        selects the shared bus on the default pins. 'freq' is the fastest
+        clock the device supports (the Sensirion sensors are 100 kHz parts)."""
         self.address = address
-        self.i2c = SoftI2C(scl=Pin(22), sda=Pin(21), freq=100000)
+        if isinstance(bus, SharedBus):
+            bus.limit_freq(freq)
+        else:
+            bus = get_bus(freq=freq)
+        self.bus = bus
+        self.i2c = bus.i2c
+        # Per-device scratch buffers, one per response length, reused by read_scratch()
+        self._scratch = {}
+        # [command msb, command lsb, argument msb, argument lsb, crc]
+        self._command = bytearray(5)
 
-    def write(self, data: list):
-        self.i2c.writeto(self.address, bytearray(data))
+    def write(self, data):
+        """Writes a command. bytes/bytearray/memoryview are sent as they are,
+        a list is still accepted but costs a copy."""
+        if isinstance(data, list):
+            data = bytearray(data)
+        self.i2c.writeto(self.address, data)
+
+    def write_word(self, command: bytes, word: int):
+        """Writes a 16-bit command followed by a CRC-protected 16-bit argument,
+        using the preallocated command buffer."""
+        buf = self._command
+        buf[0] = command[0]
+        buf[1] = command[1]
+        buf[2] = (word >> 8) & 0xFF
+        buf[3] = word & 0xFF
+        buf[4] = crc8(buf, 2, 4)
+        self.i2c.writeto(self.address, buf)
+
+    def query(self, command: bytes, nbytes: int, delay_ms: int = 0) -> bytearray:
+        """Writes 'command' and reads the 'nbytes' response into the scratch
+        buffer, holding the bus lock so no other device can get in between."""
+        with self.bus as i2c:
+            i2c.writeto(self.address, command)
+            if delay_ms:
+                sleep(delay_ms / 1000)
+            buf = self.scratch(nbytes)
+            i2c.readfrom_into(self.address, buf)
+        return buf
 
     def read(self, nbytes: int) -> list:
         return list(self.i2c.readfrom(self.address, nbytes))
 
+    def readinto(self, buf):
+        """Reads len(buf) bytes into a bytearray or memoryview and returns it."""
+        self.i2c.readfrom_into(self.address, buf)
+        return buf
+
+    def scratch(self, nbytes: int) -> bytearray:
+        """Returns this device's scratch buffer of 'nbytes', created on first use."""
+        buf = self._scratch.get(nbytes)
+        if buf is None:
+            buf = self._scratch[nbytes] = bytearray(nbytes)
+        return buf
+
+    def read_scratch(self, nbytes: int) -> bytearray:
+        """Reads 'nbytes' into the scratch buffer of that size and returns it.
+        The contents are only valid until the next read of the same length."""
+        return self.readinto(self.scratch(nbytes))
+
     def close(self):
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,89 @@
+"""Data-ready prediction for the periodically measuring Sensirion sensors.
+
+The SPS30 and SCD30 produce a new sample every measurement interval. Knowing
+when the last sample was read, the driver only asks the sensor for its
+data-ready flag once the next sample is due, and never sleeps a fixed period
+waiting for it.
+"""
+
+try:
+    from collections import namedtuple
+except ImportError:
+    from ucollections import namedtuple
+
+from ticks import ticks_ms, ticks_diff, ticks_add
+
+# Delay before asking again when the flag is not set although a sample was due
+RETRY_MS = 50
+
+
+Sample = namedtuple('Sample', ('value', 'age_ms', 'stale'))
+"""A measurement, how many milliseconds ago it was read (None if never) and
+whether it is older than the staleness limit."""
+
+
+class DataReady:
+    """Tracks the last sample of a sensor measuring every 'interval_ms'.
+
+    A sample is stale once it is older than 'stale_ms', two intervals by
+    default, i.e. at least one new sample was missed.
+
+    >>> ready = DataReady(1000)
+    >>> ready.due(0), ready.sample(0)
+    (True, Sample(value=None, age_ms=None, stale=True))
+    >>> ready.update({'co2': 400}, 100)
+    >>> ready.due(600), ready.remaining_ms(600)
+    (False, 500)
+    >>> ready.sample(600)
+    Sample(value={'co2': 400}, age_ms=500, stale=False)
+    >>> ready.miss(1100)
+    >>> ready.remaining_ms(1100)
+    50
+    >>> ready.sample(2200).stale
+    True
+    """
+
+    def __init__(self, interval_ms: int, stale_ms: int = None):
+        self.value = None
+        self.ticks = None
+        self.next_ticks = None
+        self.set_interval(interval_ms, stale_ms)
+
+    def set_interval(self, interval_ms: int, stale_ms: int = None) -> None:
+        self.interval_ms = interval_ms
+        self.stale_ms = stale_ms if stale_ms is not None else 2 * interval_ms
+        if self.ticks is not None:
+            self.next_ticks = ticks_add(self.ticks, interval_ms)
+
+    def remaining_ms(self, now: int = None) -> int:
+        """Milliseconds until the next sample is expected, 0 if it is due."""
+        if self.next_ticks is None:
+            return 0
+        if now is None:
+            now = ticks_ms()
+        return max(0, ticks_diff(self.next_ticks, now))
+
+    def due(self, now: int = None) -> bool:
+        return self.remaining_ms(now) == 0
+
+    def update(self, value, now: int = None) -> None:
+        """Records a sample read at 'now'."""
+        if now is None:
+            now = ticks_ms()
+        self.value = value
+        self.ticks = now
+        self.next_ticks = ticks_add(now, self.interval_ms)
+
+    def miss(self, now: int = None) -> None:
+        """The sample was due but the flag was not set yet: ask again shortly."""
+        if now is None:
+            now = ticks_ms()
+        self.next_ticks = ticks_add(now, RETRY_MS)
+
+    def sample(self, now: int = None) -> Sample:
+        if self.ticks is None:
+            return Sample(None, None, True)
+        if now is None:
+            now = ticks_ms()
+        age = ticks_diff(now, self.ticks)
+        return Sample(self.value, age, age > self.stale_ms)
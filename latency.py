@@ -0,0 +1,80 @@
+"""Latency histograms of the stages of the publish loop.
+
+Every stage counts its durations, measured with ticks_us(), in fixed buckets
+with upper bounds BOUNDS_US plus one for anything slower, and keeps its
+longest duration. All counters live in arrays allocated up front, so timing a
+stage allocates nothing. The firmware keeps None instead of a Histograms
+when timing is not configured and tests for it before every measurement.
+
+>>> histograms = Histograms()
+>>> histograms.add(SPS30, 250)
+>>> histograms.add(SPS30, 2500)
+>>> histograms.add(SPS30, 7000000)
+>>> histograms.count[SPS30], histograms.max_us[SPS30]
+(3, 7000000)
+>>> histograms.buckets(SPS30)
+[0, 1, 0, 1, 0, 0, 0, 0, 0, 0, 1]
+"""
+from array import array
+
+from ticks import ticks_us, ticks_diff
+
+STAGES = ('sps30', 'scd30', 'gps', 'bme680', 'encode', 'publish', 'gc', 'cycle')
+SPS30, SCD30, GPS, BME680, ENCODE, PUBLISH, GC, CYCLE = range(len(STAGES))
+
+BOUNDS_US = (100, 300, 1000, 3000, 10000, 30000, 100000, 300000, 1000000, 3000000)
+BUCKETS = len(BOUNDS_US) + 1
+
+
+class Histograms:
+
+    def __init__(self, interval: int = 600):
+        self.interval = interval # s between two diagnostics messages
+        self.since = None # timestamp of the first measurement after clear()
+        self.__counts = array('I', [0] * (len(STAGES) * BUCKETS))
+        self.count = array('I', [0] * len(STAGES))
+        self.max_us = array('I', [0] * len(STAGES))
+        self.cycle_start = 0
+
+    def start(self) -> int:
+        return ticks_us()
+
+    def stop(self, stage: int, start: int) -> int:
+        """Accounts the time since 'start' to 'stage' and returns the end,
+        the start of the next stage."""
+        now = ticks_us()
+        self.add(stage, ticks_diff(now, start))
+        return now
+
+    def begin(self) -> int:
+        """Starts a cycle, and its first stage."""
+        self.cycle_start = ticks_us()
+        return self.cycle_start
+
+    def end(self) -> None:
+        self.stop(CYCLE, self.cycle_start)
+
+    def add(self, stage: int, us: int) -> None:
+        bucket = 0
+        for bound in BOUNDS_US:
+            if us < bound:
+                break
+            bucket += 1
+        self.__counts[stage * BUCKETS + bucket] += 1
+        self.count[stage] += 1
+        if us > self.max_us[stage]:
+            self.max_us[stage] = us
+
+    def buckets(self, stage: int) -> list:
+        return list(self.__counts[stage * BUCKETS:(stage + 1) * BUCKETS])
+
+    def due(self, now: int) -> bool:
+        if self.since is None:
+            self.since = now
+        return now - self.since >= self.interval
+
+    def clear(self, now: int = None) -> None:
+        self.since = now
+        for counters in (self.__counts, self.count, self.max_us):
+            for i in range(len(counters)):
+                counters[i] = 0
@@ -21,8 +21,10 @@ from third_party import string
 import utime
 from umqtt.simple import MQTTClient
 from third_party import rsa
+from token_manager import TokenManager
+from recovery import Recovery, Tier
 from ubinascii import b2a_base64
-from machine import RTC, Pin, SoftI2C, UART, WDT
+from machine import RTC, Pin, UART, WDT
 import ntptime
 import json
 import config
@@ -47,6 +49,7 @@ class AirPoll:
         self.MODEM_RST_PIN = Pin(5, Pin.OUT)
         self.MODEM_POWER_ON_PIN = Pin(23, Pin.OUT)
         self.CONNECT_ATTEMPTS = 20
+        self.GPS_RXBUF = 2048 # bytes, about 2 s of a receiver sending at the full 9600 baud
         self.rtc = RTC()
         self.NTP_DELTA = 3155673600
         
@@ -58,6 +61,43 @@ class AirPoll:
         # The NTP host can be configured at runtime by doing: ntptime.host = 'myhost.org'
         self.host = "pool.ntp.org"
         self.mqtt_topic = '/devices/{}/{}'.format(self.device_id, 'events')
+        self.diagnostics_topic = self.mqtt_topic + '/diagnostics'
+        self.token = TokenManager(self.sign_jwt, config.jwt_config['token_ttl'])
+        self.device_config = getattr(config, 'device_config', {})
+        self.PUBLISH_INTERVAL = self.device_config.get('publish_interval', 7)
+        self.payload_format = self.device_config.get('payload', 'json') # 'json' or 'binary'
+        self.batch = None
+        if 'batch' in self.device_config: # e.g. {'max_count': 10, 'max_age': 300, 'max_bytes': 4096}
+            from batch import Batch
+            self.batch = Batch(binary=self.payload_format == 'binary', **self.device_config['batch'])
+        self.spool = None
+        if 'spool' in self.device_config: # e.g. {'path': '/spool', 'record_size': 1024, 'segment_records': 32, 'max_segments': 8}
+            from spool import SegmentLog
+            self.spool = SegmentLog(**self.device_config['spool'])
+        self.SPOOL_DRAIN = self.device_config.get('spool_drain', 4) # spooled samples sent per publish
+        self.aggregator = None
+        if 'aggregate' in self.device_config: # e.g. {'windows': [60, 300]}, publishes window summaries instead of samples
+            from aggregate import Aggregator
+            self.aggregator = Aggregator(**self.device_config['aggregate'])
+        self.report_policy = None
+        if 'report' in self.device_config: # e.g. {'heartbeat': 600, 'thresholds': {'pm2.5': [35]}}, raw samples only
+            from reporting import ReportPolicy
+            self.report_policy = ReportPolicy(**self.device_config['report'])
+        self.urgent = False # a sample crossed a threshold, flush the batch with it
+        self.latency = None
+        if 'latency' in self.device_config: # e.g. {'interval': 600}, s between diagnostics messages
+            from latency import Histograms
+            self.latency = Histograms(**self.device_config['latency'])
+        self.heap = None
+        if 'memory' in self.device_config: # e.g. {'interval': 600}, s between heap telemetry messages
+            from memory import HeapMonitor
+            self.heap = HeapMonitor(**self.device_config['memory'])
+        self.APN = self.device_config.get('apn', 'uinternet')
+        self.recovery = Recovery((
+            Tier('mqtt', self.reconnect_mqtt, attempts=3, backoff=1, max_backoff=8),
+            Tier('ppp', self.reconnect_ppp, attempts=2, backoff=5, max_backoff=20),
+            Tier('reset', self.reset),
+        ), sleep=self.idle)
         gc.enable() #enable garbage automatic coolector
     
     def ppp_connect(self):
@@ -92,17 +132,20 @@ class AirPoll:
     def b42_urlsafe_encode(self, payload):
         return string.translate(b2a_base64(payload)[:-1].decode('utf-8'),{ ord('+'):'-', ord('/'):'_' })
 
-    def create_jwt(self, project_id, private_key, algorithm, token_ttl):
+    def create_jwt(self, project_id, private_key, algorithm, token_ttl, issued_at=None):
         print("Creating JWT...")
-        private_key = rsa.PrivateKey(*private_key)
+        if not isinstance(private_key, rsa.PrivateKey):
+            private_key = rsa.PrivateKey(*private_key)
+        if issued_at is None:
+            issued_at = utime.time()
 
         # Epoch_offset is needed because micropython epoch is 2000-1-1 and unix is 1970-1-1. Adding 946684800 (30 years)
         epoch_offset = 946684800
         claims = {
                 # The time that the token was issued at
-                'iat': utime.time() + epoch_offset,
+                'iat': issued_at + epoch_offset,
                 # The time the token expires.
-                'exp': utime.time() + epoch_offset + token_ttl,
+                'exp': issued_at + epoch_offset + token_ttl,
                 # The audience field should always be set to the GCP project id.
                 'aud': project_id
         }
@@ -114,6 +157,17 @@ class AirPoll:
         signature = self.b42_urlsafe_encode(rsa.sign(content,private_key,'SHA-256'))
         return content + '.' + signature #signed JWT
 
+    def get_private_key(self):
+        """Builds the signing key once and keeps it, together with its pool of
+        precomputed blinding pairs, for every later token renewal."""
+        if not hasattr(self, 'private_key'):
+            self.private_key = rsa.PrivateKey(*config.jwt_config['private_key'])
+            self.private_key.blinding = rsa.BlindingPool(self.private_key)
+        return self.private_key
+
+    def sign_jwt(self, issued_at):
+        return self.create_jwt(self.project_id, self.get_private_key(), config.jwt_config['algorithm'], config.jwt_config['token_ttl'], issued_at)
+
     def get_mqtt_client(self, project_id, cloud_region, registry_id, device_id, jwt):
         """Create our MQTT client. The client_id is a unique string that identifies
         this device. For Google Cloud IoT Core, it must be in the format below."""
@@ -122,22 +176,28 @@ class AirPoll:
         client = MQTTClient(client_id.encode('utf-8'),server=config.google_cloud_config['mqtt_bridge_hostname'],port=config.google_cloud_config['mqtt_bridge_port'],user=b'ignored',password=jwt.encode('utf-8'),ssl=True)
         client.set_callback(self.on_message)
         client.connect()
-        client.subscribe('/devices/{}/config'.format(device_id), 1)
-        client.subscribe('/devices/{}/commands/#'.format(device_id), 1)
+        self.subscribe_topics(client)
         return client
 
-    def receive(self):
-        x = self.uart.read()
-        if x is not None:
-            print('Received: {}\n'.format(x))
-        return x
+    def subscribe_topics(self, client):
+        client.subscribe('/devices/{}/config'.format(self.device_id), 1)
+        client.subscribe('/devices/{}/commands/#'.format(self.device_id), 1)
 
-    def send(self, data):
-        print('Send: {}'.format(data))
-        self.uart.write(data)
-        time.sleep(0.3)
+    def renew_token(self):
+        """Re-signs the JWT ahead of its expiry and reconnects the MQTT client in place,
+        so the broker never drops us for an expired password."""
+        jwt = self.token.refresh()
+        try:
+            self.client.disconnect()
+        except OSError:
+            pass # the broker may already have closed the socket
+        self.client.pswd = jwt.encode('utf-8')
+        self.client.connect()
+        self.subscribe_topics(self.client)
+        print("token renewed, expires in {} s".format(self.token.remaining()))
 
     def modem_connect(self):
+        from at import ATEngine, ATError, ppp_bringup
         self.ppp_connect()
         #if MODEM_PWKEY_PIN:
         self.MODEM_PWKEY_PIN.value(0)
@@ -146,77 +206,82 @@ class AirPoll:
         self.MODEM_RST_PIN.value(0)
         #if MODEM_POWER_ON_PIN:
         self.MODEM_POWER_ON_PIN.value(1)
-        pp = 0
-        pp_2 = 0
+        self.modem = ATEngine(self.uart, sleep=self.idle)
         while True:
-            if pp == 0:
-                self.send('AT')
-                x = self.receive()
-                if x is not None:
-                    if 'AT' in x:
-                        pp += 1
-                        pp_2 = 0
-            elif pp == 1:
-                cmds = ['ATE0', 'ATI\r\n', 'AT+CPIN?\r\n', 'AT+CREG=0\r\n', 'AT+CGREG=0\r\n']
-                self.send(cmds[pp_2])
-                x = self.receive()
-                if x is not None:
-                    pp_2 += 1
-                if pp_2 == len(cmds):
-                    pp += 1
-                    pp_2 = 0
-            elif pp == 2:
-                self.send("AT+CREG?\r\n")
-                x = self.receive()
-                if x is not None:
-                    if ('+CREG: 0,5' in x) or ('+CREG: 0,1' in x):
-                        pp += 1
-                        pp_2 = 0
-            elif pp == 3:
-                self.send("AT+CGREG?\r\n")
-                x = self.receive()
-                if x is not None:
-                    if ('+CGREG: 0,5' in x) or ('+CGREG: 0,1' in x):
-                        pp += 1
-                        pp_2 = 0
-            elif pp == 4:
-                cmds = [
-                        'AT+COPS?\r\n', 'AT+CSQ\r\n',
-                        #'AT+CNMI=0,0,0,0,0\r\n',
-                        'AT+QICSGP=1,1,\"uinternet\",\"\",\"\",0\r\n', #'AT+CGDATA=?\r\n',
-                        #'AT+CGDATA="PPP",1',
-                        'ATD*99#\r\n'
-                        ]
-                self.send(cmds[pp_2])
-                x = self.receive()
-                if x is not None:
-                    pp_2 += 1
-                if pp_2 == len(cmds):
-                    pp += 1
-                    pp_2 = 0
-            elif pp == 5:
-                print('Start PPP')
-                self.ppp.active(True)
-                self.ppp.connect()
-                i = 0
-                while i < 30:
-                    time.sleep(1)
-                    i += 1
-                    if self.ppp.isconnected():
-                        print(self.ppp.ifconfig())
-                        pp += 1
-                        break
-            elif pp == 6:
-                pp += 1
-            elif pp == 7:
-                print('bye bye')
-                return
-
-    def subscribe(self):
+            try:
+                # Each command returns as soon as its final result code arrives
+                self.modem.run(ppp_bringup(self.APN))
+                break
+            except ATError as e:
+                print("modem bring-up error:")
+                print(str(e))
+                time.sleep(1)
+        while not self.ppp_up():
+            pass
+
+    def ppp_up(self, timeout=30):
+        """Starts PPP over the dialled modem and waits for it to connect"""
+        print('Start PPP')
+        self.ppp.active(True)
+        self.ppp.connect()
+        start = utime.ticks_ms()
+        while utime.ticks_diff(utime.ticks_ms(), start) < timeout * 1000:
+            if self.ppp.isconnected():
+                print(self.ppp.ifconfig())
+                return True
+            self.idle(0.1)
+        return False
+
+    def idle(self, seconds):
+        """Sleeps, feeding the watchdog once it is running"""
+        wdt = getattr(self, 'wdt', None)
+        while seconds > 0:
+            if wdt is not None:
+                wdt.feed()
+            time.sleep(min(1, seconds))
+            seconds -= 1
+
+    def reconnect_mqtt(self):
+        """Recovery tier 1: reconnects the MQTT client over the current PPP session"""
+        if not self.ppp.isconnected():
+            raise OSError("PPP is down")
+        client = getattr(self, 'client', None)
+        if client is None:
+            self.client = self.get_mqtt_client(self.project_id, self.cloud_region, self.registry_id, self.device_id, self.token.get())
+            return
+        try:
+            client.disconnect()
+        except OSError:
+            pass # the socket is most likely gone already
+        client.pswd = self.token.get().encode('utf-8')
+        client.connect()
+        self.subscribe_topics(client)
+
+    def reconnect_ppp(self):
+        """Recovery tier 2: dials PPP again without power-cycling the modem"""
+        from at import ppp_redial
+        self.ppp.active(False) # closing the session takes the modem out of data mode
+        self.idle(1)
+        self.modem.run(ppp_redial(self.APN))
+        if not self.ppp_up():
+            raise OSError("PPP did not come up")
+        self.reconnect_mqtt()
+
+    def reset(self):
+        """Recovery tier 3: the cold path, modem, NTP and JWT from scratch"""
+        import machine
+        machine.reset()
+
+    def recover(self, first=None):
+        tier = self.recovery.recover(first)
+        print("recovered by {}, (tried, recovered) {}".format(tier, self.recovery.counters()))
+
+    def subscribe(self, sync_time=True):
         print("ppp status:" + str(self.ppp.isconnected()))
-        self.settime()
+        if sync_time: # the RTC keeps running through deep sleep
+            self.settime()
         print("time:" + str(self.rtc.datetime()))
-        jwt = self.create_jwt(config.google_cloud_config['project_id'], config.jwt_config['private_key'], config.jwt_config['algorithm'], config.jwt_config['token_ttl'])
+        jwt = self.token.get()
 
         connect_attempts = self.CONNECT_ATTEMPTS
         while connect_attempts != 0:
@@ -234,24 +299,28 @@ class AirPoll:
                 connect_attempts -= 1
                 if connect_attempts == 0:
                     gc.collect()
-                    import machine
-                    machine.reset()
+                    self.recover('ppp')
                     
     def timestamp(self):
         return utime.time()+946728000 #Convert J2000 time to epoch
     
-    def sensors_init(self):
+    def sensors_init(self, configure=True):
         from scd30 import SCD30
         from sps30 import SPS30
         from bme680 import BME680_I2C
+        from i2c.bus import get_bus, FAST_MODE
+        from nmea import NMEAParser
         self.boot_time = self.timestamp() #Convert J2000 time to epoch
-        self.bme680 = BME680_I2C(SoftI2C(scl=Pin(22), sda=Pin(21), freq=100000))
-        self.co2_sensor = SCD30()
-        self.pm_sensor = SPS30()
-        self.co2_sensor.start_measurement()
-        self.pm_sensor.start_measurement()
-        self.gps_uart = UART(2, 9600)
-        self.gps_uart.init(9600, tx=12, rx=14)
+        self.i2c_bus = get_bus(freq=FAST_MODE) # one bus object shared by all sensors on pins 22/21
+        self.bme680 = BME680_I2C(self.i2c_bus.i2c)
+        self.co2_sensor = SCD30(self.i2c_bus)
+        self.pm_sensor = SPS30(self.i2c_bus)
+        if configure: # not needed after deep sleep, the sensors kept their settings
+            self.co2_sensor.start_measurement()
+            self.pm_sensor.start_measurement()
+        self.gps_uart = UART(2, 9600, rxbuf=self.GPS_RXBUF)
+        self.gps_uart.init(9600, tx=12, rx=14, rxbuf=self.GPS_RXBUF)
+        self.gps = NMEAParser()
                  
     def compose_message(self):
         """from scd30 import SCD30
@@ -265,7 +334,40 @@ class AirPoll:
         self.pm_sensor.start_measurement()
         self.gps_uart = UART(2, 9600)
         self.gps_uart.init(9600, tx=12, rx=14)"""
-        message = '{{"device_id":{0},"boot_time":{1},"timestamp":{2},"esp32_temp":{3},"esp32_gc_free_mem":0,"sps30_data":{4},"scd30_data":{5},"gps_data":{6},"bme680":{{"bme680_temperature":{7},"bme680_humidity":{8},"bme680_pressure":{9},"bme680_gas":{10}}}}}'.format(self.device_id,self.boot_time,self.timestamp(),esp32.raw_temperature(),self.pm_sensor.get_measurement(),self.co2_sensor.read_measurement(),self.gps_uart.read(),self.bme680.temperature,self.bme680.humidity,self.bme680.pressure,self.bme680.gas)
+        latency, heap = self.latency, self.heap
+        if latency or heap:
+            from latency import SPS30, SCD30, GPS, BME680, ENCODE
+        if latency:
+            t = latency.begin()
+        if heap:
+            m = heap.begin()
+        # The BME680 converts (heater included) while the other sensors are read
+        self.bme680.start_reading()
+        sps30_data = self.pm_sensor.get_measurement()
+        if latency:
+            t = latency.stop(SPS30, t)
+        if heap:
+            m = heap.stop(SPS30, m)
+        scd30_data = self.co2_sensor.get_measurement()
+        if latency:
+            t = latency.stop(SCD30, t)
+        if heap:
+            m = heap.stop(SCD30, m)
+        gps_data = self.gps.update(self.gps_uart) # latest fix, not the raw sentences
+        if latency:
+            t = latency.stop(GPS, t)
+        if heap:
+            m = heap.stop(GPS, m)
+        bme680 = self.bme680.collect_reading()
+        if latency:
+            t = latency.stop(BME680, t)
+        if heap:
+            m = heap.stop(BME680, m)
+        message = self.make_message(sps30_data, scd30_data, gps_data, bme680)
+        if latency:
+            latency.stop(ENCODE, t)
+        if heap:
+            heap.stop(ENCODE, m)
             
         """del self.co2_sensor
         del self.pm_sensor
@@ -276,46 +378,373 @@ class AirPoll:
         del BME680_I2C"""
         return message
     
+    def make_message(self, sps30_data, scd30_data, gps_data, bme680):
+        """Returns the payload of a sample, None when the report policy
+        suppresses it, or with aggregation configured the summaries of the
+        windows the sample closed, None while none closed"""
+        if self.aggregator is None:
+            if self.report_policy is not None:
+                from reporting import SUPPRESS, HEARTBEAT, CROSSING
+                decision = self.report_policy.check(self.timestamp(), sps30_data, scd30_data, bme680)
+                if decision == SUPPRESS:
+                    return None
+                if decision == HEARTBEAT:
+                    print("report policy: {}".format(self.report_policy.counters()))
+                self.urgent = decision == CROSSING
+            return self.encode_message(sps30_data, scd30_data, gps_data, bme680)
+        summaries = self.aggregator.add(self.timestamp(), sps30_data, scd30_data, bme680)
+        if not summaries:
+            return None
+        return self.encode_summary(summaries)
+
+    def format_message(self, sps30_data, scd30_data, gps_data, bme680):
+        if gps_data is not None:
+            gps_data = '{{"latitude":{},"longitude":{},"altitude":{},"time":{},"hdop":{}}}'.format(*gps_data)
+        message = '{{"device_id":{0},"boot_time":{1},"timestamp":{2},"esp32_temp":{3},"esp32_gc_free_mem":0,"sps30_data":{4},"scd30_data":{5},"gps_data":{6},"bme680":{{"bme680_temperature":{7},"bme680_humidity":{8},"bme680_pressure":{9},"bme680_gas":{10}}}}}'.format(self.device_id,self.boot_time,self.timestamp(),esp32.raw_temperature(),sps30_data,scd30_data,gps_data,bme680.temperature,bme680.humidity,bme680.pressure,bme680.gas)
+        return message
+
+    def encode_message(self, sps30_data, scd30_data, gps_data, bme680):
+        """Returns the payload bytes in the format configured for this device"""
+        if self.payload_format == 'binary':
+            import payload
+            return payload.encode(self.boot_time, self.timestamp(), esp32.raw_temperature(), sps30_data, scd30_data, gps_data, bme680)
+        return self.format_message(sps30_data, scd30_data, gps_data, bme680).encode('utf-8')
+
+    def format_summary(self, summaries):
+        from aggregate import CHANNELS
+        windows = []
+        for summary in summaries:
+            stats = {}
+            for channel, values in zip(CHANNELS, summary.stats):
+                if values is not None:
+                    stats[channel] = dict(zip(('count', 'min', 'max', 'mean', 'variance'), values))
+            windows.append({"window": summary.window, "start": summary.start, "samples": summary.samples, "stats": stats})
+        return json.dumps({"device_id": self.device_id, "boot_time": self.boot_time, "timestamp": self.timestamp(), "summaries": windows})
+
+    def encode_summary(self, summaries):
+        """Returns the window summaries in the format configured for this device"""
+        if self.payload_format == 'binary':
+            import payload
+            return payload.encode_summary(self.boot_time, self.timestamp(), summaries)
+        return self.format_summary(summaries).encode('utf-8')
+
+    def publish_message(self, msg, flush=True):
+        """Publishes the message, or queues it when batching is configured.
+        With 'flush' False a due batch is left for the caller to flush, so
+        the message is queued once this returns."""
+        latency, heap = self.latency, self.heap
+        if latency:
+            t = latency.start()
+        if heap:
+            m = heap.start()
+        if self.batch is None:
+            self.client.publish(self.mqtt_topic.encode('utf-8'), msg)
+        else:
+            now = self.timestamp()
+            taken = now # a JSON message carries its own timestamp, the batch only ages it
+            if self.payload_format == 'binary':
+                import payload
+                taken = payload.timestamp_of(msg) or now # a spooled sample keeps the time it was taken at
+            if not self.batch.fits(taken, msg):
+                self.flush_batch()
+            self.batch.add(taken, msg)
+            if flush and (self.urgent or self.batch.due(now)):
+                self.flush_batch()
+        if latency or heap:
+            from latency import PUBLISH
+        if latency:
+            latency.stop(PUBLISH, t)
+        if heap:
+            heap.stop(PUBLISH, m)
+
+    def publish_latency(self):
+        """Publishes the latency histograms on the diagnostics subtopic and starts over"""
+        now = self.timestamp()
+        if self.payload_format == 'binary':
+            import payload
+            msg = payload.encode_latency(self.latency.since, now, self.latency)
+        else:
+            from latency import STAGES
+            stages = {}
+            for stage, name in enumerate(STAGES):
+                stages[name] = {"count": self.latency.count[stage], "max_us": self.latency.max_us[stage], "buckets": self.latency.buckets(stage)}
+            msg = json.dumps({"device_id": self.device_id, "since": self.latency.since, "timestamp": now, "stages": stages})
+        self.client.publish(self.diagnostics_topic.encode('utf-8'), msg)
+        self.latency.clear(now)
+
+    def publish_memory(self):
+        """Publishes the heap telemetry on the diagnostics subtopic and starts over"""
+        heap = self.heap
+        now = self.timestamp()
+        if self.payload_format == 'binary':
+            import payload
+            msg = payload.encode_memory(heap.since, now, heap)
+        else:
+            from latency import STAGES
+            stages = {}
+            for stage, name in enumerate(STAGES):
+                stages[name] = {"count": heap.count[stage], "allocated": heap.allocated[stage], "max_bytes": heap.max_bytes[stage], "collected": heap.collected[stage]}
+            msg = json.dumps({"device_id": self.device_id, "since": heap.since, "timestamp": now, "min_free": heap.min_free, "min_largest_free_block": heap.min_largest, "stages": stages})
+        self.client.publish(self.diagnostics_topic.encode('utf-8'), msg)
+        heap.clear(now)
+
+    def flush_batch(self):
+        """Publishes the queued samples as one message, they stay queued if it fails"""
+        if len(self.batch):
+            self.client.publish(self.mqtt_topic.encode('utf-8'), self.batch.pack())
+            self.batch.clear()
+        self.urgent = False
+
+    def publish_spooled(self, msg):
+        """Forwards a spooled sample. The spool consumes the record once this
+        returns, so a batch is not flushed here: a failure after the record
+        was queued would leave it both in the batch and at the spool cursor,
+        and spool_message() would store it twice."""
+        self.publish_message(msg, flush=False)
+
+    def spool_message(self, msg):
+        """Keeps the samples that could not be published on flash, they survive
+        a reset and are sent once the link is back"""
+        if self.spool is None:
+            return
+        try:
+            queued = self.batch.queued() if self.batch is not None else []
+            for payload in queued:
+                self.spool.append(payload)
+            if msg is not None and not any(payload is msg for payload in queued):
+                self.spool.append(msg)
+            if self.batch is not None:
+                self.batch.clear()
+        except Exception as e:
+            print("spool error:")
+            print(str(e))
+
+    def after_publish(self):
+        """Idle work done between two publishes"""
+        self.wdt.feed()
+        if self.spool is not None and len(self.spool):
+            # The link is up, forward a few spooled samples per publish
+            self.spool.drain(self.publish_spooled, self.SPOOL_DRAIN)
+            if self.batch is not None and self.batch.due(self.timestamp()):
+                self.flush_batch()
+            self.wdt.feed()
+        latency, heap = self.latency, self.heap
+        if latency or heap:
+            from latency import GC
+        if latency:
+            t = latency.start()
+        if heap:
+            m = heap.start()
+        gc.collect()
+        if latency:
+            latency.stop(GC, t)
+        if heap:
+            heap.stop(GC, m)
+        print('2',gc.mem_free())
+        if self.token.due():
+            # Renew in the idle gap between publishes, before the broker drops us
+            self.renew_token()
+            self.wdt.feed()
+        elif len(self.private_key.blinding) < self.private_key.blinding.size:
+            # Top up the blinding pool one pair per idle gap
+            self.private_key.blinding.fill(1)
+        if latency:
+            latency.end()
+            if latency.due(self.timestamp()):
+                self.publish_latency()
+        if heap:
+            heap.end()
+            if heap.due(self.timestamp()):
+                self.publish_memory()
+
     def publish_sensors_data(self):
         self.wdt = WDT(timeout=20000)  # enable it with a timeout of 2s    
+        self.publish_errors = 0
         gc.collect()
-        num_of_times = 0
         while True:
-            try:
-                
-                #gc.collect()
-                print('1',gc.mem_free())
-                msg = self.compose_message()
+            self.publish_cycle()
+
+    def publish_cycle(self):
+        """One iteration of publish_sensors_data(): composes and publishes a
+        sample, does the idle work and waits for the next publish. A failure
+        spools the sample; the first one waits for resources to be released,
+        a second consecutive one recovers the connection"""
+        msg = None
+        try:
+            
+            #gc.collect()
+            print('1',gc.mem_free())
+            msg = self.compose_message()
+            if msg is not None: # None while the aggregation windows are open
                 print(msg)
-                self.client.publish(self.mqtt_topic.encode('utf-8'), msg.encode('utf-8'))
-                #print('2',gc.mem_free())
-                #print("message published")
-                #gc.collect()
-                #print("message published gc.collect() ")
-                
-                #print("message published wdt.feed() ")
-                #print('3',gc.mem_free())
-                self.wdt.feed()
-                gc.collect()
-                print('2',gc.mem_free())
-                time.sleep(7)
-                num_of_times = 0
+                self.publish_message(msg)
+            msg = None # Published, not to be spooled if the idle work fails
+            #print('2',gc.mem_free())
+            #print("message published")
+            #gc.collect()
+            #print("message published gc.collect() ")
+            
+            #print("message published wdt.feed() ")
+            #print('3',gc.mem_free())
+            self.after_publish()
+            self.wait(self.PUBLISH_INTERVAL)
+            self.publish_errors = 0
+        except Exception as e:
+            gc.mem_free()
+            gc.collect()
+            print("message publish error:")
+            print(str(e))
+            self.spool_message(msg)
+            
+            if self.publish_errors == 0:#For first Exception wait for resources to be released and try again
+                self.publish_errors += 1
+                self.idle(12)
+            else:
+                self.recover()
+                self.publish_errors = 0
+
+    def wait(self, seconds):
+        """Sleeps until the next publish, feeding the GPS parser every second
+        so the UART receive buffer never overruns between two publishes, and
+        the watchdog, so an interval longer than its timeout is no reset"""
+        while seconds > 0:
+            self.wdt.feed()
+            self.gps.update(self.gps_uart)
+            time.sleep(min(1, seconds))
+            seconds -= 1
+
+    def publish_snapshot(self, snapshot):
+        """Publishes the latest value of every sensor, called by the scheduler"""
+        sps30, scd30 = snapshot['sps30'], snapshot['scd30']
+        if sps30.value is None or scd30.value is None:
+            return #No sample yet
+        for name, sample in (('sps30', sps30), ('scd30', scd30)):
+            if sample.stale:
+                print("{} sample is stale, {} ms old".format(name, sample.age_ms))
+        msg = None
+        try:
+            print('1',gc.mem_free())
+            latency, heap = self.latency, self.heap
+            if latency or heap:
+                from latency import ENCODE
+            if latency:
+                t = latency.begin()
+            if heap:
+                m = heap.begin()
+            msg = self.make_message(sps30.value, scd30.value, snapshot['gps'], snapshot['bme680'])
+            if latency:
+                latency.stop(ENCODE, t)
+            if heap:
+                heap.stop(ENCODE, m)
+            if msg is not None:
+                print(msg)
+                self.publish_message(msg)
+            msg = None # Published, not to be spooled if the idle work fails
+            self.after_publish()
+            self.publish_errors = 0
+        except Exception as e:
+            gc.collect()
+            print("message publish error:")
+            print(str(e))
+            self.spool_message(msg)
+            self.publish_errors += 1
+            if self.publish_errors > 1: #Second consecutive failure
+                self.recover()
+                self.publish_errors = 0
+
+    def run_scheduler(self):
+        """Reads every sensor in its own task at its native rate and publishes
+        a snapshot of the latest values every PUBLISH_INTERVAL seconds"""
+        from scheduler import Scheduler
+        self.wdt = WDT(timeout=20000)
+        self.publish_errors = 0
+        gc.collect()
+        scheduler = Scheduler(self.PUBLISH_INTERVAL)
+        # poll() only touches the bus once a new sample is predicted
+        scheduler.add_sensor('sps30', self.pm_sensor.poll, 0.25)
+        scheduler.add_sensor('scd30', self.co2_sensor.poll, 0.5)
+        scheduler.add_sensor('bme680', self.bme680.collect_reading, 3, start=self.bme680.start_reading)
+        scheduler.add_sensor('gps', lambda: self.gps.update(self.gps_uart), 1)
+        scheduler.run(self.publish_snapshot, feed=self.wdt.feed)
+
+    def run_duty_cycle(self):
+        """Low-power mode: one sample per wake, published every few wakes from
+        RTC memory, with the sensors asleep and the ESP32 in deep sleep between
+        samples. Waking from deep sleep takes the fast path: the boot time and
+        the JWT come from RTC memory and the sensors are not reconfigured."""
+        import machine
+        from rtcstate import RTCState
+        settings = self.device_config['deep_sleep'] # e.g. {'sample_interval': 60, 'samples_per_publish': 10}
+        sample_interval = settings.get('sample_interval', 60)
+        samples_per_publish = settings.get('samples_per_publish', 10)
+        self.wdt = WDT(timeout=120000) # a hung wake must not drain the battery
+        self.aggregator = None # its windows would not survive deep sleep, samples_per_publish batches instead
+        self.report_policy = None # nor would its last reported values
+        self.latency = None # nor the histograms
+        self.heap = None
+
+        state = None
+        if machine.reset_cause() == machine.DEEPSLEEP_RESET:
+            state = RTCState.load(self.rtc)
+        if state is None:
+            # Cold path: dial the modem first for the NTP time
+            self.modem_connect()
+            self.subscribe()
+            self.sensors_init()
+            state = RTCState(self.boot_time)
+        else:
+            self.sensors_init(configure=False)
+            self.boot_time = state.boot_time
+            if state.jwt:
+                self.token.jwt, self.token.issued_at, self.token.expires_at = state.jwt, state.issued_at, state.expires_at
+            self.pm_sensor.wakeup()
+            self.pm_sensor.start_measurement()
+        state.wakes += 1
+
+        msg = self.compose_message()
+        self.pm_sensor.stop_measurement()
+        self.pm_sensor.sleep()
+        queued = state.add(msg)
+        connected = hasattr(self, 'client') # after the cold path
+        if connected or not queued or len(state.samples) >= samples_per_publish:
+            try:
+                if not connected:
+                    self.modem_connect()
+                    self.subscribe(sync_time=False)
+                for sample in state.samples:
+                    self.publish_message(sample)
+                    self.wdt.feed()
+                if not queued:
+                    self.publish_message(msg)
+                if self.batch is not None:
+                    self.flush_batch()
+                state.samples = []
             except Exception as e:
-                gc.mem_free()
-                gc.collect()
                 print("message publish error:")
                 print(str(e))
-                
-                if num_of_times == 0:#For first Exception wait for resources to be released and try again
-                    num_of_times += 1
-                    time.sleep(12)
-                    continue
-                else:
-                    import machine
-                    machine.reset()
-    
-oAirPoll = AirPoll()
-oAirPoll.modem_connect()
-oAirPoll.subscribe()
-oAirPoll.sensors_init()
-oAirPoll.publish_sensors_data()
\ No newline at end of file
+                if not queued:
+                    self.spool_message(msg)
+            self.ppp.active(False)
+            self.MODEM_POWER_ON_PIN.value(0)
+
+        if self.token.jwt is not None:
+            state.jwt, state.issued_at, state.expires_at = self.token.jwt, self.token.issued_at, self.token.expires_at
+        state.save(self.rtc)
+        machine.deepsleep(sample_interval * 1000)
+
+def main():
+    oAirPoll = AirPoll()
+    if oAirPoll.device_config.get('deep_sleep'):
+        oAirPoll.run_duty_cycle()
+    else:
+        oAirPoll.modem_connect()
+        oAirPoll.subscribe()
+        oAirPoll.sensors_init()
+        if oAirPoll.device_config.get('scheduler'):
+            oAirPoll.run_scheduler()
+        else:
+            oAirPoll.publish_sensors_data()
+
+# MicroPython runs main.py as __main__ after boot.py, importing it has no side effects
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Heap telemetry of the publish loop.
+
+Around the same stages as latency.py, the monitor samples gc.mem_alloc() and
+counts the bytes every stage allocates, the most one call allocated, and how
+often the heap shrank during the stage, i.e. a collection ran inside it. Per
+cycle it keeps the bytes allocated, the lowest gc.mem_free() and the smallest
+largest free block of the IDF heap, which TLS buffers are allocated from;
+fragmentation shows there before the free total runs out. Like latency.py it
+allocates its counters up front and the firmware keeps None when it is off.
+
+On a host gc.mem_alloc() does not exist; the traced memory is used while
+tracemalloc runs, see sim.heap for attributing allocations to source lines.
+
+>>> from latency import SPS30, CYCLE
+>>> monitor = HeapMonitor()
+>>> monitor.add(SPS30, 400)
+>>> monitor.add(SPS30, 600)
+>>> monitor.add(SPS30, -9000)
+>>> monitor.count[SPS30], monitor.allocated[SPS30], monitor.max_bytes[SPS30], monitor.collected[SPS30]
+(3, 1000, 600, 1)
+>>> monitor.end()
+>>> monitor.allocated[CYCLE], monitor.min_free >= -1
+(1000, True)
+"""
+from array import array
+import gc
+
+from latency import STAGES, CYCLE
+
+try:
+    mem_alloc = gc.mem_alloc
+    mem_free = gc.mem_free
+except AttributeError: # CPython host
+    import tracemalloc
+
+    def mem_alloc():
+        return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+    def mem_free():
+        return getattr(gc, 'mem_free', lambda: -1)()
+
+try:
+    import esp32
+
+    def largest_free() -> int:
+        return max(region[2] for region in esp32.idf_heap_info(esp32.HEAP_DATA))
+except (ImportError, AttributeError):
+    def largest_free() -> int:
+        return -1
+
+
+class HeapMonitor:
+
+    def __init__(self, interval: int = 600):
+        self.interval = interval # s between two diagnostics messages
+        self.since = None
+        self.count = array('I', [0] * len(STAGES))
+        self.allocated = array('I', [0] * len(STAGES))
+        self.max_bytes = array('I', [0] * len(STAGES))
+        self.collected = array('I', [0] * len(STAGES))
+        self.cycle_allocated = 0 # bytes allocated by the cycle running
+        self.min_free = -1
+        self.min_largest = -1
+
+    def start(self) -> int:
+        return mem_alloc()
+
+    def stop(self, stage: int, start: int) -> int:
+        """Accounts the allocation since 'start' to 'stage' and returns the
+        current one, the start of the next stage."""
+        now = mem_alloc()
+        self.add(stage, now - start)
+        return now
+
+    def begin(self) -> int:
+        """Starts a cycle, and its first stage."""
+        self.cycle_allocated = 0
+        return mem_alloc()
+
+    def end(self) -> None:
+        """Ends a cycle, accounting what its stages allocated to CYCLE, and
+        samples the free heap."""
+        allocated = self.cycle_allocated
+        self.count[CYCLE] += 1
+        self.allocated[CYCLE] += allocated
+        if allocated > self.max_bytes[CYCLE]:
+            self.max_bytes[CYCLE] = allocated
+        free = mem_free()
+        if self.min_free < 0 or free < self.min_free:
+            self.min_free = free
+        largest = largest_free()
+        if self.min_largest < 0 or largest < self.min_largest:
+            self.min_largest = largest
+
+    def add(self, stage: int, delta: int) -> None:
+        self.count[stage] += 1
+        if delta < 0:
+            self.collected[stage] += 1 # what the stage allocated is unknown
+            return
+        self.allocated[stage] += delta
+        self.cycle_allocated += delta
+        if delta > self.max_bytes[stage]:
+            self.max_bytes[stage] = delta
+
+    def due(self, now: int) -> bool:
+        if self.since is None:
+            self.since = now
+        return now - self.since >= self.interval
+
+    def clear(self, now: int = None) -> None:
+        self.since = now
+        for counters in (self.count, self.allocated, self.max_bytes, self.collected):
+            for i in range(len(counters)):
+                counters[i] = 0
+        self.cycle_allocated = 0
+        self.min_free = self.min_largest = -1
@@ -0,0 +1,136 @@
+"""Streaming NMEA 0183 parser for the GPS UART.
+
+Bytes are fed as they arrive, in chunks of any size, into a buffer sized
+for the longest valid sentence. Sentences with a missing or wrong checksum
+are dropped. Only the latest fix from a GGA sentence is kept, and a GGA
+without a fix clears it, so a lost fix is never reported as current.
+
+>>> gps = NMEAParser()
+>>> gps.feed(b'$GPGGA,092750.000,5321.6802,N,00630.3372,W,1,8,1.03,61.7,M,55.2,M,,*76\\r\\n$GPGGA,0927')
+>>> gps.fix
+GPSFix(latitude=53.361337, longitude=-6.50562, altitude=61.7, time=34070.0, hdop=1.03)
+>>> gps.feed(b'51.000,5321.6802,N,00630.3372,W,1,8,1.03,61.7,M,55.2,M,,*75\\r\\n')
+>>> gps.sentences, gps.checksum_errors
+(1, 1)
+>>> gps.feed(b'$GPGGA,092752.000,,,,,0,00,99.99,,,,,,*5D\\r\\n')
+>>> gps.fix is None
+True
+"""
+try:
+    from collections import namedtuple
+except ImportError:
+    from ucollections import namedtuple
+
+GPSFix = namedtuple('GPSFix', ('latitude', 'longitude', 'altitude', 'time', 'hdop'))
+"""Decimal degrees (south and west negative), metres above mean sea level,
+UTC seconds since midnight and horizontal dilution of precision."""
+
+# Longest sentence allowed by NMEA 0183, '$' to '\n' included
+MAX_SENTENCE = 82
+
+_DOLLAR = 0x24
+_STAR = 0x2A
+_CR = 0x0D
+_LF = 0x0A
+
+
+def _hex_digit(c: int) -> int:
+    if 0x30 <= c <= 0x39:
+        return c - 0x30
+    if 0x41 <= c <= 0x46:
+        return c - 0x37
+    if 0x61 <= c <= 0x66: # some receivers send lower case
+        return c - 0x57
+    return -1
+
+
+def _degrees(value: str, hemisphere: str) -> float:
+    """'ddmm.mmmm' or 'dddmm.mmmm' to decimal degrees."""
+    point = value.find('.')
+    if point < 0:
+        point = len(value)
+    degrees = int(value[:point - 2]) + float(value[point - 2:]) / 60
+    if hemisphere in ('S', 'W'):
+        degrees = -degrees
+    return round(degrees, 6)
+
+
+def _seconds(value: str) -> float:
+    """'hhmmss.ss' to seconds since midnight."""
+    return int(value[0:2]) * 3600 + int(value[2:4]) * 60 + float(value[4:])
+
+
+class NMEAParser:
+
+    def __init__(self, chunk: int = 64):
+        self.buffer = bytearray(MAX_SENTENCE)
+        self.length = 0
+        self.chunk = bytearray(chunk) # UART reads land here
+        self.chunk_view = memoryview(self.chunk)
+        self.fix = None
+        self.sentences = 0 # valid sentences
+        self.checksum_errors = 0
+        self.overflows = 0 # sentences longer than MAX_SENTENCE
+
+    def feed(self, data) -> None:
+        buffer = self.buffer
+        for c in data:
+            if c == _DOLLAR:
+                buffer[0] = c
+                self.length = 1
+            elif self.length == 0:
+                continue # outside a sentence
+            elif c == _LF or c == _CR:
+                self.__sentence()
+                self.length = 0
+            elif self.length == MAX_SENTENCE:
+                self.overflows += 1
+                self.length = 0
+            else:
+                buffer[self.length] = c
+                self.length += 1
+
+    def __sentence(self) -> None:
+        buffer = self.buffer
+        end = self.length
+        # '$' body '*' two hex digits
+        if end < 4 or buffer[end - 3] != _STAR:
+            self.checksum_errors += 1
+            return
+        high = _hex_digit(buffer[end - 2])
+        low = _hex_digit(buffer[end - 1])
+        checksum = 0
+        for i in range(1, end - 3):
+            checksum ^= buffer[i]
+        if high < 0 or low < 0 or checksum != high << 4 | low:
+            self.checksum_errors += 1
+            return
+        self.sentences += 1
+        # Only the talker-independent sentence type matters: GPGGA, GNGGA, ...
+        if end > 6 and buffer[3] == 0x47 and buffer[4] == 0x47 and buffer[5] == 0x41: # 'GGA'
+            self.__gga(bytes(buffer[7:end - 3]))
+
+    def __gga(self, body: bytes) -> None:
+        try:
+            fields = body.decode().split(',')
+            # time, lat, N/S, lon, E/W, quality, satellites, hdop, altitude, M, ...
+            if len(fields) < 9 or fields[5] in ('', '0') or not fields[1] or not fields[3]:
+                self.fix = None # no fix, or the receiver lost it
+                return
+            self.fix = GPSFix(
+                _degrees(fields[1], fields[2]),
+                _degrees(fields[3], fields[4]),
+                float(fields[8]) if fields[8] else None,
+                _seconds(fields[0]) if fields[0] else None,
+                float(fields[7]) if fields[7] else None)
+        except ValueError:
+            self.checksum_errors += 1 # well formed but garbled
+
+    def update(self, uart) -> GPSFix:
+        """Feeds whatever the UART has received and returns the latest fix."""
+        while uart.any():
+            n = uart.readinto(self.chunk_view) or 0
+            if not n:
+                break
+            self.feed(self.chunk_view[:n])
+        return self.fix
@@ -0,0 +1,424 @@
+"""Compact binary telemetry payload, an alternative to the JSON-like message.
+
+Every payload starts with a version byte and a flags byte telling which
+sensor sections follow. All numbers are big-endian; measurements are IEEE754
+single precision floats. Version 2 layout:
+
+    header  >BBIIhI   version, flags, boot_time, timestamp, esp32_temp, esp32_gc_free_mem
+    sps30   >10f      mass density pm1.0 pm2.5 pm4.0 pm10, particle count
+                      pm0.5 pm1.0 pm2.5 pm4.0 pm10, typical particle size
+    scd30   >3f       co2 ppm, temperature 'C, relative humidity %
+    bme680  >4f       temperature 'C, humidity %, pressure hPa, gas ohm
+    gps     >iifHI    latest fix: latitude and longitude in 1e-7 degrees,
+                      altitude m (NaN if unknown), HDOP x100 (0xFFFF if
+                      unknown), UTC centiseconds since midnight (0xFFFFFFFF
+                      if unknown)
+
+Version 1 carried the raw GPS UART bytes instead, as '>H + raw', length
+prefixed; it is still decoded.
+
+A section is only present when its flag is set.
+
+Several payloads can be published together in a batch (see batch.py):
+
+    header  >BBI      BATCH_VERSION, sample count, timestamp of the first sample
+    entry   >HH + raw seconds after the first sample, payload length, payload
+
+Window summaries (see aggregate.py) replace the samples when aggregation is
+configured:
+
+    header  >BBII     SUMMARY_VERSION, window count, boot_time, timestamp
+    window  >HIHH     length s (at most aggregate.MAX_WINDOW), start timestamp,
+                      samples, channel mask with bit i set when
+                      aggregate.CHANNELS[i] follows
+    channel >H4f      count, min, max, mean, variance
+
+Latency histograms of the publish loop (see latency.py) go to the
+diagnostics subtopic:
+
+    header  >BBII     LATENCY_VERSION, stage count, first and last timestamp
+    stage   >HI11H    count, longest us, count per bucket of
+                      latency.BOUNDS_US; counts saturate at 65535
+
+and so does the heap telemetry (see memory.py):
+
+    header  >BBIIii   MEMORY_VERSION, stage count, first and last timestamp,
+                      lowest gc.mem_free(), smallest largest free block of
+                      the IDF heap, -1 if unknown
+    stage   >HIIH     count, bytes allocated, most bytes one call allocated,
+                      calls during which a collection ran
+
+The same module decodes payloads and batches on the host back into rows
+shaped like the JSON message:
+
+    python payload.py DEVICE_ID < payloads.hex > rows.jsonl
+"""
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+VERSION = 2
+BATCH_VERSION = 0x81
+SUMMARY_VERSION = 0x82
+LATENCY_VERSION = 0x83
+MEMORY_VERSION = 0x84
+
+FLAG_SPS30 = 0x01
+FLAG_SCD30 = 0x02
+FLAG_BME680 = 0x04
+FLAG_GPS = 0x08
+
+HEADER_FORMAT = '>BBIIhI'
+SPS30_FORMAT = '>10f'
+SCD30_FORMAT = '>3f'
+BME680_FORMAT = '>4f'
+GPS_LENGTH_FORMAT = '>H' # version 1
+GPS_FORMAT = '>iifHI'
+BATCH_HEADER_FORMAT = '>BBI'
+BATCH_ENTRY_FORMAT = '>HH'
+SUMMARY_HEADER_FORMAT = '>BBII'
+SUMMARY_WINDOW_FORMAT = '>HIHH'
+SUMMARY_CHANNEL_FORMAT = '>H4f'
+LATENCY_HEADER_FORMAT = '>BBII'
+LATENCY_STAGE_FORMAT = '>HI11H'
+MEMORY_HEADER_FORMAT = '>BBIIii'
+MEMORY_STAGE_FORMAT = '>HIIH'
+TIMESTAMP_OFFSET = struct.calcsize('>BBI') # of the timestamp in HEADER_FORMAT and SUMMARY_HEADER_FORMAT
+
+MASS_DENSITY_KEYS = ('pm1.0', 'pm2.5', 'pm4.0', 'pm10')
+PARTICLE_COUNT_KEYS = ('pm0.5', 'pm1.0', 'pm2.5', 'pm4.0', 'pm10')
+SCD30_KEYS = ('co2_ppm', 'temp_celsius', 'rh_percent')
+BME680_KEYS = ('bme680_temperature', 'bme680_humidity', 'bme680_pressure', 'bme680_gas')
+
+NO_HDOP = 0xFFFF
+NO_TIME = 0xFFFFFFFF
+
+# Decoded measurements are rounded like the SPS30 driver does
+DECIMALS = 3
+
+
+def encode(boot_time, timestamp, esp32_temp, sps30_data, scd30_data, gps_data, bme680, gc_free_mem=0) -> bytes:
+    """Packs one sample. 'sps30_data' and 'scd30_data' are the driver dicts,
+    'bme680' a BME680Reading and 'gps_data' the latest nmea.GPSFix; a section
+    that is None or holds an error instead of values is left out.
+    """
+    flags = 0
+    parts = []
+    if isinstance(sps30_data, dict) and sps30_data.get("mass_density"):
+        flags |= FLAG_SPS30
+        mass_density = sps30_data["mass_density"]
+        particle_count = sps30_data["particle_count"]
+        parts.append(struct.pack(SPS30_FORMAT,
+            *([mass_density[key] for key in MASS_DENSITY_KEYS]
+              + [particle_count[key] for key in PARTICLE_COUNT_KEYS]
+              + [sps30_data["particle_size"]])))
+    if isinstance(scd30_data, dict):
+        flags |= FLAG_SCD30
+        parts.append(struct.pack(SCD30_FORMAT, *[scd30_data[key] for key in SCD30_KEYS]))
+    if bme680 is not None:
+        flags |= FLAG_BME680
+        parts.append(struct.pack(BME680_FORMAT, bme680.temperature, bme680.humidity, bme680.pressure, bme680.gas))
+    if gps_data is not None:
+        flags |= FLAG_GPS
+        parts.append(struct.pack(GPS_FORMAT,
+            int(round(gps_data.latitude * 10000000)),
+            int(round(gps_data.longitude * 10000000)),
+            gps_data.altitude if gps_data.altitude is not None else float('nan'),
+            int(round(gps_data.hdop * 100)) if gps_data.hdop is not None else NO_HDOP,
+            int(round(gps_data.time * 100)) if gps_data.time is not None else NO_TIME))
+    header = struct.pack(HEADER_FORMAT, VERSION, flags, boot_time, timestamp, esp32_temp, gc_free_mem)
+    return header + b''.join(parts)
+
+
+def encode_summary(boot_time, timestamp, summaries) -> bytes:
+    """Packs the aggregate.Summary of every closed window into one payload."""
+    parts = [struct.pack(SUMMARY_HEADER_FORMAT, SUMMARY_VERSION, len(summaries), boot_time, timestamp)]
+    for summary in summaries:
+        mask = 0
+        for i, stats in enumerate(summary.stats):
+            if stats is not None:
+                mask |= 1 << i
+        parts.append(struct.pack(SUMMARY_WINDOW_FORMAT, summary.window, summary.start, summary.samples, mask))
+        for stats in summary.stats:
+            if stats is not None:
+                parts.append(struct.pack(SUMMARY_CHANNEL_FORMAT, *stats))
+    return b''.join(parts)
+
+
+def encode_latency(since, timestamp, histograms) -> bytes:
+    """Packs the latency.Histograms of every stage into one payload."""
+    from latency import STAGES
+    parts = [struct.pack(LATENCY_HEADER_FORMAT, LATENCY_VERSION, len(STAGES), since, timestamp)]
+    for stage in range(len(STAGES)):
+        parts.append(struct.pack(LATENCY_STAGE_FORMAT, min(histograms.count[stage], 0xFFFF), histograms.max_us[stage],
+                                 *[min(count, 0xFFFF) for count in histograms.buckets(stage)]))
+    return b''.join(parts)
+
+
+def encode_memory(since, timestamp, monitor) -> bytes:
+    """Packs the counters of a memory.HeapMonitor into one payload."""
+    from latency import STAGES
+    parts = [struct.pack(MEMORY_HEADER_FORMAT, MEMORY_VERSION, len(STAGES), since, timestamp,
+                         monitor.min_free, monitor.min_largest)]
+    for stage in range(len(STAGES)):
+        parts.append(struct.pack(MEMORY_STAGE_FORMAT, min(monitor.count[stage], 0xFFFF), monitor.allocated[stage],
+                                 monitor.max_bytes[stage], min(monitor.collected[stage], 0xFFFF)))
+    return b''.join(parts)
+
+
+def timestamp_of(payload) -> int:
+    """The timestamp in the header of a sample or summary payload, None for
+    any other payload. Both headers start with the version, flags or count,
+    and boot_time.
+
+    >>> timestamp_of(encode(1600000000, 1600000300, 128, None, None, None, None))
+    1600000300
+    >>> timestamp_of(b'{"timestamp":1600000300}') is None
+    True
+    """
+    if len(payload) < TIMESTAMP_OFFSET + 4 or payload[0] not in (1, VERSION, SUMMARY_VERSION):
+        return None
+    return struct.unpack_from('>I', payload, TIMESTAMP_OFFSET)[0]
+
+
+def _values(fmt, payload, offset):
+    values = struct.unpack_from(fmt, payload, offset)
+    return [round(value, DECIMALS) for value in values], offset + struct.calcsize(fmt)
+
+
+def _raw_gps(payload, offset):
+    length, = struct.unpack_from(GPS_LENGTH_FORMAT, payload, offset)
+    offset += struct.calcsize(GPS_LENGTH_FORMAT)
+    return bytes(payload[offset:offset + length]).decode('ascii', 'replace'), offset + length
+
+
+def _gps_fix(payload, offset):
+    latitude, longitude, altitude, hdop, time = struct.unpack_from(GPS_FORMAT, payload, offset)
+    fix = {
+        "latitude": latitude / 10000000,
+        "longitude": longitude / 10000000,
+        "altitude": round(altitude, 1) if altitude == altitude else None,
+        "time": time / 100 if time != NO_TIME else None,
+        "hdop": hdop / 100 if hdop != NO_HDOP else None,
+    }
+    return fix, offset + struct.calcsize(GPS_FORMAT)
+
+
+def _decode_sections(payload, device_id, gps) -> dict:
+    _, flags, boot_time, timestamp, esp32_temp, gc_free_mem = struct.unpack_from(HEADER_FORMAT, payload, 0)
+    offset = struct.calcsize(HEADER_FORMAT)
+    row = {
+        "device_id": device_id,
+        "boot_time": boot_time,
+        "timestamp": timestamp,
+        "esp32_temp": esp32_temp,
+        "esp32_gc_free_mem": gc_free_mem,
+        "sps30_data": None,
+        "scd30_data": None,
+        "gps_data": None,
+        "bme680": None,
+    }
+    if flags & FLAG_SPS30:
+        values, offset = _values(SPS30_FORMAT, payload, offset)
+        row["sps30_data"] = {
+            "mass_density": dict(zip(MASS_DENSITY_KEYS, values[:4])),
+            "particle_count": dict(zip(PARTICLE_COUNT_KEYS, values[4:9])),
+            "particle_size": values[9],
+            "mass_density_unit": "ug/m3",
+            "particle_count_unit": "#/cm3",
+            "particle_size_unit": "um"
+        }
+    if flags & FLAG_SCD30:
+        values, offset = _values(SCD30_FORMAT, payload, offset)
+        row["scd30_data"] = dict(zip(SCD30_KEYS, values))
+    if flags & FLAG_BME680:
+        values, offset = _values(BME680_FORMAT, payload, offset)
+        row["bme680"] = dict(zip(BME680_KEYS, values))
+    if flags & FLAG_GPS:
+        row["gps_data"], offset = gps(payload, offset)
+    if offset != len(payload):
+        raise ValueError("payload length {} does not match its flags, expected {}".format(len(payload), offset))
+    return row
+
+
+def _decode_v1(payload, device_id=None) -> dict:
+    return _decode_sections(payload, device_id, _raw_gps)
+
+
+def _decode_v2(payload, device_id=None) -> dict:
+    return _decode_sections(payload, device_id, _gps_fix)
+
+
+def decode_summary(payload, device_id=None) -> dict:
+    """Unpacks window summaries into a row with one entry per window.
+
+    >>> from aggregate import Summary, CHANNELS
+    >>> stats = [None] * len(CHANNELS)
+    >>> stats[CHANNELS.index('co2')] = (3, 600.0, 640.0, 620.0, 400.0)
+    >>> payload = encode_summary(1600000000, 1600000260, [Summary(60, 1600000200, 3, stats)])
+    >>> len(payload)
+    38
+    >>> decode(payload, 'airpoll-1')['summaries']
+    [{'window': 60, 'start': 1600000200, 'samples': 3, 'stats': {'co2': {'count': 3, 'min': 600.0, 'max': 640.0, 'mean': 620.0, 'variance': 400.0}}}]
+    """
+    from aggregate import CHANNELS
+    _, count, boot_time, timestamp = struct.unpack_from(SUMMARY_HEADER_FORMAT, payload, 0)
+    offset = struct.calcsize(SUMMARY_HEADER_FORMAT)
+    summaries = []
+    for _ in range(count):
+        window, start, samples, mask = struct.unpack_from(SUMMARY_WINDOW_FORMAT, payload, offset)
+        offset += struct.calcsize(SUMMARY_WINDOW_FORMAT)
+        stats = {}
+        for i, channel in enumerate(CHANNELS):
+            if mask & 1 << i:
+                values = struct.unpack_from(SUMMARY_CHANNEL_FORMAT, payload, offset)
+                offset += struct.calcsize(SUMMARY_CHANNEL_FORMAT)
+                stats[channel] = dict(zip(('count', 'min', 'max', 'mean', 'variance'),
+                                          values[:1] + tuple(round(value, DECIMALS) for value in values[1:])))
+        summaries.append({"window": window, "start": start, "samples": samples, "stats": stats})
+    if offset != len(payload):
+        raise ValueError("summary length {} does not match its windows, expected {}".format(len(payload), offset))
+    return {"device_id": device_id, "boot_time": boot_time, "timestamp": timestamp, "summaries": summaries}
+
+
+def decode_latency(payload, device_id=None) -> dict:
+    """Unpacks latency histograms into a row with one entry per stage.
+
+    >>> from latency import Histograms, PUBLISH
+    >>> histograms = Histograms()
+    >>> histograms.add(PUBLISH, 42000)
+    >>> payload = encode_latency(1600000000, 1600000600, histograms)
+    >>> len(payload)
+    234
+    >>> decode(payload, 'airpoll-1')['stages']['publish']
+    {'count': 1, 'max_us': 42000, 'buckets': [0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0]}
+    """
+    from latency import STAGES
+    _, count, since, timestamp = struct.unpack_from(LATENCY_HEADER_FORMAT, payload, 0)
+    offset = struct.calcsize(LATENCY_HEADER_FORMAT)
+    if offset + count * struct.calcsize(LATENCY_STAGE_FORMAT) != len(payload):
+        raise ValueError("latency payload length {} does not match its {} stages".format(len(payload), count))
+    stages = {}
+    for stage in range(count):
+        values = struct.unpack_from(LATENCY_STAGE_FORMAT, payload, offset)
+        offset += struct.calcsize(LATENCY_STAGE_FORMAT)
+        name = STAGES[stage] if stage < len(STAGES) else str(stage)
+        stages[name] = {"count": values[0], "max_us": values[1], "buckets": list(values[2:])}
+    return {"device_id": device_id, "since": since, "timestamp": timestamp, "stages": stages}
+
+
+def decode_memory(payload, device_id=None) -> dict:
+    """Unpacks heap telemetry into a row with one entry per stage.
+
+    >>> from memory import HeapMonitor
+    >>> from latency import ENCODE
+    >>> monitor = HeapMonitor()
+    >>> monitor.add(ENCODE, 1184)
+    >>> payload = encode_memory(1600000000, 1600000600, monitor)
+    >>> len(payload)
+    114
+    >>> decode(payload, 'airpoll-1')['stages']['encode']
+    {'count': 1, 'allocated': 1184, 'max_bytes': 1184, 'collected': 0}
+    """
+    from latency import STAGES
+    _, count, since, timestamp, min_free, min_largest = struct.unpack_from(MEMORY_HEADER_FORMAT, payload, 0)
+    offset = struct.calcsize(MEMORY_HEADER_FORMAT)
+    if offset + count * struct.calcsize(MEMORY_STAGE_FORMAT) != len(payload):
+        raise ValueError("memory payload length {} does not match its {} stages".format(len(payload), count))
+    stages = {}
+    for stage in range(count):
+        values = struct.unpack_from(MEMORY_STAGE_FORMAT, payload, offset)
+        offset += struct.calcsize(MEMORY_STAGE_FORMAT)
+        name = STAGES[stage] if stage < len(STAGES) else str(stage)
+        stages[name] = dict(zip(('count', 'allocated', 'max_bytes', 'collected'), values))
+    return {"device_id": device_id, "since": since, "timestamp": timestamp, "min_free": min_free,
+            "min_largest_free_block": min_largest, "stages": stages}
+
+
+DECODERS = {
+    1: _decode_v1,
+    2: _decode_v2,
+    SUMMARY_VERSION: decode_summary,
+    LATENCY_VERSION: decode_latency,
+    MEMORY_VERSION: decode_memory,
+}
+
+
+def decode(payload, device_id=None) -> dict:
+    """Unpacks a payload into a row shaped like the JSON message.
+
+    >>> from collections import namedtuple
+    >>> Reading = namedtuple('Reading', ('temperature', 'humidity', 'pressure', 'gas'))
+    >>> Fix = namedtuple('Fix', ('latitude', 'longitude', 'altitude', 'time', 'hdop'))
+    >>> payload = encode(1600000000, 1600000300, 128, None, {'co2_ppm': 612.5,
+    ...     'temp_celsius': 23.25, 'rh_percent': 41.0}, Fix(53.361337, -6.50562, 61.7, 34070.0, None),
+    ...     Reading(21.5, 40.25, 1013.5, 12000.0))
+    >>> len(payload)
+    62
+    >>> row = decode(payload, 'airpoll-1')
+    >>> row['scd30_data'], row['sps30_data']
+    ({'co2_ppm': 612.5, 'temp_celsius': 23.25, 'rh_percent': 41.0}, None)
+    >>> row['gps_data']
+    {'latitude': 53.361337, 'longitude': -6.50562, 'altitude': 61.7, 'time': 34070.0, 'hdop': None}
+    >>> row['bme680']['bme680_pressure']
+    1013.5
+    >>> decode(bytes([1, FLAG_GPS]) + payload[2:16] + bytes([0, 6]) + b'$GPGGA')['gps_data']
+    '$GPGGA'
+    >>> decode(b'\\x07' + payload[1:])
+    Traceback (most recent call last):
+    ...
+    ValueError: unsupported payload version 7
+    """
+    version = payload[0]
+    if version not in DECODERS:
+        raise ValueError("unsupported payload version {}".format(version))
+    return DECODERS[version](payload, device_id)
+
+
+def decode_batch(payload, device_id=None) -> list:
+    """Unpacks a batch into rows, each with the 'sample_time' it was taken at.
+
+    >>> batch = bytes([BATCH_VERSION, 2, 0x5f, 0x5e, 0x10, 0x00])
+    >>> sample = encode(1600000000, 1600000000, 128, None, None, None, None)
+    >>> batch += bytes([0, 0, 0, len(sample)]) + sample + bytes([0, 7, 0, len(sample)]) + sample
+    >>> [row['sample_time'] for row in decode_batch(batch)]
+    [1600000000, 1600000007]
+    """
+    if payload[0] != BATCH_VERSION:
+        raise ValueError("not a batch, version {}".format(payload[0]))
+    _, count, base = struct.unpack_from(BATCH_HEADER_FORMAT, payload, 0)
+    offset = struct.calcsize(BATCH_HEADER_FORMAT)
+    entry_size = struct.calcsize(BATCH_ENTRY_FORMAT)
+    rows = []
+    for _ in range(count):
+        delta, length = struct.unpack_from(BATCH_ENTRY_FORMAT, payload, offset)
+        offset += entry_size
+        row = decode(payload[offset:offset + length], device_id)
+        row["sample_time"] = base + delta
+        rows.append(row)
+        offset += length
+    if offset != len(payload):
+        raise ValueError("batch length {} does not match its entries, expected {}".format(len(payload), offset))
+    return rows
+
+
+def decode_rows(payload, device_id=None) -> list:
+    """Rows of a single payload or of a batch."""
+    if payload[0] == BATCH_VERSION:
+        return decode_batch(payload, device_id)
+    return [decode(payload, device_id)]
+
+
+if __name__ == '__main__':
+    # Host side: hex encoded payloads, one per line, to JSON rows
+    import sys
+    import json
+    from binascii import unhexlify
+
+    device_id = sys.argv[1] if len(sys.argv) > 1 else None
+    for line in sys.stdin:
+        line = line.strip()
+        if line:
+            for row in decode_rows(unhexlify(line), device_id):
+                print(json.dumps(row))
@@ -0,0 +1,82 @@
+"""Tiered recovery from a lost connection.
+
+Tiers are tried from the cheapest to the most expensive: an action is retried
+'attempts' times with an exponential backoff, starting at 'backoff' seconds
+and capped at 'max_backoff', before escalating to the next tier. Every tier
+counts how often it was tried and how often it recovered the connection.
+
+>>> log = []
+>>> def reconnect_mqtt():
+...     log.append('mqtt')
+...     raise OSError('broker unreachable')
+>>> recovery = Recovery((
+...     Tier('mqtt', reconnect_mqtt, attempts=3, backoff=1, max_backoff=3),
+...     Tier('ppp', lambda: log.append('ppp'), attempts=2, backoff=5),
+... ), sleep=lambda seconds: log.append(seconds), log=None)
+>>> recovery.recover()
+'ppp'
+>>> log
+['mqtt', 1, 'mqtt', 2, 'mqtt', 'ppp']
+>>> recovery.counters()
+{'mqtt': (3, 0), 'ppp': (1, 1)}
+>>> recovery.recover('modem')
+Traceback (most recent call last):
+...
+ValueError: unknown recovery tier modem
+"""
+import time
+
+
+class Tier:
+    __slots__ = ('name', 'action', 'attempts', 'backoff', 'max_backoff', 'tried', 'recovered')
+
+    def __init__(self, name: str, action, attempts: int = 1, backoff: float = 1, max_backoff: float = 60):
+        self.name = name
+        self.action = action
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.tried = 0
+        self.recovered = 0
+
+
+class Recovery:
+
+    def __init__(self, tiers, sleep=time.sleep, log=print):
+        self.tiers = tiers
+        self.sleep = sleep
+        self.log = log
+
+    def recover(self, first: str = None) -> str:
+        """Runs the tiers, from 'first' or the cheapest one, until an action
+        returns without raising, and returns the name of that tier. Raises
+        the last error when every tier failed.
+        """
+        if first is not None and not any(tier.name == first for tier in self.tiers):
+            raise ValueError("unknown recovery tier {}".format(first))
+        error = None
+        started = first is None
+        for tier in self.tiers:
+            started = started or tier.name == first
+            if not started:
+                continue
+            delay = tier.backoff
+            for attempt in range(tier.attempts):
+                if attempt:
+                    self.sleep(delay)
+                    delay = min(2 * delay, tier.max_backoff)
+                tier.tried += 1
+                try:
+                    tier.action()
+                except Exception as e:
+                    error = e
+                    if self.log is not None:
+                        self.log("recovery {} attempt {} failed: {}".format(tier.name, attempt + 1, e))
+                    continue
+                tier.recovered += 1
+                return tier.name
+        raise error
+
+    def counters(self) -> dict:
+        """(tried, recovered) of every tier."""
+        return {tier.name: (tier.tried, tier.recovered) for tier in self.tiers}
@@ -0,0 +1,110 @@
+"""Change-triggered reporting: publishes a sample only when it says something new.
+
+A sample is suppressed while every watched channel stays within its deadband
+of the value last reported. The deadband of a channel is the larger of an
+absolute and a relative (fraction of the last value) tolerance. A sample is
+still reported once 'heartbeat' seconds passed since the last report, so the
+backend can tell a quiet room from a dead device, and a sample crossing one
+of the 'thresholds' of a channel, in either direction, is reported at once
+and flushes any pending batch.
+
+>>> class Reading:
+...     temperature, humidity, pressure, gas = 21.0, 40.0, 1013.0, 90000
+>>> policy = ReportPolicy(heartbeat=600, thresholds={'pm2.5': [35]})
+>>> sps30 = {'mass_density': {'pm1.0': 8.0, 'pm2.5': 10.0, 'pm4.0': 11.0, 'pm10': 12.0}}
+>>> policy.check(1000, sps30, {'co2_ppm': 600.0}, Reading)
+1
+>>> policy.check(1007, sps30, {'co2_ppm': 610.0}, Reading)
+0
+>>> policy.check(1014, sps30, {'co2_ppm': 640.0}, Reading)
+1
+>>> sps30['mass_density']['pm2.5'] = 40.0
+>>> policy.check(1021, sps30, {'co2_ppm': 640.0}, Reading)
+3
+>>> policy.check(1630, sps30, {'co2_ppm': 640.0}, Reading)
+2
+>>> policy.counters()
+{'samples': 5, 'suppressed': 1, 'changed': 2, 'heartbeat': 1, 'crossing': 1}
+"""
+from aggregate import CHANNELS, channel_values
+
+SUPPRESS = 0
+CHANGED = 1
+HEARTBEAT = 2
+CROSSING = 3
+
+# (absolute, relative) tolerance of the watched channels
+DEADBANDS = {
+    'pm1.0': (1.0, 0.1),
+    'pm2.5': (1.0, 0.1),
+    'pm4.0': (1.0, 0.1),
+    'pm10': (1.0, 0.1),
+    'co2': (20.0, 0.03),
+    'temperature': (0.2, 0.0),
+    'humidity': (1.0, 0.0),
+    'pressure': (0.5, 0.0),
+    'gas': (0.0, 0.05),
+}
+
+
+class ReportPolicy:
+
+    def __init__(self, deadbands: dict = None, heartbeat: int = 600, thresholds: dict = None):
+        """'deadbands' overrides entries of DEADBANDS, a channel mapped to None
+        is not watched. 'thresholds' maps channels to a list of levels, e.g.
+        {'pm2.5': [35], 'co2': [1000, 1500]}."""
+        settings = dict(DEADBANDS)
+        settings.update(deadbands or {})
+        thresholds = thresholds or {}
+        for channel in settings:
+            if channel not in CHANNELS:
+                raise ValueError("unknown channel {}".format(channel))
+        # Per channel, indexed like CHANNELS
+        self.deadbands = [settings.get(channel) for channel in CHANNELS]
+        self.thresholds = [thresholds.get(channel, ()) for channel in CHANNELS]
+        self.heartbeat = heartbeat
+        self.last = [None] * len(CHANNELS) # the values last reported
+        self.values = [None] * len(CHANNELS) # the sample being checked, reused
+        self.reported = None # timestamp of the last report
+        self.samples = 0
+        self.reports = [0, 0, 0, 0] # per decision, SUPPRESS counts the publishes saved
+
+    def __decide(self, timestamp: int, values: list) -> int:
+        decision = SUPPRESS
+        if self.reported is None or timestamp - self.reported >= self.heartbeat:
+            decision = HEARTBEAT
+        last = self.last
+        for i in range(len(values)):
+            value, previous = values[i], last[i]
+            if value is None or previous is None:
+                if value is not previous and self.deadbands[i] is not None:
+                    decision = CHANGED # a sensor came back or dropped out
+                continue
+            for level in self.thresholds[i]:
+                if (previous < level) != (value < level):
+                    return CROSSING
+            deadband = self.deadbands[i]
+            if deadband is not None and abs(value - previous) > max(deadband[0], deadband[1] * abs(previous)):
+                decision = CHANGED
+        return decision
+
+    def check(self, timestamp: int, sps30_data, scd30_data, bme680) -> int:
+        """Returns SUPPRESS when the sample taken at 'timestamp' (seconds) need
+        not be published, else why it must: CHANGED, HEARTBEAT or CROSSING.
+        A sample to publish becomes the reference of the next ones."""
+        values = channel_values(self.values, sps30_data, scd30_data, bme680)
+        decision = self.__decide(timestamp, values)
+        if self.reported is None and decision == HEARTBEAT:
+            decision = CHANGED # the first sample
+        self.samples += 1
+        self.reports[decision] += 1
+        if decision != SUPPRESS:
+            self.reported = timestamp
+            self.values, self.last = self.last, values
+        return decision
+
+    def counters(self) -> dict:
+        """Samples checked and how many were suppressed, i.e. publishes saved,
+        or reported for each reason."""
+        return {'samples': self.samples, 'suppressed': self.reports[SUPPRESS], 'changed': self.reports[CHANGED],
+                'heartbeat': self.reports[HEARTBEAT], 'crossing': self.reports[CROSSING]}
@@ -0,0 +1,129 @@
+"""State kept in RTC memory across deep sleep.
+
+RTC memory survives deep sleep and soft resets, but not a power loss. The
+state carries a CRC-32, so memory left uninitialised after power-up is
+rejected and the device takes the cold path.
+
+Layout, big-endian:
+
+    header  >BIIHIIH  STATE_VERSION, boot_time, wakes, sample count,
+                      JWT issued_at, expires_at, JWT length
+    jwt
+    sample  >H + raw  length prefixed encoded sample, oldest first
+    crc     >I        CRC-32 of everything before it
+
+>>> class FakeRTC:
+...     data = b''
+...     def memory(self, data=None):
+...         if data is None:
+...             return self.data
+...         self.data = bytes(data)
+>>> rtc = FakeRTC()
+>>> RTCState.load(rtc) is None
+True
+>>> state = RTCState(boot_time=1600000000)
+>>> state.jwt, state.issued_at, state.expires_at = 'header.claims.signature', 1600000000, 1600086400
+>>> state.add(b'sample 1'); state.add(b'sample 2')
+True
+True
+>>> state.save(rtc)
+>>> restored = RTCState.load(rtc)
+>>> restored.boot_time, restored.jwt, restored.samples
+(1600000000, 'header.claims.signature', [b'sample 1', b'sample 2'])
+>>> state.add(bytes(RTC_MEMORY_SIZE))
+False
+>>> rtc.data = b'\\x01' + rtc.data[1:]
+>>> RTCState.load(rtc) is None
+True
+"""
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+try:
+    from ubinascii import crc32
+except ImportError:
+    from binascii import crc32
+
+STATE_VERSION = 0x52
+HEADER_FORMAT = '>BIIHIIH'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+SAMPLE_LENGTH_FORMAT = '>H'
+SAMPLE_LENGTH_SIZE = struct.calcsize(SAMPLE_LENGTH_FORMAT)
+CRC_SIZE = 4
+
+# User RTC memory of the ESP32 port
+RTC_MEMORY_SIZE = 2048
+
+
+class RTCState:
+
+    def __init__(self, boot_time: int = 0, capacity: int = RTC_MEMORY_SIZE):
+        self.boot_time = boot_time
+        self.capacity = capacity
+        self.wakes = 0
+        self.jwt = None
+        self.issued_at = 0
+        self.expires_at = 0
+        self.samples = []
+
+    def size(self) -> int:
+        """Bytes the packed state takes."""
+        size = HEADER_SIZE + CRC_SIZE + (len(self.jwt) if self.jwt else 0)
+        for sample in self.samples:
+            size += SAMPLE_LENGTH_SIZE + len(sample)
+        return size
+
+    def add(self, sample) -> bool:
+        """Queues an encoded sample, False if it does not fit in RTC memory."""
+        if self.size() + SAMPLE_LENGTH_SIZE + len(sample) > self.capacity:
+            return False
+        self.samples.append(bytes(sample))
+        return True
+
+    def pack(self) -> bytes:
+        jwt = self.jwt.encode('utf-8') if self.jwt else b''
+        data = bytearray(self.size())
+        struct.pack_into(HEADER_FORMAT, data, 0, STATE_VERSION, self.boot_time, self.wakes,
+                         len(self.samples), self.issued_at, self.expires_at, len(jwt))
+        offset = HEADER_SIZE
+        data[offset:offset + len(jwt)] = jwt
+        offset += len(jwt)
+        for sample in self.samples:
+            struct.pack_into(SAMPLE_LENGTH_FORMAT, data, offset, len(sample))
+            offset += SAMPLE_LENGTH_SIZE
+            data[offset:offset + len(sample)] = sample
+            offset += len(sample)
+        struct.pack_into('>I', data, offset, crc32(data[:offset]))
+        return bytes(data)
+
+    @classmethod
+    def unpack(cls, data, capacity: int = RTC_MEMORY_SIZE):
+        """The state packed in 'data', None if it is not a valid state."""
+        if len(data) < HEADER_SIZE + CRC_SIZE or data[0] != STATE_VERSION:
+            return None
+        crc, = struct.unpack_from('>I', data, len(data) - CRC_SIZE)
+        if crc != crc32(data[:len(data) - CRC_SIZE]):
+            return None
+        _, boot_time, wakes, count, issued_at, expires_at, jwt_length = struct.unpack_from(HEADER_FORMAT, data, 0)
+        state = cls(boot_time, capacity)
+        state.wakes = wakes
+        offset = HEADER_SIZE
+        if jwt_length:
+            state.jwt = bytes(data[offset:offset + jwt_length]).decode('utf-8')
+            state.issued_at = issued_at
+            state.expires_at = expires_at
+        offset += jwt_length
+        for _ in range(count):
+            length, = struct.unpack_from(SAMPLE_LENGTH_FORMAT, data, offset)
+            offset += SAMPLE_LENGTH_SIZE
+            state.samples.append(bytes(data[offset:offset + length]))
+            offset += length
+        return state
+
+    def save(self, rtc) -> None:
+        rtc.memory(self.pack())
+
+    @classmethod
+    def load(cls, rtc):
+        return cls.unpack(rtc.memory())
@@ -2,20 +2,22 @@
 #import logging
 #import smbus2
 import struct
-import time
 from time import sleep
 from i2c.i2c import I2C
+from i2c.crc import crc8, verify_words, strip_crc, CRCError
+from i2c.ready import DataReady, Sample
+from ticks import ticks_ms, ticks_diff
 
 
 def interpret_as_float(integer: int):
     return struct.unpack('!f', struct.pack('!I', integer))[0]
 
-CMD_FIRMWARE_VERSION = [0xD1, 0x00]
-CMD_READ_DATA_READY_FLAG = [0x02, 0x02]
-CMD_START_MEASUREMENT = [0x00, 0x10]
-CMD_READ_MEASUREMENT_INTERVAL = [0x46, 0x00]
-CMD_SET_MEASUREMENT_INTERVAL = [0x46, 0x00]
-CMD_READ_MEASUREMENT = [0x03, 0x00]
+CMD_FIRMWARE_VERSION = b'\xd1\x00'
+CMD_READ_DATA_READY_FLAG = b'\x02\x02'
+CMD_START_MEASUREMENT = b'\x00\x10'
+CMD_READ_MEASUREMENT_INTERVAL = b'\x46\x00'
+CMD_SET_MEASUREMENT_INTERVAL = b'\x46\x00'
+CMD_READ_MEASUREMENT = b'\x03\x00'
 
 
 NBYTES_READ_DATA_READY_FLAG = 3
@@ -25,6 +27,12 @@ NBYTES_READ_MEASUREMENT = 18
 
 PACKET_SIZE = 3
 
+# The sensor needs 3 ms between a read command and the read of its response
+READ_DELAY_MS = 3
+
+# Factory default of the continuous measurement interval
+DEFAULT_MEASUREMENT_INTERVAL = 2
+
 class SCD30:
     
     def __init__(self,  bus :int = 1, address: int = 0x61, sampling_period: int = 1, logger: str = None):
@@ -34,6 +42,9 @@ class SCD30:
 
         self.sampling_period = sampling_period
         self.i2c = I2C(bus, address)
+        # CRC-stripped measurement payload, reused on every read
+        self.__payload = bytearray(NBYTES_READ_MEASUREMENT * 2 // PACKET_SIZE)
+        self.ready = DataReady(DEFAULT_MEASUREMENT_INTERVAL * 1000)
         #self.__data = Queue(maxsize=20)
         self.__valid = {
             "mass_density": False,
@@ -42,55 +53,42 @@ class SCD30:
         }
 
     def crc_calc(self, data: list) -> int:
-        crc = 0xFF
-        for i in range(2):
-            crc ^= data[i]
-            for _ in range(8, 0, -1):
-                if crc & 0x80:
-                    crc = (crc << 1) ^ 0x31
-                else:
-                    crc = crc << 1
-
-        # The checksum only contains 8-bit,
-        # so the calculated value has to be masked with 0xFF
-        return (crc & 0x0000FF)    
-        
+        return crc8(data, 0, 2)
+
+    def __warn(self, message: str) -> None:
+        if self.logger:
+            self.logger.warning(message)
+        else:
+            print(message)
+
+    def __verify_words(self, data: list, name: str) -> list:
+        try:
+            return verify_words(data)
+        except CRCError as e:
+            self.__warn("'{}' {}".format(name, e))
+            return None
+
     def firmware_version(self) -> str:
-        self.i2c.write(CMD_FIRMWARE_VERSION)
-        data = self.i2c.read(NBYTES_FIRMWARE_VERSION)
+        data = self.i2c.query(CMD_FIRMWARE_VERSION, NBYTES_FIRMWARE_VERSION)
 
-        if self.crc_calc(data[:2]) != data[2]:
+        if self.crc_calc(data) != data[2]:
             return "CRC mismatched"
 
         return ".".join(map(str, data[:2]))
 
     def read_data_ready_flag(self) -> bool:
-        self.i2c.write(CMD_READ_DATA_READY_FLAG)
-        data = self.i2c.read(NBYTES_READ_DATA_READY_FLAG)
-
-        if self.crc_calc(data[:2]) != data[2]:
-            if self.logger:
-                self.logger.warning(
-                    "'read_data_ready_flag' CRC mismatched!" +
-                    "  Data: {data[:2]}" +
-                    "  Calculated CRC: {self.crc_calc(data[:2])}" +
-                    "  Expected: {data[2]}")
-            else:
-                print(
-                    "'read_data_ready_flag' CRC mismatched!" +
-                    "  Data: {data[:2]}" +
-                    "  Calculated CRC: {self.crc_calc(data[:2])}" +
-                    "  Expected: {data[2]}")
+        data = self.i2c.query(CMD_READ_DATA_READY_FLAG, NBYTES_READ_DATA_READY_FLAG, READ_DELAY_MS)
 
+        crc = crc8(data, 0, 2)
+        if crc != data[2]:
+            self.__warn("'read_data_ready_flag' CRC mismatched! Calculated 0x{:02x}, expected 0x{:02x}".format(
+                crc, data[2]))
             return False
 
         return True if data[1] == 1 else False
     
     def start_measurement(self) -> None:
-        data = CMD_START_MEASUREMENT
-        data.extend([0x00, 0x00])
-        data.append(self.crc_calc(data[2:4]))
-        self.i2c.write(data)
+        self.i2c.write_word(CMD_START_MEASUREMENT, 0x0000)
         sleep(0.05)
         
     def get_measurement_interval(self) -> int:
@@ -98,13 +96,13 @@ class SCD30:
         Returns:
             measurement interval in seconds or None.
         """
-        self.i2c.write(CMD_READ_MEASUREMENT_INTERVAL)
-        data = self.i2c.read(NBYTES_READ_MEASUREMENT_INTERVAL)
-        for i in range(0, NBYTES_READ_MEASUREMENT_INTERVAL, 3):
-            if self.crc_calc(data[i:i+2]) != data[i+2]:
-                return "CRC mismatched"
+        data = self.i2c.query(CMD_READ_MEASUREMENT_INTERVAL, NBYTES_READ_MEASUREMENT_INTERVAL, READ_DELAY_MS)
+        words = self.__verify_words(data, "get_measurement_interval")
+        if words is None:
+            return "CRC mismatched"
 
-        return data
+        self.ready.set_interval(words[0] * 1000)
+        return words[0]
 
     def set_measurement_interval(self, interval=2):
         """Sets the interval used for periodic measurements.
@@ -116,10 +114,8 @@ class SCD30:
         if not 2 <= interval <= 1800:
             raise ValueError("Interval must be in the range [2; 1800] (sec)")
 
-        data = CMD_SET_MEASUREMENT_INTERVAL
-        data.extend([0x00, interval])
-        data.append(self.crc_calc(data[2:4]))
-        self.i2c.write(data)
+        self.i2c.write_word(CMD_SET_MEASUREMENT_INTERVAL, interval)
+        self.ready.set_interval(interval * 1000)
         sleep(0.05)
         
     def read_measurement(self):
@@ -129,27 +125,19 @@ class SCD30:
         Returns:
             tuple of measurement values (CO2 ppm, Temp 'C, RH %) or None.
         """
-        self.i2c.write(CMD_READ_MEASUREMENT)
-        time.sleep(5 / 1000)
-        data = self.i2c.read(NBYTES_READ_MEASUREMENT)
+        data = self.i2c.query(CMD_READ_MEASUREMENT, NBYTES_READ_MEASUREMENT, 5)
               
         if data is None or len(data) != 18:
             print("Failed to read measurement, received: " +
                           str(data))
             return None
         
-        status = []
-        calculated_values = []
-        for i in range(0, NBYTES_READ_MEASUREMENT, PACKET_SIZE):
-            if self.crc_calc(data[i:i+2]) != data[i+2]:
-                return "CRC mismatched"
+        try:
+            calculated_values = struct.unpack('>3f', strip_crc(data, self.__payload))
+        except CRCError as e:
+            self.__warn("'read_measurement' {}".format(e))
+            return "CRC mismatched"
 
-            status.extend(data[i:i+2])
-    
-        for i in range(0, 12, 4):
-            value = status[i:i+4]
-            calculated_values.append(interpret_as_float(value[0] << 24 | value[1] << 16 | value[2] << 8 | value[3]))   
-        
         result = {
             "co2_ppm": calculated_values[0],
             "temp_celsius": calculated_values[1],
@@ -157,4 +145,32 @@ class SCD30:
             }
         
         return result
-        
\ No newline at end of file
+
+    def poll(self) -> Sample:
+        """Returns the latest measurement, its age in ms and whether it is stale,
+        without blocking. The data-ready flag is only checked once a new sample
+        is due according to the measurement interval, so a sample is never
+        read twice.
+        """
+        if self.ready.due():
+            result = self.read_measurement() if self.read_data_ready_flag() else None
+            if isinstance(result, dict):
+                self.ready.update(result)
+            else:
+                self.ready.miss()
+
+        return self.ready.sample()
+
+    def get_measurement(self) -> dict:
+        """Waits for the next sample, sleeping only until it is predicted.
+        Gives up and returns None once no sample came for as long as makes it
+        stale, e.g. when the sensor never reports ready or keeps failing CRC."""
+        last = self.ready.ticks
+        start = ticks_ms()
+        while ticks_diff(ticks_ms(), start) <= self.ready.stale_ms:
+            sleep(self.ready.remaining_ms() / 1000)
+            sample = self.poll()
+            if self.ready.ticks != last:
+                return sample.value
+        self.__warn("'get_measurement' no sample within {} ms".format(self.ready.stale_ms))
+        return None
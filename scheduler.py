@@ -0,0 +1,127 @@
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+from ticks import ticks_ms, ticks_diff
+
+
+class Slot:
+    """Latest value of one sensor and the ticks_ms() at which it was read."""
+
+    __slots__ = ('value', 'ticks', 'count', 'errors')
+
+    def __init__(self):
+        self.value = None
+        self.ticks = None
+        self.count = 0
+        self.errors = 0
+
+    def update(self, value):
+        self.value = value
+        self.ticks = ticks_ms()
+        self.count += 1
+
+    def age_ms(self):
+        """Milliseconds since the value was read, None if there is no value yet."""
+        if self.ticks is None:
+            return None
+        return ticks_diff(ticks_ms(), self.ticks)
+
+
+class Scheduler:
+    """Runs every sensor in its own task at its own rate, each one filling a
+    latest-value Slot, and a publisher task that snapshots the slots every
+    'publish_interval' seconds. The publish cadence no longer depends on the
+    sum of the sensor latencies.
+
+    Host-side example with fake sensor drivers:
+
+    >>> counter = iter(range(1000))
+    >>> scheduler = Scheduler(0.05)
+    >>> scheduler.add_sensor('fast', lambda: next(counter), 0.005)
+    >>> scheduler.add_sensor('slow', lambda: 'reading', 0.02, start=lambda: 10)
+    >>> published = []
+    >>> scheduler.run(published.append, cycles=2)
+    >>> len(published), published[-1]['slow']
+    (2, 'reading')
+    >>> published[-1]['fast'] > published[0]['fast'] > 0
+    True
+    """
+
+    def __init__(self, publish_interval):
+        self.publish_interval = publish_interval
+        self.slots = {}
+        self._sensors = []
+
+    def add_sensor(self, name, read, interval, start=None):
+        """Polls 'read()' every 'interval' seconds into the slot 'name'.
+
+        :param start: optional callable that triggers a conversion and returns
+            how many milliseconds it takes; the task yields for that long
+            before calling 'read()' to collect the result.
+        """
+        slot = Slot()
+        self.slots[name] = slot
+        self._sensors.append((name, slot, read, interval, start))
+
+    def snapshot(self):
+        return {name: slot.value for name, slot in self.slots.items()}
+
+    def ready(self):
+        """True once every sensor has produced at least one value."""
+        for slot in self.slots.values():
+            if slot.count == 0:
+                return False
+        return True
+
+    async def _poll(self, name, slot, read, interval, start):
+        while True:
+            began = ticks_ms()
+            try:
+                if start is not None:
+                    await asyncio.sleep(start() / 1000)
+                slot.update(read())
+            except Exception as e:
+                slot.errors += 1
+                print("{} read error: {}".format(name, e))
+            elapsed = ticks_diff(ticks_ms(), began) / 1000
+            await asyncio.sleep(max(0, interval - elapsed))
+
+    async def _sleep(self, seconds, feed):
+        """Sleeps, calling 'feed()' at least every second."""
+        if feed is None:
+            await asyncio.sleep(seconds)
+            return
+        while seconds > 0:
+            feed()
+            await asyncio.sleep(min(1, seconds))
+            seconds -= 1
+
+    async def _publisher(self, publish, cycles, feed):
+        published = 0
+        while cycles is None or published < cycles:
+            began = ticks_ms()
+            if self.ready():
+                publish(self.snapshot())
+                published += 1
+            elapsed = ticks_diff(ticks_ms(), began) / 1000
+            await self._sleep(max(0, self.publish_interval - elapsed), feed)
+
+    async def _main(self, publish, cycles, feed):
+        tasks = [asyncio.create_task(self._poll(*sensor)) for sensor in self._sensors]
+        try:
+            await self._publisher(publish, cycles, feed)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def run(self, publish, cycles=None, feed=None):
+        """Runs the sensor tasks and calls 'publish(snapshot)' every publish
+        interval, forever or for 'cycles' publishes.
+
+        :param feed: optional callable, e.g. a watchdog's feed(), called at
+            least every second while the publisher waits, whatever the
+            publish interval and whether a snapshot was published.
+        """
+        asyncio.run(self._main(publish, cycles, feed))
@@ -0,0 +1,151 @@
+"""Runs the firmware on CPython against fakes of the board.
+
+install() puts fakes of the MicroPython modules in sys.modules -- machine
+with SoftI2C, UART, RTC and WDT, network.PPP, umqtt.simple.MQTTClient,
+esp32, ntptime, usocket, utime -- and wires them to register-level models of
+the sensors, a scripted modem and a GPS receiver. It also gives the time
+module the MicroPython ticks functions, and makes every sleep advance a
+virtual clock instead of blocking, so the firmware runs at CPU speed. It
+must run before anything imports the firmware::
+
+    import sim
+    board = sim.install(device_config={'payload': 'binary'})
+    from main import AirPoll
+    airpoll = AirPoll()
+    airpoll.modem_connect()
+
+See sim.loop for the publish loop benchmark, and sim.heap for the source
+lines it allocates on::
+
+    python -m sim.loop
+    python -m sim.heap
+"""
+import gc
+import importlib
+import sys
+import time
+
+from sim.clock import clock
+
+# Simulated latencies in ms. The sensors' are per I2C transaction, on top of
+# the time the bytes take on the wire.
+LATENCY = {
+    'sps30': 0,
+    'scd30': 0.5, # clock stretching
+    'bme680': 0,
+    'modem': 20, # per AT response
+    'ppp': 1500, # from connect() to the link being up
+    'ntp': 80,
+    'mqtt_connect': 800,
+    'mqtt_publish': 60,
+}
+
+# Free heap of the ESP32 port after boot, what gc.mem_free() reports on the host
+HEAP_SIZE = 111168
+
+_ALIASES = {
+    'ubinascii': 'binascii',
+    'ustruct': 'struct',
+    'uio': 'io',
+    'ucollections': 'collections',
+    'uasyncio': 'asyncio',
+    'uos': 'os',
+    'ujson': 'json',
+}
+
+_FAKES = {
+    'utime': 'sim.utime',
+    'uhashlib': 'sim.uhashlib',
+    'micropython': 'sim.micropython',
+    'machine': 'sim.machine',
+    'esp32': 'sim.esp32',
+    'network': 'sim.network',
+    'ntptime': 'sim.ntptime',
+    'usocket': 'sim.usocket',
+    'umqtt.simple': 'sim.mqtt',
+    'config': 'sim.config',
+}
+
+_TICKS = ('sleep', 'sleep_ms', 'sleep_us', 'ticks_ms', 'ticks_us', 'ticks_cpu', 'ticks_add', 'ticks_diff')
+
+
+def _mem_free() -> int:
+    import tracemalloc
+    if tracemalloc.is_tracing():
+        return max(0, HEAP_SIZE - tracemalloc.get_traced_memory()[0])
+    return HEAP_SIZE
+
+
+def _import_rsa() -> None:
+    """third_party.rsa.key uses third_party.rsa.prime as a default argument
+    while third_party.rsa is still being imported. MicroPython allows that,
+    CPython only once the package is bound to its parent, so bind it before
+    running it."""
+    if 'third_party.rsa' in sys.modules:
+        return
+    import importlib.util
+    import third_party
+    spec = importlib.util.find_spec('third_party.rsa')
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    third_party.rsa = module
+    spec.loader.exec_module(module)
+
+
+class Board:
+    """The fakes of one simulated device, wired up by install()."""
+
+    def __init__(self, latency: dict):
+        from sim import machine, network, usocket
+        from sim.mqtt import broker
+        from sim.sensors import SPS30Device, SCD30Device, BME680Device
+        from sim.serial import ScriptedUART, GPSReceiver, modem_script
+        self.clock = clock
+        self.sps30 = SPS30Device(latency['sps30'])
+        self.scd30 = SCD30Device(latency['scd30'])
+        self.bme680 = BME680Device(latency['bme680'])
+        self.modem = ScriptedUART(modem_script(), latency_ms=latency['modem'], echo=True)
+        self.gps = GPSReceiver()
+        self.broker = broker
+        broker.reset(latency['mqtt_connect'], latency['mqtt_publish'])
+        machine.i2c_devices = {device.address: device for device in (self.sps30, self.scd30, self.bme680)}
+        machine.uart_devices = {1: self.modem, 2: self.gps}
+        machine._reset_cause = machine.PWRON_RESET
+        machine._rtc_memory = b''
+        network.CONNECT_MS = latency['ppp']
+        usocket.ROUND_TRIP_MS = latency['ntp']
+
+
+def install(device_config: dict = None, latency: dict = None) -> Board:
+    """Installs the fakes and powers a fresh board on. 'latency' overrides
+    entries of LATENCY. Calling it again starts over with a new board and a
+    new AirPoll."""
+    for name, target in _ALIASES.items():
+        sys.modules.setdefault(name, importlib.import_module(target))
+    for name, target in _FAKES.items():
+        if name == 'config':
+            _import_rsa() # the simulated config carries an RSA test key
+        sys.modules[name] = importlib.import_module(target)
+    umqtt = sys.modules.get('umqtt')
+    if umqtt is None:
+        umqtt = sys.modules['umqtt'] = type(sys)('umqtt')
+    umqtt.simple = sys.modules['umqtt.simple']
+    sys.modules['config'].device_config = dict(device_config or {})
+
+    for name in _TICKS:
+        setattr(time, name, getattr(clock, name))
+    if not hasattr(gc, 'mem_free'):
+        gc.mem_free = _mem_free
+
+    # Start over: a new AirPoll singleton and new shared I2C buses
+    sys.modules.pop('main', None)
+    # ticks binds the time functions when imported, which may have been
+    # before they were patched, e.g. by bench.timing
+    sys.modules.pop('ticks', None)
+    bus = sys.modules.get('i2c.bus')
+    if bus is not None:
+        bus._buses.clear()
+    clock.reset()
+    settings = dict(LATENCY)
+    settings.update(latency or {})
+    return Board(settings)
@@ -0,0 +1,79 @@
+"""Virtual clock shared by every fake.
+
+Sleeping advances the clock instead of blocking, so a loop that waits seconds
+for the sensors runs at CPU speed on the host, while the ticks seen by the
+firmware still grow by the real elapsed time plus every simulated wait.
+Ticks wrap around like MicroPython's, at 2**30.
+
+>>> clock = Clock()
+>>> start = clock.ticks_ms()
+>>> clock.sleep(7)
+>>> 7000 <= clock.ticks_diff(clock.ticks_ms(), start) < 7100
+True
+>>> clock.ticks_diff(clock.ticks_add(TICKS_MAX, 5), TICKS_MAX)
+5
+"""
+import time
+
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+_TICKS_HALF = TICKS_PERIOD >> 1
+
+# MicroPython's epoch, 2000-01-01, in Unix seconds
+J2000 = 946684800
+
+# The real ones, kept before install() replaces time.sleep
+_perf_counter = time.perf_counter
+_time = time.time
+
+
+class Clock:
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.skipped = 0.0 # seconds of simulated waits
+        self.wall = _time() - J2000 - _perf_counter() # J2000 seconds at monotonic() 0
+
+    def monotonic(self) -> float:
+        """Seconds, real elapsed time plus simulated waits."""
+        return _perf_counter() + self.skipped
+
+    def sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            self.skipped += seconds
+
+    def sleep_ms(self, ms: int) -> None:
+        self.sleep(ms / 1000)
+
+    def sleep_us(self, us: int) -> None:
+        self.sleep(us / 1000000)
+
+    def ticks_ms(self) -> int:
+        return int(self.monotonic() * 1000) & TICKS_MAX
+
+    def ticks_us(self) -> int:
+        return int(self.monotonic() * 1000000) & TICKS_MAX
+
+    def ticks_cpu(self) -> int:
+        return self.ticks_us()
+
+    @staticmethod
+    def ticks_add(ticks: int, delta: int) -> int:
+        return (ticks + delta) & TICKS_MAX
+
+    @staticmethod
+    def ticks_diff(end: int, start: int) -> int:
+        return ((end - start + _TICKS_HALF) & TICKS_MAX) - _TICKS_HALF
+
+    def time(self) -> int:
+        """Seconds since 2000-01-01, like utime.time() on the ESP32."""
+        return int(self.wall + self.monotonic())
+
+    def settime(self, seconds: float) -> None:
+        """Sets the wall clock, in seconds since 2000-01-01."""
+        self.wall = seconds - self.monotonic()
+
+
+clock = Clock()
@@ -0,0 +1,21 @@
+"""config of the simulated device, install() sets device_config."""
+from bench.rsa_sign import load_test_key
+
+_key = load_test_key(1024) # throw-away test key
+
+google_cloud_config = {
+    'project_id': 'airpoll-sim',
+    'cloud_region': 'europe-west1',
+    'registry_id': 'sim-registry',
+    'device_id': 'sim-device',
+    'mqtt_bridge_hostname': 'mqtt.googleapis.com',
+    'mqtt_bridge_port': 8883,
+}
+
+jwt_config = {
+    'algorithm': 'RS256',
+    'token_ttl': 43200,
+    'private_key': (_key.n, _key.e, _key.d, _key.p, _key.q),
+}
+
+device_config = {}
@@ -0,0 +1,25 @@
+"""esp32 on the host."""
+import random
+
+_rng = random.Random(5)
+
+
+def raw_temperature() -> int:
+    """Internal sensor in degrees Fahrenheit, a warm chip in a case."""
+    return 124 + _rng.randrange(8)
+
+
+def hall_sensor() -> int:
+    return _rng.randrange(-20, 20)
+
+
+HEAP_DATA = 4
+HEAP_EXEC = 1
+
+# (total, free, largest free block, minimum free) of the IDF heap regions
+# outside the MicroPython heap, as after a TLS connection is up
+_heap_regions = [(113200, 34500, 17400, 21200), (15072, 3920, 3840, 3920)]
+
+
+def idf_heap_info(capabilities: int) -> list:
+    return list(_heap_regions)
@@ -0,0 +1,159 @@
+"""Attributes the allocations of the publish loop to source lines.
+
+Runs the loop of sim.loop under tracemalloc with a line tracer on the
+drivers and main.py. Every executed line is charged the peak growth of the
+traced memory while it ran, so temporaries freed before the line ends count
+too, as they do on the device until the next collection. Calls into modules
+that are not traced, struct or json for instance, are charged to the calling
+line, except calls into the simulation itself: what the fakes of the board
+allocate is not the firmware's. CPython objects are larger than
+MicroPython's, so the figures rank the lines rather than predict the
+device's bytes; see memory.HeapMonitor for those.
+
+Runs on a host::
+
+    python -m sim.heap [cycles] [json|binary]
+"""
+import contextlib
+import linecache
+import os
+import sys
+import tracemalloc
+
+from sim import loop
+
+FILES = ('sps30.py', 'scd30.py', 'bme680.py', 'main.py')
+
+_SIM = os.path.dirname(os.path.abspath(__file__))
+
+
+class LineAllocations:
+
+    def __init__(self, files=FILES):
+        self.files = files
+        self.lines = {} # (path, line) -> [runs, bytes]
+        self.__line = None # the line running
+        self.__start = 0
+        self.__run = 0 # 1 when the line started, 0 when it resumed after a call
+
+    def __traced(self, frame) -> bool:
+        return os.path.basename(frame.f_code.co_filename) in self.files
+
+    def __close(self) -> None:
+        if self.__line is None:
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        counters = self.lines.get(self.__line)
+        if counters is None:
+            counters = self.lines[self.__line] = [0, 0]
+        counters[0] += self.__run
+        counters[1] += peak - self.__start
+        self.__line = None
+
+    def __open(self, frame, run: int = 0) -> None:
+        self.__line = (frame.f_code.co_filename, frame.f_lineno)
+        self.__run = run
+        tracemalloc.reset_peak()
+        self.__start = tracemalloc.get_traced_memory()[0]
+
+    def __resume(self, frame) -> None:
+        """Charges what follows to the line of the innermost traced caller."""
+        while frame is not None:
+            if self.__traced(frame):
+                self.__open(frame)
+                return
+            if os.path.dirname(frame.f_code.co_filename) == _SIM:
+                return
+            frame = frame.f_back
+
+    def __global(self, frame, event, arg):
+        if self.__traced(frame):
+            return self.__local
+        if os.path.dirname(frame.f_code.co_filename) == _SIM:
+            self.__close()
+            return self.__sim
+        return None
+
+    def __local(self, frame, event, arg):
+        if event == 'line':
+            self.__close()
+            self.__open(frame, 1)
+        elif event == 'return':
+            self.__close()
+            self.__resume(frame.f_back) # what the caller does with the result
+        return self.__local
+
+    def __sim(self, frame, event, arg):
+        if event == 'return':
+            self.__resume(frame.f_back)
+        return self.__sim
+
+    @contextlib.contextmanager
+    def trace(self):
+        tracemalloc.start()
+        sys.settrace(self.__global)
+        try:
+            yield self
+        finally:
+            sys.settrace(None)
+            self.__close()
+            tracemalloc.stop()
+
+    def files_total(self) -> dict:
+        totals = {}
+        for (path, _), (_, allocated) in self.lines.items():
+            name = os.path.basename(path)
+            totals[name] = totals.get(name, 0) + allocated
+        return totals
+
+    def report(self, cycles: int, top: int = 25) -> None:
+        print('{:<12} {:>10}'.format('file', 'B/cycle'))
+        for name, allocated in sorted(self.files_total().items(), key=lambda item: -item[1]):
+            print('{:<12} {:>10.0f}'.format(name, allocated / cycles))
+        print()
+        print('{:<18} {:>8} {:>10}  {}'.format('line', 'runs', 'B/cycle', 'source'))
+        ranked = sorted(self.lines.items(), key=lambda item: -item[1][1])[:top]
+        for (path, line), (runs, allocated) in ranked:
+            print('{:<18} {:>8.1f} {:>10.0f}  {}'.format(
+                '{}:{}'.format(os.path.basename(path), line), runs / cycles, allocated / cycles,
+                linecache.getline(path, line).strip()[:60]))
+
+
+def traced_loop(airpoll, cycles: int) -> LineAllocations:
+    allocations = LineAllocations()
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        with allocations.trace():
+            for _ in range(cycles):
+                airpoll.publish_cycle()
+    return allocations
+
+
+def check(cycles=10):
+    import payload
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        board, airpoll = loop.boot('binary', device_config={'memory': {'interval': 30}})
+    allocations = traced_loop(airpoll, cycles)
+    totals = allocations.files_total()
+    for name in FILES:
+        assert totals.get(name, 0) > 0, (name, totals)
+    rows = [payload.decode(msg) for topic, msg in board.broker.messages if topic.endswith(b'/diagnostics')]
+    assert rows, 'no heap telemetry published'
+    stages = rows[-1]['stages']
+    assert stages['cycle']['count'] > 0 and stages['cycle']['allocated'] > 0, stages
+    assert stages['gc']['collected'] > 0, stages
+    print('heap: ok, {} lines traced, {} telemetry messages'.format(len(allocations.lines), len(rows)))
+
+
+def run(cycles=50, payload='json'):
+    check()
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        board, airpoll = loop.boot(payload)
+        for _ in range(3): # first calls, imports and buffers allocated once
+            airpoll.publish_cycle()
+    allocations = traced_loop(airpoll, cycles)
+    print('{} cycles traced, {} payload'.format(cycles, payload))
+    allocations.report(cycles)
+
+
+if __name__ == '__main__':
+    run(*(int(arg) if arg.isdigit() else arg for arg in sys.argv[1:]))
@@ -0,0 +1,278 @@
+"""End-to-end benchmark of the publish loop on the simulated board.
+
+Boots the firmware the way main() does -- modem attach, NTP, JWT, MQTT,
+sensors -- then runs publish_cycle(), the loop body of
+publish_sensors_data(): compose, publish, the idle work and the sleep until
+the next publish. Every stage is timed in
+host CPU time and in simulated wait time, i.e. bus transfers, sensor
+conversions and network round trips on the virtual clock. A second, shorter
+pass measures each stage with tracemalloc; as in bench.timing, the figure is
+the peak of the bytes a call allocates.
+
+Runs on a host::
+
+    python -m sim.loop [cycles] [json|binary]
+"""
+import contextlib
+import os
+import sys
+import time
+import tracemalloc
+
+import sim
+from sim.clock import clock
+
+perf_counter = time.perf_counter
+
+
+class Stage:
+    __slots__ = ('name', 'calls', 'cpu', 'wait', 'allocated')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.cpu = 0.0 # seconds
+        self.wait = 0.0 # simulated seconds
+        self.allocated = 0 # bytes, summed over the traced calls
+
+    def clear(self) -> None:
+        self.calls = 0
+        self.cpu = self.wait = 0.0
+        self.allocated = 0
+
+
+class Profiler:
+    """Wraps methods of the firmware's objects to account their calls to a stage."""
+
+    def __init__(self):
+        self.stages = []
+        self.tracing = False
+
+    def wrap(self, obj, attr: str, name: str) -> None:
+        func = getattr(obj, attr)
+        stage = Stage(name)
+        self.stages.append(stage)
+
+        def timed(*args, **kwargs):
+            if self.tracing:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+            skipped = clock.skipped
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stage.cpu += perf_counter() - start
+                stage.wait += clock.skipped - skipped
+                stage.calls += 1
+                if self.tracing:
+                    stage.allocated += tracemalloc.get_traced_memory()[1] - before
+
+        setattr(obj, attr, timed)
+
+    def clear(self) -> None:
+        for stage in self.stages:
+            stage.clear()
+
+    def report(self, cycles: int, allocations: bool = False) -> None:
+        if allocations:
+            print('{:<16} {:>10}'.format('stage', 'alloc B'))
+            for stage in self.stages:
+                print('{:<16} {:>10.0f}'.format(stage.name, stage.allocated / cycles))
+            return
+        print('{:<16} {:>8} {:>10} {:>10}'.format('stage', 'calls', 'cpu us', 'wait ms'))
+        cpu = wait = 0.0
+        for stage in self.stages:
+            cpu += stage.cpu
+            wait += stage.wait
+            print('{:<16} {:>8} {:>10.0f} {:>10.1f}'.format(
+                stage.name, stage.calls, stage.cpu * 1e6 / cycles, stage.wait * 1e3 / cycles))
+        print('{:<16} {:>8} {:>10.0f} {:>10.1f}'.format('total', '', cpu * 1e6 / cycles, wait * 1e3 / cycles))
+
+
+def boot(payload: str = 'json', latency: dict = None, device_config: dict = None):
+    """A simulated board with the firmware attached, subscribed and its
+    sensors started, as main() leaves it before its publish loop.
+    'device_config' adds to the config.device_config of the firmware."""
+    device_config = dict(device_config or {})
+    device_config['payload'] = payload
+    board = sim.install(device_config, latency)
+    from main import AirPoll
+    from machine import WDT
+    airpoll = AirPoll()
+    airpoll.modem_connect()
+    airpoll.subscribe()
+    airpoll.sensors_init()
+    airpoll.wdt = WDT(timeout=20000)
+    airpoll.publish_errors = 0
+    return board, airpoll
+
+
+def profile(airpoll) -> Profiler:
+    profiler = Profiler()
+    profiler.wrap(airpoll.bme680, 'start_reading', 'bme680 start')
+    profiler.wrap(airpoll.pm_sensor, 'get_measurement', 'sps30')
+    profiler.wrap(airpoll.co2_sensor, 'get_measurement', 'scd30')
+    profiler.wrap(airpoll.gps, 'update', 'gps')
+    profiler.wrap(airpoll.bme680, 'collect_reading', 'bme680 collect')
+    profiler.wrap(airpoll, 'encode_message', 'encode')
+    profiler.wrap(airpoll, 'publish_message', 'publish')
+    profiler.wrap(airpoll, 'after_publish', 'idle work')
+    return profiler
+
+
+def loop(airpoll, cycles: int) -> None:
+    # The firmware prints every message, on the host that goes nowhere
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        for _ in range(cycles):
+            airpoll.publish_cycle()
+
+
+def check(cycles=20):
+    import payload
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        board, airpoll = boot('binary')
+    loop(airpoll, cycles)
+    assert board.broker.published == cycles, board.broker.published
+    row = payload.decode(board.broker.messages[-1][1])
+    assert 400 < row['scd30_data']['co2_ppm'] < 1000, row
+    assert 20 < row['bme680']['bme680_temperature'] < 26, row
+    assert 950 < row['bme680']['bme680_pressure'] < 1050, row
+    assert row['gps_data'] is not None, row
+    assert board.gps.overruns == 0, board.gps.overruns
+    assert airpoll.wdt.longest < airpoll.wdt.timeout, airpoll.wdt.longest
+    for device in (board.sps30, board.scd30):
+        assert device.crc_errors == 0 and device.unknown == 0, device
+    assert board.scd30.early_reads == 0, board.scd30.early_reads
+    # A sensor that stopped measuring never reports ready: the read gives up
+    board.scd30.measuring = False
+    board.sps30.state = 'idle'
+    for sensor in (airpoll.co2_sensor, airpoll.pm_sensor):
+        start = clock.ticks_ms()
+        with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+            assert sensor.get_measurement() is None, sensor
+        waited = clock.ticks_diff(clock.ticks_ms(), start)
+        assert waited < airpoll.wdt.timeout, (sensor, waited)
+    board.scd30.measuring = True
+    board.sps30.state = 'measuring'
+    print('sim: ok, {} messages, no GPS bytes overrun, no SCD30 response read within {} ms'.format(
+        cycles, board.scd30.READ_DELAY_MS))
+
+
+def _batch_entries(batch: bytes) -> list:
+    import struct
+    from payload import BATCH_HEADER_FORMAT, BATCH_ENTRY_FORMAT
+    count = batch[1]
+    offset = struct.calcsize(BATCH_HEADER_FORMAT)
+    entries = []
+    for _ in range(count):
+        _, length = struct.unpack_from(BATCH_ENTRY_FORMAT, batch, offset)
+        offset += struct.calcsize(BATCH_ENTRY_FORMAT)
+        entries.append(bytes(batch[offset:offset + length]))
+        offset += length
+    return entries
+
+
+def check_spool(records=6):
+    """Fails the broker while spooled records are drained into a batch and
+    checks that every record is still published exactly once, at the time
+    it was taken."""
+    import tempfile
+    import payload
+    config = {
+        'batch': {'max_count': 3, 'max_age': 3600},
+        'spool': {'path': tempfile.mkdtemp(), 'record_size': 256, 'segment_records': 4, 'max_segments': 8},
+        'spool_drain': 4,
+    }
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        board, airpoll = boot('binary', device_config=config)
+        taken = airpoll.timestamp() - 3600 # an hour offline
+        spooled = [payload.encode(airpoll.boot_time, taken + i * 7, 0, None, None, None, None) for i in range(records)]
+        for record in spooled:
+            airpoll.spool.append(record)
+        # The sample is queued, the first drained record, taken before it,
+        # needs a flush, which fails; the cycle spools what was queued
+        board.broker.faults = 1
+        airpoll.publish_cycle()
+        assert board.broker.faults == 0 and airpoll.publish_errors == 1, 'the broker fault was not hit'
+        for _ in range(10):
+            airpoll.publish_cycle()
+        airpoll.flush_batch()
+    published = []
+    for topic, msg in board.broker.messages:
+        if msg[0] == payload.BATCH_VERSION:
+            published += _batch_entries(msg)
+            for row in payload.decode_batch(msg):
+                assert row['sample_time'] == row['timestamp'], row
+    for record in spooled:
+        assert published.count(record) == 1, (record, published.count(record))
+    assert len(airpoll.spool) == 0, len(airpoll.spool)
+    print('sim: ok, {} spooled records published once, at their own time, across a failed drain'.format(records))
+
+
+def check_snapshot(cycles=5):
+    """Publishes scheduler snapshots with the stage timing and the heap
+    monitor on, and checks that the encode stage is accounted."""
+    from latency import ENCODE
+    config = {'latency': {'interval': 600}, 'memory': {'interval': 600}}
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        board, airpoll = boot('binary', device_config=config)
+        for _ in range(cycles):
+            airpoll.bme680.start_reading()
+            snapshot = {
+                'sps30': airpoll.pm_sensor.poll(),
+                'scd30': airpoll.co2_sensor.poll(),
+                'gps': airpoll.gps.update(airpoll.gps_uart),
+                'bme680': airpoll.bme680.collect_reading(),
+            }
+            airpoll.publish_snapshot(snapshot)
+            time.sleep(airpoll.PUBLISH_INTERVAL)
+    published = board.broker.published # none until both sensors have a sample
+    assert published, 'no snapshot published'
+    assert airpoll.latency.count[ENCODE] == published, airpoll.latency.count[ENCODE]
+    assert airpoll.heap.count[ENCODE] == published, airpoll.heap.count[ENCODE]
+    print('sim: ok, {} snapshots timed'.format(published))
+
+
+def check_interval(cycles=3, interval=30):
+    """Publishes with an interval longer than the watchdog timeout."""
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        board, airpoll = boot('binary', device_config={'publish_interval': interval})
+        loop(airpoll, cycles)
+    assert board.broker.published == cycles, board.broker.published
+    assert airpoll.wdt.longest < airpoll.wdt.timeout, airpoll.wdt.longest
+    print('sim: ok, {} s publish interval, watchdog fed at most {} ms apart'.format(interval, airpoll.wdt.longest))
+
+
+def run(cycles=2000, payload='json'):
+    check()
+    check_spool()
+    check_snapshot()
+    check_interval()
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        board, airpoll = boot(payload)
+    print('boot: {:.1f} s simulated'.format(clock.skipped))
+    profiler = profile(airpoll)
+    skipped = clock.skipped
+    start = perf_counter()
+    loop(airpoll, cycles)
+    elapsed = perf_counter() - start
+    print('{} cycles, {} payload, {:.1f} s on the host, {:.0f} s simulated'.format(
+        cycles, payload, elapsed, clock.skipped - skipped))
+    profiler.report(cycles)
+
+    traced = max(1, cycles // 10)
+    profiler.clear()
+    profiler.tracing = True
+    tracemalloc.start()
+    try:
+        loop(airpoll, traced)
+    finally:
+        tracemalloc.stop()
+        profiler.tracing = False
+    print('{} cycles traced'.format(traced))
+    profiler.report(traced, allocations=True)
+
+
+if __name__ == '__main__':
+    run(*(int(arg) if arg.isdigit() else arg for arg in sys.argv[1:]))
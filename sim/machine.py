@@ -0,0 +1,226 @@
+"""machine on the host.
+
+The I2C buses talk to the models in 'i2c_devices', keyed by address, and
+every transaction costs its time on the wire at the bus frequency plus the
+device's latency, on the virtual clock. UART(n) is bound to 'uart_devices[n]'.
+reset() and deepsleep() end the run by raising Reset and DeepSleep, which
+derive from SystemExit so the firmware's 'except Exception' does not catch
+them, as nothing catches a reset on the device. RTC memory survives both.
+"""
+from sim.clock import clock
+from sim import utime
+
+PWRON_RESET = 1
+HARD_RESET = 2
+WDT_RESET = 3
+DEEPSLEEP_RESET = 4
+SOFT_RESET = 5
+
+# Set by sim.install()
+i2c_devices = {}
+uart_devices = {}
+
+_reset_cause = PWRON_RESET
+_rtc_memory = b''
+
+
+class Reset(SystemExit):
+    pass
+
+
+class DeepSleep(SystemExit):
+    def __init__(self, ms: int):
+        super().__init__(ms)
+        self.ms = ms
+
+
+def reset():
+    global _reset_cause
+    _reset_cause = HARD_RESET
+    raise Reset()
+
+
+def soft_reset():
+    global _reset_cause
+    _reset_cause = SOFT_RESET
+    raise Reset()
+
+
+def deepsleep(ms: int = 0):
+    global _reset_cause
+    _reset_cause = DEEPSLEEP_RESET
+    clock.sleep_ms(ms)
+    raise DeepSleep(ms)
+
+
+def lightsleep(ms: int = 0):
+    clock.sleep_ms(ms)
+
+
+def reset_cause() -> int:
+    return _reset_cause
+
+
+def freq(hz: int = None):
+    return 240000000
+
+
+def unique_id() -> bytes:
+    return b'\x24\x0a\xc4\x5f\x1e\x30'
+
+
+def idle():
+    pass
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self._value = value or 0
+
+    def init(self, mode=-1, pull=-1, value=None):
+        if value is not None:
+            self._value = value
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = 1 if value else 0
+
+    __call__ = value
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+
+class SoftI2C:
+
+    def __init__(self, scl=None, sda=None, freq: int = 400000, timeout: int = 50000):
+        self.init(scl, sda, freq)
+        self.transactions = 0
+        self.bytes = 0
+
+    def init(self, scl=None, sda=None, freq: int = 400000, timeout: int = 50000):
+        self.freq = freq
+
+    def scan(self) -> list:
+        return sorted(i2c_devices)
+
+    def __device(self, addr: int, nbytes: int):
+        device = i2c_devices.get(addr)
+        if device is None:
+            raise OSError(19) # ENODEV, the address is not acknowledged
+        # Start, address and ack, then nine clocks per byte
+        clock.sleep(9 * (nbytes + 1) / self.freq + device.latency_ms / 1000)
+        self.transactions += 1
+        self.bytes += nbytes
+        device.transactions += 1
+        return device
+
+    def writeto(self, addr: int, buf, stop: bool = True) -> int:
+        self.__device(addr, len(buf)).write(buf)
+        return len(buf)
+
+    def readfrom_into(self, addr: int, buf, stop: bool = True) -> None:
+        buf[:] = self.__device(addr, len(buf)).read(len(buf))
+
+    def readfrom(self, addr: int, nbytes: int, stop: bool = True) -> bytes:
+        return self.__device(addr, nbytes).read(nbytes)
+
+    def writeto_mem(self, addr: int, memaddr: int, buf, addrsize: int = 8) -> None:
+        self.__device(addr, len(buf) + 1).write_register(memaddr, buf)
+
+    def readfrom_mem_into(self, addr: int, memaddr: int, buf, addrsize: int = 8) -> None:
+        buf[:] = self.__device(addr, len(buf) + 2).read_register(memaddr, len(buf))
+
+    def readfrom_mem(self, addr: int, memaddr: int, nbytes: int, addrsize: int = 8) -> bytes:
+        return self.__device(addr, nbytes + 2).read_register(memaddr, nbytes)
+
+
+class I2C(SoftI2C):
+    """The two hardware controllers of the ESP32."""
+
+    def __init__(self, id: int, scl=None, sda=None, freq: int = 400000, timeout: int = 50000):
+        if id not in (0, 1):
+            raise ValueError('I2C({}) does not exist'.format(id))
+        self.id = id
+        super().__init__(scl, sda, freq, timeout)
+
+
+class UART:
+
+    def __init__(self, id: int, baudrate: int = 115200, **kwargs):
+        if id not in uart_devices:
+            raise ValueError('UART({}) does not exist'.format(id))
+        self.id = id
+        self.device = uart_devices[id]
+        self.init(baudrate, **kwargs)
+
+    def init(self, baudrate: int = 115200, **kwargs):
+        self.device.init(baudrate=baudrate, **kwargs)
+
+    def any(self) -> int:
+        return self.device.any()
+
+    def read(self, nbytes: int = None):
+        return self.device.read(nbytes)
+
+    def readinto(self, buf, nbytes: int = None):
+        return self.device.readinto(buf, nbytes)
+
+    def write(self, data) -> int:
+        return self.device.write(data)
+
+    def deinit(self):
+        pass
+
+
+class RTC:
+
+    def init(self, datetime):
+        self.datetime(datetime)
+
+    def datetime(self, datetime=None):
+        """(year, month, day, weekday, hours, minutes, seconds, subseconds)"""
+        if datetime is not None:
+            year, month, day, weekday, hours, minutes, seconds = datetime[:7]
+            clock.settime(utime.mktime((year, month, day, hours, minutes, seconds)))
+            return
+        t = utime.gmtime()
+        return (t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0)
+
+    def memory(self, data=None):
+        global _rtc_memory
+        if data is None:
+            return _rtc_memory
+        _rtc_memory = bytes(data)
+
+
+class WDT:
+    """Resets the board when it is fed later than 'timeout' ms after the
+    previous feed. The check happens at the feed, so a loop that never feeds
+    again goes unnoticed; 'longest' is the longest gap seen, in ms."""
+
+    def __init__(self, id: int = 0, timeout: int = 5000):
+        self.timeout = timeout
+        self.fed = clock.ticks_ms()
+        self.longest = 0
+
+    def feed(self):
+        global _reset_cause
+        now = clock.ticks_ms()
+        gap = clock.ticks_diff(now, self.fed)
+        self.longest = max(self.longest, gap)
+        self.fed = now
+        if gap > self.timeout:
+            _reset_cause = WDT_RESET
+            raise Reset()
@@ -0,0 +1,25 @@
+"""micropython on the host."""
+
+
+def const(value):
+    return value
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def mem_info(verbose=False):
+    import gc
+    print('GC: free: {}'.format(gc.mem_free()))
+
+
+def schedule(func, arg):
+    func(arg)
+
+
+def native(func):
+    return func
+
+
+viper = native
@@ -0,0 +1,117 @@
+"""umqtt.simple on the host, talking to an in-memory broker.
+
+The broker keeps counters and the last 'keep' messages, charges every
+connect and publish its round trip on the virtual clock, and fails the next
+'faults' operations with OSError, as a dropped TCP connection does.
+
+>>> broker.reset()
+>>> client = MQTTClient(b'device', 'mqtt.example.com', port=8883, password=b'jwt', ssl=True)
+>>> client.connect()
+0
+>>> client.publish(b'/devices/d/events', b'{}')
+>>> broker.published, broker.messages[-1]
+(1, (b'/devices/d/events', b'{}'))
+>>> broker.faults = 1
+>>> try:
+...     client.publish(b'/devices/d/events', b'{}')
+... except OSError as e:
+...     print(e.args[0])
+104
+"""
+try:
+    from collections import deque
+except ImportError:
+    from ucollections import deque
+
+from sim.clock import clock
+
+
+class MQTTException(Exception):
+    pass
+
+
+class Broker:
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, connect_ms: int = 800, publish_ms: int = 60, keep: int = 100) -> None:
+        self.connect_ms = connect_ms # TCP and TLS handshake, CONNECT and CONNACK
+        self.publish_ms = publish_ms
+        self.faults = 0
+        self.connects = 0
+        self.published = 0
+        self.bytes = 0
+        self.topics = {} # messages per topic
+        self.messages = deque((), keep)
+        self.subscriptions = []
+
+    def fail(self) -> None:
+        if self.faults:
+            self.faults -= 1
+            raise OSError(104, 'ECONNRESET')
+
+
+broker = Broker()
+
+
+class MQTTClient:
+
+    def __init__(self, client_id, server, port=0, user=None, password=None, keepalive=0,
+                 ssl=False, ssl_params={}):
+        self.client_id = client_id
+        self.server = server
+        self.port = port or (8883 if ssl else 1883)
+        self.user = user
+        self.pswd = password
+        self.keepalive = keepalive
+        self.ssl = ssl
+        self.cb = None
+        self.connected = False
+
+    def set_callback(self, f):
+        self.cb = f
+
+    def set_last_will(self, topic, msg, retain=False, qos=0):
+        pass
+
+    def connect(self, clean_session=True) -> int:
+        clock.sleep_ms(broker.connect_ms)
+        broker.fail()
+        broker.connects += 1
+        self.connected = True
+        return 0
+
+    def disconnect(self):
+        if not self.connected:
+            raise OSError(9, 'EBADF')
+        self.connected = False
+
+    def ping(self):
+        self.__check()
+
+    def __check(self):
+        if not self.connected:
+            raise OSError(9, 'EBADF')
+        broker.fail()
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        clock.sleep_ms(broker.publish_ms if qos else broker.publish_ms // 2)
+        self.__check()
+        msg = bytes(msg, 'utf-8') if isinstance(msg, str) else bytes(msg)
+        broker.published += 1
+        broker.bytes += len(msg)
+        broker.topics[topic] = broker.topics.get(topic, 0) + 1
+        broker.messages.append((topic, msg))
+
+    def subscribe(self, topic, qos=0):
+        clock.sleep_ms(broker.publish_ms)
+        self.__check()
+        broker.subscriptions.append(topic)
+
+    def wait_msg(self):
+        self.__check()
+        return None
+
+    def check_msg(self):
+        return None
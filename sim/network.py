@@ -0,0 +1,40 @@
+"""network.PPP on the host: the link is up 'CONNECT_MS' after connect()."""
+from sim.clock import clock
+
+# Set by sim.install()
+CONNECT_MS = 1500
+
+
+class PPP:
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._active = False
+        self.connected_at = None # ticks_ms when the link comes up
+        self.connects = 0
+
+    def active(self, state=None):
+        if state is None:
+            return self._active
+        self._active = bool(state)
+        if not self._active:
+            self.connected_at = None
+
+    def connect(self, authmode=0, username='', password=''):
+        if not self._active:
+            raise OSError('PPP not active')
+        self.connects += 1
+        self.connected_at = clock.ticks_add(clock.ticks_ms(), CONNECT_MS)
+
+    def isconnected(self) -> bool:
+        return self.connected_at is not None and clock.ticks_diff(clock.ticks_ms(), self.connected_at) >= 0
+
+    def drop(self) -> None:
+        """Loses the link, as when the modem leaves data mode."""
+        self.connected_at = None
+
+    def status(self):
+        return 5 if self.isconnected() else 0
+
+    def ifconfig(self):
+        return ('10.64.64.64', '255.255.255.255', '10.64.64.1', '8.8.8.8')
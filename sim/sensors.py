@@ -0,0 +1,376 @@
+"""Register-level models of the sensors on the I2C bus.
+
+Each model answers the same bytes the real part puts on the bus: Sensirion
+16-bit commands with CRC-8 framed words for the SPS30 and the SCD30, and the
+BME680 register file with its calibration block, forced-mode conversions and
+status bits. Samples become available on the virtual clock at the sensor's
+native rate, and a read that comes too early gets the previous sample, as on
+the real parts. Every I2C transaction costs its bus time plus 'latency_ms'
+of the model, e.g. for clock stretching.
+
+>>> from i2c.crc import crc8
+>>> sps30 = SPS30Device()
+>>> sps30.write(b'\\xd1\\x00')
+>>> response = sps30.read(3)
+>>> response[:2], crc8(response, 0, 2) == response[2]
+(b'\\x02\\x03', True)
+"""
+import random
+import struct
+
+from i2c.crc import crc8
+from sim.clock import clock
+
+# MicroPython raises OSError(ENODEV) when a device does not acknowledge
+ENODEV = 19
+
+
+def frame(data) -> bytes:
+    """Sensirion framing: every 16-bit word followed by its CRC-8."""
+    out = bytearray(len(data) // 2 * 3)
+    for i in range(0, len(data) // 2):
+        out[3 * i] = data[2 * i]
+        out[3 * i + 1] = data[2 * i + 1]
+        out[3 * i + 2] = crc8(data, 2 * i, 2 * i + 2)
+    return bytes(out)
+
+
+class Drift:
+    """A value wandering around 'mean' by a bounded random walk, one step per sample."""
+
+    def __init__(self, mean: float, step: float, spread: float, rng):
+        self.mean = mean
+        self.step = step
+        self.spread = spread
+        self.value = mean
+        self.rng = rng
+
+    def next(self) -> float:
+        self.value += self.rng.uniform(-self.step, self.step)
+        self.value = min(max(self.value, self.mean - self.spread), self.mean + self.spread)
+        return self.value
+
+
+class Device:
+    """I2C device on the fake bus, see machine.SoftI2C."""
+    address = None
+
+    def __init__(self, latency_ms: float = 0, seed: int = 1):
+        self.latency_ms = latency_ms
+        self.rng = random.Random(seed)
+        self.transactions = 0
+
+    def write(self, data) -> None:
+        raise OSError(ENODEV)
+
+    def read(self, nbytes: int) -> bytes:
+        raise OSError(ENODEV)
+
+    def write_register(self, register: int, data) -> None:
+        raise OSError(ENODEV)
+
+    def read_register(self, register: int, nbytes: int) -> bytes:
+        raise OSError(ENODEV)
+
+
+class SensirionDevice(Device):
+    """Command interface shared by the SPS30 and the SCD30: a 16-bit command,
+    optionally followed by CRC-framed argument words, then a read of the
+    CRC-framed response."""
+
+    def __init__(self, latency_ms: float = 0, seed: int = 1):
+        super().__init__(latency_ms, seed)
+        self.response = b''
+        self.crc_errors = 0 # argument words with a wrong CRC
+        self.unknown = 0 # commands the part does not implement
+
+    def write(self, data) -> None:
+        data = bytes(data)
+        if len(data) < 2:
+            raise OSError(ENODEV)
+        arguments = []
+        for i in range(2, len(data) - 2, 3):
+            if crc8(data, i, i + 2) != data[i + 2]:
+                self.crc_errors += 1
+                self.response = b''
+                return # the part ignores the command
+            arguments.append(data[i] << 8 | data[i + 1])
+        self.response = self.command(data[0] << 8 | data[1], arguments)
+
+    def read(self, nbytes: int) -> bytes:
+        # Bytes past the end of the response read as 0xFF, like a released bus
+        return (self.response + b'\xff' * nbytes)[:nbytes]
+
+    def command(self, command: int, arguments: list) -> bytes:
+        self.unknown += 1
+        return b''
+
+
+class SPS30Device(SensirionDevice):
+    """Sensirion SPS30 particulate matter sensor at 0x69, one sample per second."""
+    address = 0x69
+    INTERVAL_MS = 1000
+    FLOAT = 0x03
+    INTEGER = 0x05
+
+    def __init__(self, latency_ms: float = 0, seed: int = 1):
+        super().__init__(latency_ms, seed)
+        self.state = 'idle' # 'measuring' or 'sleep'
+        self.waking = False
+        self.format = self.FLOAT
+        self.started = 0
+        self.read_index = 0 # index of the last sample read
+        self.auto_cleaning = 604800
+        self.values = (0.0,) * 10
+        self.pm25 = Drift(8.0, 0.6, 6.0, self.rng)
+
+    def write(self, data) -> None:
+        if self.state == 'sleep':
+            # Only a wake-up is accepted in sleep mode, and only its second
+            # attempt, the first one wakes the interface up but is not acknowledged
+            if bytes(data[:2]) != b'\x11\x03':
+                raise OSError(ENODEV)
+            if not self.waking:
+                self.waking = True
+                raise OSError(ENODEV)
+            self.waking = False
+        super().write(data)
+
+    def sample_index(self) -> int:
+        """Samples taken since the measurement was started."""
+        if self.state != 'measuring':
+            return self.read_index
+        return clock.ticks_diff(clock.ticks_ms(), self.started) // self.INTERVAL_MS
+
+    def measure(self) -> tuple:
+        mass = self.pm25.next()
+        return (mass * 0.78, mass, mass * 1.09, mass * 1.13,  # pm1.0, pm2.5, pm4.0, pm10 ug/m3
+                mass * 6.3, mass * 7.4, mass * 7.5, mass * 7.51, mass * 7.52,  # pm0.5 .. pm10 #/cm3
+                0.48 + self.rng.uniform(0, 0.1))  # typical particle size um
+
+    def command(self, command: int, arguments: list) -> bytes:
+        if command == 0x0010: # start measurement
+            self.state = 'measuring'
+            self.format = (arguments[0] >> 8) if arguments else self.FLOAT
+            self.started = clock.ticks_ms()
+            self.read_index = 0
+            self.values = (0.0,) * 10
+            return b''
+        if command == 0x0104: # stop measurement
+            self.state = 'idle'
+            return b''
+        if command == 0x0202: # read data-ready flag
+            return frame(bytes((0, 1 if self.sample_index() > self.read_index else 0)))
+        if command == 0x0300: # read measured values, the previous ones if there is no new sample
+            index = self.sample_index()
+            if index > self.read_index:
+                self.read_index = index
+                self.values = self.measure()
+            if self.format == self.INTEGER:
+                return frame(struct.pack('>10H', *(min(int(v), 0xFFFF) for v in self.values)))
+            return frame(struct.pack('>10f', *self.values))
+        if command == 0x1001: # sleep, only from idle
+            if self.state == 'idle':
+                self.state = 'sleep'
+            return b''
+        if command == 0x1103: # wake-up
+            if self.state == 'sleep':
+                self.state = 'idle'
+            return b''
+        if command == 0x5607: # start fan cleaning
+            return b''
+        if command == 0x8004: # auto cleaning interval
+            if len(arguments) == 2:
+                self.auto_cleaning = arguments[0] << 16 | arguments[1]
+            return frame(struct.pack('>I', self.auto_cleaning))
+        if command == 0xD002: # product type
+            return frame(b'00080000')
+        if command == 0xD033: # serial number
+            return frame(b'A1B2C3D4E5F60708'.ljust(32, b'\x00'))
+        if command == 0xD100: # firmware version
+            return frame(b'\x02\x03')
+        if command == 0xD206: # status register, no fan, laser or speed warning
+            return frame(b'\x00\x00\x00\x00')
+        if command == 0xD210: # clear status register
+            return b''
+        if command == 0xD304: # reset
+            self.state = 'idle'
+            return b''
+        return super().command(command, arguments)
+
+
+class SCD30Device(SensirionDevice):
+    """Sensirion SCD30 CO2 sensor at 0x61, one sample every measurement interval."""
+    address = 0x61
+    # Minimum time between a read command and reading its response
+    READ_DELAY_MS = 3
+
+    def __init__(self, latency_ms: float = 0, seed: int = 2):
+        super().__init__(latency_ms, seed)
+        self.measuring = False
+        self.interval = 2
+        self.started = 0
+        self.read_index = 0
+        self.written = 0
+        self.early_reads = 0 # responses read before READ_DELAY_MS
+        self.values = (0.0, 0.0, 0.0)
+        self.co2 = Drift(620.0, 12.0, 250.0, self.rng)
+        self.temperature = Drift(23.0, 0.05, 2.0, self.rng)
+        self.humidity = Drift(42.0, 0.2, 8.0, self.rng)
+
+    def write(self, data) -> None:
+        self.written = clock.ticks_ms()
+        super().write(data)
+
+    def read(self, nbytes: int) -> bytes:
+        if clock.ticks_diff(clock.ticks_ms(), self.written) < self.READ_DELAY_MS:
+            self.early_reads += 1
+        return super().read(nbytes)
+
+    def sample_index(self) -> int:
+        if not self.measuring:
+            return self.read_index
+        return clock.ticks_diff(clock.ticks_ms(), self.started) // (self.interval * 1000)
+
+    def command(self, command: int, arguments: list) -> bytes:
+        if command == 0x0010: # start continuous measurement, with the ambient pressure
+            self.measuring = True
+            self.started = clock.ticks_ms()
+            self.read_index = 0
+            return b''
+        if command == 0x0104: # stop continuous measurement
+            self.measuring = False
+            return b''
+        if command == 0x4600: # measurement interval, in seconds
+            if arguments:
+                self.interval = arguments[0]
+                self.started = clock.ticks_ms()
+                self.read_index = 0
+            return frame(struct.pack('>H', self.interval))
+        if command == 0x0202: # get data-ready status
+            return frame(bytes((0, 1 if self.sample_index() > self.read_index else 0)))
+        if command == 0x0300: # read measurement
+            index = self.sample_index()
+            if index > self.read_index:
+                self.read_index = index
+                self.values = (self.co2.next(), self.temperature.next(), self.humidity.next())
+            return frame(struct.pack('>3f', *self.values))
+        if command == 0xD100: # firmware version
+            return frame(b'\x03\x42')
+        if command in (0x5306, 0x5204, 0x5403, 0x5102): # calibration and offsets
+            return frame(b'\x00\x00')
+        if command == 0xD304: # soft reset
+            self.measuring = False
+            return b''
+        return super().command(command, arguments)
+
+
+# Calibration of the BME680 model, the register bytes are packed from these
+BME680_CALIBRATION = {
+    't1': 26120, 't2': 26330, 't3': 3,
+    'p1': 37069, 'p2': -10363, 'p3': 88, 'p4': 7148, 'p5': -107, 'p6': 30, 'p7': 45,
+    'p8': -2949, 'p9': -2713, 'p10': 30,
+    'h1': 782, 'h2': 1022, 'h3': 0, 'h4': 45, 'h5': 20, 'h6': 120, 'h7': -100,
+    'gh1': -15, 'gh2': -8790, 'gh3': 18,
+    'res_heat_range': 1, 'res_heat_val': 43, 'range_sw_err': 1,
+}
+
+# Raw ADC values of a room at about 23 C, 40 %RH, 1009 hPa with a 100 kOhm gas
+# resistance, for the calibration above
+BME680_ADC = {'pressure': 333025, 'temperature': 491175, 'humidity': 20437, 'gas': 800, 'gas_range': 6}
+
+
+class BME680Device(Device):
+    """Bosch BME680 at 0x77: register file, forced-mode conversions with a
+    duration computed from the oversampling and heater settings, like the chip."""
+    address = 0x77
+
+    def __init__(self, latency_ms: float = 0, seed: int = 3):
+        super().__init__(latency_ms, seed)
+        self.regs = bytearray(256)
+        self.conversion_end = None # ticks_ms when the pending conversion is done
+        self.conversions = 0
+        self.pressure = Drift(BME680_ADC['pressure'], 60, 3000, self.rng)
+        self.temperature = Drift(BME680_ADC['temperature'], 40, 2500, self.rng)
+        self.humidity = Drift(BME680_ADC['humidity'], 15, 1500, self.rng)
+        self.gas = Drift(BME680_ADC['gas'], 2, 60, self.rng)
+        self.reset()
+
+    def reset(self) -> None:
+        regs = self.regs
+        regs[:] = bytes(256)
+        regs[0xD0] = 0x61 # chip id
+        c = BME680_CALIBRATION
+        struct.pack_into('<hbxHhbxhhbbxxhhBx', regs, 0x8A,
+                         c['t2'], c['t3'], c['p1'], c['p2'], c['p3'], c['p4'], c['p5'],
+                         c['p7'], c['p6'], c['p8'], c['p9'], c['p10'])
+        # H2 msb, H2 and H1 low nibbles sharing a byte, H1 msb, then H3..H7
+        regs[0xE1] = c['h2'] >> 4
+        regs[0xE2] = (c['h2'] & 0x0F) << 4 | (c['h1'] & 0x0F)
+        regs[0xE3] = c['h1'] >> 4
+        struct.pack_into('<bbbBbHhbb', regs, 0xE4, c['h3'], c['h4'], c['h5'], c['h6'], c['h7'],
+                         c['t1'], c['gh2'], c['gh1'], c['gh3'])
+        regs[0x00] = c['res_heat_val']
+        regs[0x02] = c['res_heat_range'] << 4
+        regs[0x04] = c['range_sw_err'] << 4
+        self.conversion_end = None
+
+    def duration_ms(self) -> int:
+        """Conversion time from the oversampling and gas settings, Bosch BME68x API formula."""
+        regs = self.regs
+        samples = (0, 1, 2, 4, 8, 16, 16, 16)
+        cycles = samples[regs[0x74] >> 5] + samples[(regs[0x74] >> 2) & 7] + samples[regs[0x72] & 7]
+        duration = (cycles * 1963 + 477 * 4 + 477 * 5 + 500) // 1000 + 1
+        if regs[0x71] & 0x10: # run_gas, the heater is on for gas_wait_0
+            wait = regs[0x64]
+            duration += (wait & 0x3F) << (2 * (wait >> 6))
+        return duration
+
+    def __update(self) -> None:
+        """Completes the pending conversion once its time has passed."""
+        if self.conversion_end is None or clock.ticks_diff(clock.ticks_ms(), self.conversion_end) < 0:
+            return
+        self.conversion_end = None
+        self.conversions += 1
+        regs = self.regs
+        regs[0x74] &= 0xFC # back to sleep mode
+        pressure = int(self.pressure.next())
+        temperature = int(self.temperature.next())
+        humidity = int(self.humidity.next())
+        gas = int(self.gas.next()) & 0x3FF
+        regs[0x1D] = 0x80 # new data, gas measurement index 0
+        regs[0x1F:0x22] = (pressure << 4).to_bytes(3, 'big')
+        regs[0x22:0x25] = (temperature << 4).to_bytes(3, 'big')
+        regs[0x25:0x27] = humidity.to_bytes(2, 'big')
+        regs[0x2A] = gas >> 2
+        # gas_valid and heat_stab, if the heater ran
+        valid = 0x30 if regs[0x71] & 0x10 else 0
+        regs[0x2B] = (gas & 3) << 6 | valid | BME680_ADC['gas_range']
+
+    def __set(self, register: int, value: int) -> None:
+        if register == 0xE0:
+            if value == 0xB6: # soft reset
+                self.reset()
+            return
+        self.regs[register] = value
+        if register == 0x74 and value & 0x03 == 0x01: # forced mode, start a conversion
+            self.regs[0x1D] = 0x20 # measuring, new data cleared
+            self.conversion_end = clock.ticks_add(clock.ticks_ms(), self.duration_ms())
+
+    def write(self, data) -> None:
+        """Burst of (register, value) pairs, the BME680 does not auto-increment on writes."""
+        self.__update()
+        for i in range(0, len(data) - 1, 2):
+            self.__set(data[i], data[i + 1])
+
+    def read(self, nbytes: int) -> bytes:
+        raise OSError(ENODEV) # reads always go through a register address
+
+    def write_register(self, register: int, data) -> None:
+        self.__update()
+        for i, value in enumerate(data):
+            self.__set(register + i, value)
+
+    def read_register(self, register: int, nbytes: int) -> bytes:
+        self.__update()
+        return bytes(self.regs[register:register + nbytes])
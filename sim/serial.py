@@ -0,0 +1,194 @@
+"""Devices on the fake UARTs: a scripted cellular modem and a GPS receiver.
+
+ScriptedUART plays a modem: every command written to it queues the scripted
+response lines, available 'latency_ms' later. A response is either a list of
+lines or a list of such lists, one per successive call, the last repeated.
+Commands without a script answer ERROR.
+
+GPSReceiver sends one epoch of NMEA sentences per second, trickling in at
+the baud rate, into a receive buffer of 'rxbuf' bytes that overruns when it
+is not read in time, like the ESP32 UART driver's.
+
+>>> from sim.clock import clock
+>>> gps = GPSReceiver(fix_after=0)
+>>> clock.sleep(1.5)
+>>> line = gps.read(gps.any()).split(b'\\r\\n')[0]
+>>> line[:7], line[-3:-2]
+(b'$GPGGA,', b'*')
+"""
+from sim.clock import clock
+from sim.utime import gmtime
+
+
+class ScriptedUART:
+
+    def __init__(self, script: dict, latency_ms: int = 0, echo: bool = False):
+        self.script = script
+        self.latency_ms = latency_ms
+        self.echo = echo
+        self.calls = {}
+        self.written = []
+        self.pending = [] # (ticks_ms when available, bytes)
+        self.data = b''
+
+    def __release(self):
+        now = clock.ticks_ms()
+        while self.pending and clock.ticks_diff(now, self.pending[0][0]) >= 0:
+            self.data += self.pending.pop(0)[1]
+
+    def init(self, *args, **kwargs):
+        pass
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.written.append(data)
+        command = data.strip().decode()
+        response = self.script.get(command, ['ERROR'])
+        if response and isinstance(response[0], list):
+            calls = self.calls.get(command, 0)
+            self.calls[command] = calls + 1
+            response = response[min(calls, len(response) - 1)]
+        lines = ([command] if self.echo else []) + response
+        text = ''.join('\r\n{}\r\n'.format(line) for line in lines).encode()
+        self.pending.append((clock.ticks_add(clock.ticks_ms(), self.latency_ms), text))
+        return len(data)
+
+    def any(self) -> int:
+        self.__release()
+        return len(self.data)
+
+    def readinto(self, buf, nbytes=None):
+        self.__release()
+        n = min(len(buf), len(self.data) if nbytes is None else nbytes)
+        buf[:n] = self.data[:n]
+        self.data = self.data[n:]
+        return n or None
+
+    def read(self, nbytes=None):
+        self.__release()
+        n = len(self.data) if nbytes is None else min(nbytes, len(self.data))
+        data, self.data = self.data[:n], self.data[n:]
+        return data or None
+
+
+def modem_script(boot_polls=3, registration_polls=4, apn='uinternet'):
+    """A modem that ignores the first 'boot_polls' ATs and registers on the
+    network after 'registration_polls' queries."""
+    return {
+        'AT': [[]] * boot_polls + [['OK']],
+        'ATE0': ['OK'],
+        'ATH': ['OK'],
+        'ATI': ['Quectel', 'EC21', 'Revision: EC21EFAR06A01M4G', 'OK'],
+        'AT+CPIN?': ['+CPIN: READY', 'OK'],
+        'AT+CREG=0': ['OK'],
+        'AT+CGREG=0': ['OK'],
+        'AT+CREG?': [['+CREG: 0,2', 'OK']] * (registration_polls - 1) + [['+CREG: 0,1', 'OK']],
+        'AT+CGREG?': [['+CGREG: 0,2', 'OK']] + [['RDY', '+CGREG: 0,5', 'OK']],
+        'AT+COPS?': ['+COPS: 0,0,"operator",7', 'OK'],
+        'AT+CSQ': ['+CSQ: 20,99', 'OK'],
+        'AT+QICSGP=1,1,"{}","","",0'.format(apn): ['OK'],
+        'ATD*99#': ['CONNECT 150000000'],
+    }
+
+
+def _checksum(body: str) -> str:
+    checksum = 0
+    for c in body:
+        checksum ^= ord(c)
+    return '${}*{:02X}\r\n'.format(body, checksum)
+
+
+def _coordinate(value: float, width: int, hemispheres: str) -> str:
+    """Decimal degrees to 'ddmm.mmmm,N' (or 'dddmm.mmmm,E')."""
+    degrees = int(abs(value))
+    minutes = (abs(value) - degrees) * 60
+    return '{:0{}d}{:07.4f},{}'.format(degrees, width, minutes, hemispheres[value < 0])
+
+
+class GPSReceiver:
+
+    def __init__(self, latitude: float = 53.3498, longitude: float = -6.2603, altitude: float = 21.4,
+                 fix_after: int = 3, baudrate: int = 9600, rxbuf: int = 256):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.altitude = altitude
+        self.fix_after = fix_after # seconds without a fix after power-up
+        self.baudrate = baudrate
+        self.rxbuf = rxbuf
+        self.started = clock.monotonic()
+        self.epoch = 0 # next epoch to send
+        self.sending = b'' # the epoch being sent and when it started
+        self.sending_at = 0.0
+        self.sent = 0 # bytes of it received so far
+        self.data = bytearray()
+        self.overruns = 0 # bytes dropped on a full receive buffer
+        self.written = 0
+
+    def init(self, baudrate=None, rxbuf=None, **kwargs):
+        if baudrate:
+            self.baudrate = baudrate
+        if rxbuf:
+            self.rxbuf = rxbuf
+
+    def sentences(self, epoch: int, seconds: int) -> bytes:
+        """GGA and RMC of one epoch at 'seconds' since 2000-01-01, without a
+        fix for the first 'fix_after' seconds."""
+        utc = '{:02d}{:02d}{:02d}.00'.format(seconds // 3600 % 24, seconds // 60 % 60, seconds % 60)
+        t = gmtime(seconds)
+        date = '{:02d}{:02d}{:02d}'.format(t[2], t[1], t[0] % 100)
+        if epoch < self.fix_after:
+            return (_checksum('GPGGA,{},,,,,0,00,99.99,,,,,,'.format(utc)) +
+                    _checksum('GPRMC,{},V,,,,,,,{},,,N'.format(utc, date))).encode()
+        # A few metres of wander around the true position
+        wander = ((epoch * 7919) % 13 - 6) * 0.000005
+        latitude = _coordinate(self.latitude + wander, 2, 'NS')
+        longitude = _coordinate(self.longitude - wander, 3, 'EW')
+        return (_checksum('GPGGA,{},{},{},1,09,0.92,{:.1f},M,55.2,M,,'.format(
+                    utc, latitude, longitude, self.altitude + wander * 1000)) +
+                _checksum('GPRMC,{},A,{},{},0.02,,{},,,A'.format(utc, latitude, longitude, date))).encode()
+
+    def __receive(self) -> None:
+        now = clock.monotonic()
+        while True:
+            if self.sent == len(self.sending):
+                start = self.started + self.epoch + 1
+                if now < start:
+                    return
+                self.sending = self.sentences(self.epoch, int(clock.wall + start))
+                self.sending_at = start
+                self.sent = 0
+                self.epoch += 1
+            # Ten bits per byte on the wire
+            arrived = min(len(self.sending), int((now - self.sending_at) * self.baudrate / 10))
+            if arrived <= self.sent:
+                return
+            room = self.rxbuf - len(self.data)
+            chunk = self.sending[self.sent:arrived]
+            self.data += chunk[:room]
+            if len(chunk) > room:
+                self.overruns += len(chunk) - room
+            self.sent = arrived
+
+    def write(self, data):
+        self.written += len(data)
+        return len(data)
+
+    def any(self) -> int:
+        self.__receive()
+        return len(self.data)
+
+    def readinto(self, buf, nbytes=None):
+        self.__receive()
+        n = min(len(buf), len(self.data) if nbytes is None else nbytes)
+        buf[:n] = self.data[:n]
+        del self.data[:n]
+        return n or None
+
+    def read(self, nbytes=None):
+        self.__receive()
+        n = len(self.data) if nbytes is None else min(nbytes, len(self.data))
+        data = bytes(self.data[:n])
+        del self.data[:n]
+        return data or None
+
@@ -0,0 +1,27 @@
+"""uhashlib on the host. MicroPython hashes a str as its UTF-8 bytes, the
+JWT signing relies on it."""
+import hashlib
+
+
+class _Hash:
+
+    def __init__(self, algorithm: str, data=None):
+        self._hash = hashlib.new(algorithm)
+        if data is not None:
+            self.update(data)
+
+    def update(self, data) -> None:
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._hash.update(data)
+
+    def digest(self) -> bytes:
+        return self._hash.digest()
+
+
+def sha256(data=None):
+    return _Hash('sha256', data)
+
+
+def sha1(data=None):
+    return _Hash('sha1', data)
@@ -0,0 +1,52 @@
+"""utime on the virtual clock."""
+import time as _time
+
+from sim.clock import clock, J2000
+
+
+def sleep(seconds):
+    clock.sleep(seconds)
+
+
+def sleep_ms(ms):
+    clock.sleep_ms(ms)
+
+
+def sleep_us(us):
+    clock.sleep_us(us)
+
+
+def ticks_ms():
+    return clock.ticks_ms()
+
+
+def ticks_us():
+    return clock.ticks_us()
+
+
+def ticks_cpu():
+    return clock.ticks_cpu()
+
+
+ticks_add = clock.ticks_add
+ticks_diff = clock.ticks_diff
+
+
+def time():
+    return clock.time()
+
+
+def gmtime(seconds=None):
+    """(year, month, mday, hour, minute, second, weekday, yearday), weekday 0 is Monday."""
+    if seconds is None:
+        seconds = clock.time()
+    t = _time.gmtime(seconds + J2000)
+    return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, t.tm_wday, t.tm_yday)
+
+
+localtime = gmtime
+
+
+def mktime(t):
+    import calendar
+    return calendar.timegm(tuple(t[:6])) - J2000
@@ -0,0 +1,232 @@
+"""Persistent store-and-forward log for samples that could not be published.
+
+Samples are appended as fixed-size records to segment files in 'path'. Every
+segment holds 'segment_records' records and only the newest one is written
+to; full segments are never modified again and are removed once drained, so
+writes move on to new files instead of rewriting the same flash blocks. At
+most 'max_segments' segments are kept, the oldest one is dropped to make
+room.
+
+Record layout, padded to 'record_size':
+
+    header  >BHI      RECORD_MARKER, payload length, CRC-32 of the payload
+    payload
+
+The read cursor is saved after every drain, alternating between two small
+files, each with a generation number and a CRC-32, so a write cut short by
+a power loss leaves the previous cursor intact. Records drained but not yet
+covered by a saved cursor are sent again after a reset.
+
+On start-up only the newest segment is scanned, to find where a record was
+cut short by a power loss; the next append overwrites it. Recovery time
+does not grow with the backlog.
+
+>>> import tempfile
+>>> path = tempfile.mkdtemp()
+>>> log = SegmentLog(path, record_size=32, segment_records=4, max_segments=3)
+>>> for i in range(6):
+...     log.append(b'sample %d' % i)
+>>> len(log), log.segments
+(6, [1, 2])
+
+Power is lost in the middle of writing the seventh record:
+
+>>> with open(path + '/00000002.seg', 'r+b') as f:
+...     _ = f.seek(2 * 32)
+...     _ = f.write(b'\\xa5\\x00\\x08\\x00\\x00')
+>>> log = SegmentLog(path, record_size=32, segment_records=4, max_segments=3)
+>>> len(log)
+6
+>>> log.append(b'sample 6')
+>>> sent = []
+>>> log.drain(sent.append, 5)
+5
+>>> sent[0], sent[-1], log.segments
+(b'sample 0', b'sample 4', [2])
+>>> log = SegmentLog(path, record_size=32, segment_records=4, max_segments=3)
+>>> log.drain(sent.append, 5), sent[-1], len(log)
+(2, b'sample 6', 0)
+"""
+import os
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+try:
+    from ubinascii import crc32
+except ImportError:
+    from binascii import crc32
+
+RECORD_MARKER = 0xA5
+RECORD_HEADER_FORMAT = '>BHI'
+RECORD_HEADER_SIZE = struct.calcsize(RECORD_HEADER_FORMAT)
+
+# generation, segment, record index, CRC-32 of the first three fields
+CURSOR_FORMAT = '>IIII'
+CURSOR_SIZE = struct.calcsize(CURSOR_FORMAT)
+CURSOR_FILES = ('cursor0', 'cursor1')
+
+SEGMENT_SUFFIX = '.seg'
+
+
+class SegmentLog:
+
+    def __init__(self, path: str = '/spool', record_size: int = 1024, segment_records: int = 32, max_segments: int = 8):
+        self.path = path
+        self.record_size = record_size
+        self.segment_records = segment_records
+        self.max_segments = max_segments
+        self.dropped = 0 # records lost because the log was full
+        self.corrupted = 0 # records skipped because their CRC did not match
+        self.__record = bytearray(record_size)
+        try:
+            os.mkdir(path)
+        except OSError:
+            pass # already exists
+        self.recover()
+
+    def __file(self, segment: int) -> str:
+        return '{}/{:08d}{}'.format(self.path, segment, SEGMENT_SUFFIX)
+
+    def __remove_oldest(self) -> None:
+        os.remove(self.__file(self.segments.pop(0)))
+
+    def recover(self) -> None:
+        """Finds the segments, the saved cursor and the end of the newest segment."""
+        self.segments = sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.path)
+                               if name.endswith(SEGMENT_SUFFIX))
+        self.generation, self.read_segment, self.read_index = self.__load_cursor()
+        # Drained segments whose removal was cut short
+        while self.segments and self.segments[0] < self.read_segment:
+            self.__remove_oldest()
+        if self.segments:
+            if self.segments[0] > self.read_segment:
+                # The segment under the cursor was dropped to make room
+                self.read_segment, self.read_index = self.segments[0], 0
+            self.next_segment = self.segments[-1] + 1
+            self.write_index = self.__valid_records(self.segments[-1])
+            if self.read_segment == self.segments[-1]:
+                self.read_index = min(self.read_index, self.write_index)
+        else:
+            self.next_segment = max(self.read_segment, 1)
+            self.read_segment, self.read_index = self.next_segment, 0
+            self.write_index = 0
+
+    def __len__(self) -> int:
+        if not self.segments:
+            return 0
+        return (len(self.segments) - 1) * self.segment_records + self.write_index - self.read_index
+
+    def __load_cursor(self) -> tuple:
+        cursor = (0, 0, 0)
+        for name in CURSOR_FILES:
+            try:
+                with open('{}/{}'.format(self.path, name), 'rb') as f:
+                    data = f.read(CURSOR_SIZE)
+            except OSError:
+                continue
+            if len(data) != CURSOR_SIZE:
+                continue
+            generation, segment, index, crc = struct.unpack(CURSOR_FORMAT, data)
+            if crc == crc32(data[:CURSOR_SIZE - 4]) and generation >= cursor[0]:
+                cursor = (generation, segment, index)
+        return cursor
+
+    def __save_cursor(self) -> None:
+        self.generation += 1
+        data = bytearray(CURSOR_SIZE)
+        struct.pack_into(CURSOR_FORMAT[:-1], data, 0, self.generation, self.read_segment, self.read_index)
+        struct.pack_into('>I', data, CURSOR_SIZE - 4, crc32(data[:CURSOR_SIZE - 4]))
+        with open('{}/{}'.format(self.path, CURSOR_FILES[self.generation % 2]), 'wb') as f:
+            f.write(data)
+
+    def __read_record(self, f):
+        """Payload of the record at the file position, None if it is invalid."""
+        header = f.read(RECORD_HEADER_SIZE)
+        if len(header) != RECORD_HEADER_SIZE:
+            return None
+        marker, length, crc = struct.unpack(RECORD_HEADER_FORMAT, header)
+        if marker != RECORD_MARKER or length > self.record_size - RECORD_HEADER_SIZE:
+            return None
+        payload = f.read(length)
+        if len(payload) != length or crc32(payload) != crc:
+            return None
+        return payload
+
+    def __valid_records(self, segment: int) -> int:
+        count = 0
+        with open(self.__file(segment), 'rb') as f:
+            while count < self.segment_records:
+                f.seek(count * self.record_size)
+                if self.__read_record(f) is None:
+                    break
+                count += 1
+        return count
+
+    def append(self, payload) -> None:
+        length = len(payload)
+        if length > self.record_size - RECORD_HEADER_SIZE:
+            raise ValueError("payload of {} bytes exceeds the record size {}".format(length, self.record_size))
+        if not self.segments or self.write_index == self.segment_records:
+            if len(self.segments) == self.max_segments:
+                self.dropped += self.segment_records - (self.read_index if self.read_segment == self.segments[0] else 0)
+                self.__remove_oldest()
+                self.read_segment = self.segments[0] if self.segments else self.next_segment
+                self.read_index = 0
+            with open(self.__file(self.next_segment), 'wb'):
+                pass
+            self.segments.append(self.next_segment)
+            if len(self.segments) == 1:
+                self.read_segment, self.read_index = self.next_segment, 0
+            self.next_segment += 1
+            self.write_index = 0
+
+        record = self.__record
+        struct.pack_into(RECORD_HEADER_FORMAT, record, 0, RECORD_MARKER, length, crc32(payload))
+        record[RECORD_HEADER_SIZE:RECORD_HEADER_SIZE + length] = payload
+        with open(self.__file(self.segments[-1]), 'r+b') as f:
+            f.seek(self.write_index * self.record_size)
+            f.write(record)
+        self.write_index += 1
+
+    def __advance(self) -> None:
+        self.read_index += 1
+        if self.read_index == self.segment_records:
+            self.__remove_oldest()
+            self.read_segment = self.segments[0] if self.segments else self.next_segment
+            self.read_index = 0
+
+    def drain(self, publish, limit: int) -> int:
+        """Calls 'publish(payload)' for up to 'limit' records, oldest first,
+        and returns how many records were consumed. A record is consumed once
+        'publish' returns; if it raises, the cursor is saved before the
+        exception propagates.
+        """
+        count = 0
+        f = None
+        segment = None
+        try:
+            while count < limit and len(self):
+                if segment != self.read_segment:
+                    if f is not None:
+                        f.close()
+                    segment = self.read_segment
+                    f = open(self.__file(segment), 'rb')
+                f.seek(self.read_index * self.record_size)
+                payload = self.__read_record(f)
+                if payload is None:
+                    self.corrupted += 1
+                else:
+                    publish(payload)
+                if self.read_index + 1 == self.segment_records:
+                    # The segment is removed, close it first
+                    f.close()
+                    f = segment = None
+                self.__advance()
+                count += 1
+        finally:
+            if f is not None:
+                f.close()
+            if count:
+                self.__save_cursor()
+        return count
@@ -1,26 +1,30 @@
 import sys
+import struct
 #``import threading
 #import logging
 from time import sleep
 #from queue import Queue
 #from datetime import datetime
 from i2c.i2c import I2C
+from i2c.crc import crc8, verify_words, strip_crc, CRCError
+from i2c.ready import DataReady, Sample
+from ticks import ticks_ms, ticks_diff
 
 # I2C commands
-CMD_START_MEASUREMENT = [0x00, 0x10]
-CMD_STOP_MEASUREMENT = [0x01, 0x04]
-CMD_READ_DATA_READY_FLAG = [0x02, 0x02]
-CMD_READ_MEASURED_VALUES = [0x03, 0x00]
-CMD_SLEEP = [0x10, 0x01]
-CMD_WAKEUP = [0x11, 0x03]
-CMD_START_FAN_CLEANING = [0x56, 0x07]
-CMD_AUTO_CLEANING_INTERVAL = [0x80, 0x04]
-CMD_PRODUCT_TYPE = [0xD0, 0x02]
-CMD_SERIAL_NUMBER = [0xD0, 0x33]
-CMD_FIRMWARE_VERSION = [0xD1, 0x00]
-CMD_READ_STATUS_REGISTER = [0xD2, 0x06]
-CMD_CLEAR_STATUS_REGISTER = [0xD2, 0x10]
-CMD_RESET = [0xD3, 0x04]
+CMD_START_MEASUREMENT = b'\x00\x10'
+CMD_STOP_MEASUREMENT = b'\x01\x04'
+CMD_READ_DATA_READY_FLAG = b'\x02\x02'
+CMD_READ_MEASURED_VALUES = b'\x03\x00'
+CMD_SLEEP = b'\x10\x01'
+CMD_WAKEUP = b'\x11\x03'
+CMD_START_FAN_CLEANING = b'\x56\x07'
+CMD_AUTO_CLEANING_INTERVAL = b'\x80\x04'
+CMD_PRODUCT_TYPE = b'\xd0\x02'
+CMD_SERIAL_NUMBER = b'\xd0\x33'
+CMD_FIRMWARE_VERSION = b'\xd1\x00'
+CMD_READ_STATUS_REGISTER = b'\xd2\x06'
+CMD_CLEAR_STATUS_REGISTER = b'\xd2\x10'
+CMD_RESET = b'\xd3\x04'
 
 # Length of response in bytes
 NBYTES_READ_DATA_READY_FLAG = 3
@@ -35,6 +39,29 @@ NBYTES_READ_STATUS_REGISTER = 6
 # Packet size including checksum byte [data1, data2, checksum]
 PACKET_SIZE = 3
 
+# The sensor updates its measured values every second
+MEASUREMENT_INTERVAL_MS = 1000
+
+# Layout of the CRC-stripped IEEE754 measurement payload:
+# mass density pm1.0, pm2.5, pm4.0, pm10 (ug/m3),
+# number concentration pm0.5, pm1.0, pm2.5, pm4.0, pm10 (#/cm3),
+# typical particle size (um)
+MEASURED_VALUES_FORMAT = '>10f'
+
+
+def decode_measured_values(payload) -> tuple:
+    """Decodes the 40-byte CRC-stripped IEEE754 measurement payload.
+
+    >>> decode_measured_values(bytes([
+    ...     0x3f, 0xc0, 0, 0, 0x40, 0x10, 0, 0, 0x40, 0x48, 0, 0, 0x40, 0x80, 0, 0,
+    ...     0x41, 0x28, 0, 0, 0x41, 0x30, 0, 0, 0x41, 0x4c, 0, 0, 0x41, 0x50, 0, 0,
+    ...     0x41, 0x60, 0, 0, 0x3f, 0x20, 0, 0]))
+    (1.5, 2.25, 3.125, 4.0, 10.5, 11.0, 12.75, 13.0, 14.0, 0.625)
+    >>> decode_measured_values(bytes([0x3c, 0x23, 0xd7, 0x0a]) + bytes(36))[0]
+    0.009999999776482582
+    """
+    return struct.unpack(MEASURED_VALUES_FORMAT, payload)
+
 # Size of each measurement data packet (PMx) including checksum bytes, in bytes
 SIZE_FLOAT = 6  # IEEE754 float
 SIZE_INTEGER = 3  # unsigned 16 bit integer
@@ -49,6 +76,9 @@ class SPS30:
 
         self.sampling_period = sampling_period
         self.i2c = I2C(bus, address)
+        # CRC-stripped measurement payload, reused on every read
+        self.__payload = bytearray(NBYTES_MEASURED_VALUES_FLOAT * 2 // PACKET_SIZE)
+        self.ready = DataReady(MEASUREMENT_INTERVAL_MS)
         #self.__data = Queue(maxsize=20)
         self.__valid = {
             "mass_density": False,
@@ -57,67 +87,58 @@ class SPS30:
         }
 
     def crc_calc(self, data: list) -> int:
-        crc = 0xFF
-        for i in range(2):
-            crc ^= data[i]
-            for _ in range(8, 0, -1):
-                if crc & 0x80:
-                    crc = (crc << 1) ^ 0x31
-                else:
-                    crc = crc << 1
+        return crc8(data, 0, 2)
+
+    def __warn(self, message: str) -> None:
+        if self.logger:
+            self.logger.warning(message)
+        else:
+            print(message)
 
-        # The checksum only contains 8-bit,
-        # so the calculated value has to be masked with 0xFF
-        return (crc & 0x0000FF)
+    def __verify_words(self, data: list, name: str) -> list:
+        try:
+            return verify_words(data)
+        except CRCError as e:
+            self.__warn("'{}' {}".format(name, e))
+            return None
+
+    def __words_to_str(self, words: list) -> str:
+        return "".join(chr(w >> 8) + chr(w & 0xFF) for w in words)
 
     def firmware_version(self) -> str:
-        self.i2c.write(CMD_FIRMWARE_VERSION)
-        data = self.i2c.read(NBYTES_FIRMWARE_VERSION)
+        data = self.i2c.query(CMD_FIRMWARE_VERSION, NBYTES_FIRMWARE_VERSION)
 
-        if self.crc_calc(data[:2]) != data[2]:
+        if self.crc_calc(data) != data[2]:
             return "CRC mismatched"
 
         return ".".join(map(str, data[:2]))
 
     def product_type(self) -> str:
-        self.i2c.write(CMD_PRODUCT_TYPE)
-        data = self.i2c.read(NBYTES_PRODUCT_TYPE)
-        result = ""
-
-        for i in range(0, NBYTES_PRODUCT_TYPE, 3):
-            if self.crc_calc(data[i:i+2]) != data[i+2]:
-                return "CRC mismatched"
+        data = self.i2c.query(CMD_PRODUCT_TYPE, NBYTES_PRODUCT_TYPE)
 
-            result += "".join(map(chr, data[i:i+2]))
+        words = self.__verify_words(data, "product_type")
+        if words is None:
+            return "CRC mismatched"
 
-        return result
+        return self.__words_to_str(words)
 
     def serial_number(self) -> str:
-        self.i2c.write(CMD_SERIAL_NUMBER)
-        data = self.i2c.read(NBYTES_SERIAL_NUMBER)
-        result = ""
-
-        for i in range(0, NBYTES_SERIAL_NUMBER, PACKET_SIZE):
-            if self.crc_calc(data[i:i+2]) != data[i+2]:
-                return "CRC mismatched"
+        data = self.i2c.query(CMD_SERIAL_NUMBER, NBYTES_SERIAL_NUMBER)
 
-            result += "".join(map(chr, data[i:i+2]))
+        words = self.__verify_words(data, "serial_number")
+        if words is None:
+            return "CRC mismatched"
 
-        return result
+        return self.__words_to_str(words)
 
     def read_status_register(self) -> dict:
-        self.i2c.write(CMD_READ_STATUS_REGISTER)
-        data = self.i2c.read(NBYTES_READ_STATUS_REGISTER)
+        data = self.i2c.query(CMD_READ_STATUS_REGISTER, NBYTES_READ_STATUS_REGISTER)
 
-        status = []
-        for i in range(0, NBYTES_READ_STATUS_REGISTER, PACKET_SIZE):
-            if self.crc_calc(data[i:i+2]) != data[i+2]:
-                return "CRC mismatched"
-
-            status.extend(data[i:i+2])
+        words = self.__verify_words(data, "read_status_register")
+        if words is None:
+            return "CRC mismatched"
 
-        binary = '{:032b}'.format(
-            status[0] << 24 | status[1] << 16 | status[2] << 8 | status[3])
+        binary = '{:032b}'.format(words[0] << 16 | words[1])
         speed_status = "too high/ too low" if int(binary[10]) == 1 else "ok"
         laser_status = "out of range" if int(binary[26]) == 1 else "ok"
         fan_status = "0 rpm" if int(binary[27]) == 1 else "ok"
@@ -132,23 +153,12 @@ class SPS30:
         self.i2c.write(CMD_CLEAR_STATUS_REGISTER)
 
     def read_data_ready_flag(self) -> bool:
-        self.i2c.write(CMD_READ_DATA_READY_FLAG)
-        data = self.i2c.read(NBYTES_READ_DATA_READY_FLAG)
-
-        if self.crc_calc(data[:2]) != data[2]:
-            if self.logger:
-                self.logger.warning(
-                    "'read_data_ready_flag' CRC mismatched!" +
-                    "  Data: {data[:2]}" +
-                    "  Calculated CRC: {self.crc_calc(data[:2])}" +
-                    "  Expected: {data[2]}")
-            else:
-                print(
-                    "'read_data_ready_flag' CRC mismatched!" +
-                    "  Data: {data[:2]}" +
-                    "  Calculated CRC: {self.crc_calc(data[:2])}" +
-                    "  Expected: {data[2]}")
+        data = self.i2c.query(CMD_READ_DATA_READY_FLAG, NBYTES_READ_DATA_READY_FLAG)
 
+        crc = crc8(data, 0, 2)
+        if crc != data[2]:
+            self.__warn("'read_data_ready_flag' CRC mismatched! Calculated 0x{:02x}, expected 0x{:02x}".format(
+                crc, data[2]))
             return False
 
         return True if data[1] == 1 else False
@@ -157,169 +167,98 @@ class SPS30:
         self.i2c.write(CMD_SLEEP)
 
     def wakeup(self) -> None:
+        # In sleep mode the first command only wakes the interface up and
+        # is not acknowledged, the second one is executed
+        try:
+            self.i2c.write(CMD_WAKEUP)
+        except OSError:
+            pass
         self.i2c.write(CMD_WAKEUP)
 
     def start_fan_cleaning(self) -> None:
         self.i2c.write(CMD_START_FAN_CLEANING)
 
     def read_auto_cleaning_interval(self) -> int:
-        self.i2c.write(CMD_AUTO_CLEANING_INTERVAL)
-        data = self.i2c.read(NBYTES_AUTO_CLEANING_INTERVAL)
-
-        interval = []
-        for i in range(0, NBYTES_AUTO_CLEANING_INTERVAL, 3):
-            if self.crc_calc(data[i:i+2]) != data[i+2]:
-                return "CRC mismatched"
+        data = self.i2c.query(CMD_AUTO_CLEANING_INTERVAL, NBYTES_AUTO_CLEANING_INTERVAL)
 
-            interval.extend(data[i:i+2])
+        words = self.__verify_words(data, "read_auto_cleaning_interval")
+        if words is None:
+            return "CRC mismatched"
 
-        return (interval[0] << 24 | interval[1] << 16 | interval[2] << 8 | interval[3])
+        return words[0] << 16 | words[1]
 
     def reset(self) -> None:
         self.i2c.write(CMD_RESET)
 
-    def __ieee754_number_conversion(self, data: int) -> float:
-        binary = "{:032b}".format(data)
-
-        sign = int(binary[0:1])
-        exp = int(binary[1:9], 2) - 127
-        exp = 0 if exp < 0 else exp
-        mantissa = binary[9:]
+    def __measured_values(self, data: list) -> dict:
+        try:
+            values = decode_measured_values(strip_crc(data, self.__payload))
+        except CRCError as e:
+            self.__warn("'__read_measured_value' {}".format(e))
+            for key in self.__valid:
+                self.__valid[key] = False
+            return {
+                "mass_density": {},
+                "particle_count": {},
+                "particle_size": 0.0,
+                "mass_density_unit": "ug/m3",
+                "particle_count_unit": "#/cm3",
+                "particle_size_unit": "um"
+            }
+
+        for key in self.__valid:
+            self.__valid[key] = True
 
-        real = int(('1' + mantissa[:exp]), 2)
-        decimal = mantissa[exp:]
-
-        dec = 0.0
-        for i in range(len(decimal)):
-            dec += int(decimal[i]) / (2**(i+1))
-
-        return round((((-1)**(sign) * real) + dec), 3)
-
-    def __mass_density_measurement(self, data: list) -> dict:
-        category = ["pm1.0", "pm2.5", "pm4.0", "pm10"]
-
-        density = {
-            "pm1.0": 0.0,
-            "pm2.5": 0.0,
-            "pm4.0": 0.0,
-            "pm10": 0.0
-        }
-
-        for block, (pm) in enumerate(category):
-            pm_data = []
-            for i in range(0, SIZE_FLOAT, PACKET_SIZE):
-                offset = (block * SIZE_FLOAT) + i
-                if self.crc_calc(data[offset:offset+2]) != data[offset+2]:
-                    if self.logger:
-                        self.logger.warning(
-                            "'__mass_density_measurement' CRC mismatched!" +
-                            "  Data: {data[offset:offset+2]}" +
-                            "  Calculated CRC: {self.crc_calc(data[offset:offset+2])}" +
-                            "  Expected: {data[offset+2]}")
-                    else:
-                        print(
-                            "'__mass_density_measurement' CRC mismatched!" +
-                            "  Data: {data[offset:offset+2]}" +
-                            "  Calculated CRC: {self.crc_calc(data[offset:offset+2])}" +
-                            "  Expected: {data[offset+2]}")
-                    self.__valid["mass_density"] = False
-                    return {}
-
-                pm_data.extend(data[offset:offset+2])
-
-            density[pm] = self.__ieee754_number_conversion(
-                pm_data[0] << 24 | pm_data[1] << 16 | pm_data[2] << 8 | pm_data[3])
-
-        self.__valid["mass_density"] = True
-
-        return density
-
-    def __particle_count_measurement(self, data: list) -> dict:
-        category = ["pm0.5", "pm1.0", "pm2.5", "pm4.0", "pm10"]
-
-        count = {
-            "pm0.5": 0.0,
-            "pm1.0": 0.0,
-            "pm2.5": 0.0,
-            "pm4.0": 0.0,
-            "pm10": 0.0
+        return {
+            "mass_density": {
+                "pm1.0": round(values[0], 3),
+                "pm2.5": round(values[1], 3),
+                "pm4.0": round(values[2], 3),
+                "pm10": round(values[3], 3)
+            },
+            "particle_count": {
+                "pm0.5": round(values[4], 3),
+                "pm1.0": round(values[5], 3),
+                "pm2.5": round(values[6], 3),
+                "pm4.0": round(values[7], 3),
+                "pm10": round(values[8], 3)
+            },
+            "particle_size": round(values[9], 3),
+            "mass_density_unit": "ug/m3",
+            "particle_count_unit": "#/cm3",
+            "particle_size_unit": "um"
         }
 
-        for block, (pm) in enumerate(category):
-            pm_data = []
-            for i in range(0, SIZE_FLOAT, PACKET_SIZE):
-                offset = (block * SIZE_FLOAT) + i
-                if self.crc_calc(data[offset:offset+2]) != data[offset+2]:
-                    if self.logger:
-                        self.logger.warning(
-                            "'__particle_count_measurement' CRC mismatched!" +
-                            "  Data: {data[offset:offset+2]}" +
-                            "  Calculated CRC: {self.crc_calc(data[offset:offset+2])}" +
-                            "  Expected: {data[offset+2]}")
-                    else:
-                        print(
-                            "'__particle_count_measurement' CRC mismatched!" +
-                            "  Data: {data[offset:offset+2]}" +
-                            "  Calculated CRC: {self.crc_calc(data[offset:offset+2])}" +
-                            "  Expected: {data[offset+2]}")
-
-                    self.__valid["particle_count"] = False
-                    return {}
-
-                pm_data.extend(data[offset:offset+2])
-
-            count[pm] = self.__ieee754_number_conversion(
-                pm_data[0] << 24 | pm_data[1] << 16 | pm_data[2] << 8 | pm_data[3])
-
-        self.__valid["particle_count"] = True
-
-        return count
-
-    def __particle_size_measurement(self, data: list) -> float:
-        size = []
-        for i in range(0, SIZE_FLOAT, PACKET_SIZE):
-            if self.crc_calc(data[i:i+2]) != data[i+2]:
-                if self.logger:
-                    self.logger.warning(
-                        "'__particle_size_measurement' CRC mismatched!" +
-                        "  Data: {data[i:i+2]}" +
-                        "  Calculated CRC: {self.crc_calc(data[i:i+2])}" +
-                        "  Expected: {data[i+2]}")
+    def poll(self) -> Sample:
+        """Returns the latest measurement, its age in ms and whether it is stale,
+        without blocking. The bus is only queried once a new sample is due.
+        """
+        if self.ready.due():
+            if self.read_data_ready_flag():
+                data = self.i2c.query(CMD_READ_MEASURED_VALUES, NBYTES_MEASURED_VALUES_FLOAT)
+                values = self.__measured_values(data)
+                if self.__valid["mass_density"]:
+                    self.ready.update(values)
                 else:
-                    print(
-                        "'__particle_size_measurement' CRC mismatched!" +
-                        "  Data: {data[i:i+2]}" +
-                        "  Calculated CRC: {self.crc_calc(data[i:i+2])}" +
-                        "  Expected: {data[i+2]}")
-
-                self.__valid["particle_size"] = False
-                return 0.0
-
-            size.extend(data[i:i+2])
-
-        self.__valid["particle_size"] = True
+                    self.ready.miss()
+            else:
+                self.ready.miss()
 
-        return self.__ieee754_number_conversion(size[0] << 24 | size[1] << 16 | size[2] << 8 | size[3])
+        return self.ready.sample()
 
-    def __read_measured_value(self) -> None:
-        while True:
+    def __read_measured_value(self) -> dict:
+        """Waits for the next sample, sleeping only until it is predicted.
+        Gives up and returns None once no sample came for as long as makes it
+        stale, e.g. when the sensor never reports ready or keeps failing CRC."""
+        last = self.ready.ticks
+        start = ticks_ms()
+        while ticks_diff(ticks_ms(), start) <= self.ready.stale_ms:
             try:
-                if not self.read_data_ready_flag():
-                    continue
-
-                self.i2c.write(CMD_READ_MEASURED_VALUES)
-                data = self.i2c.read(NBYTES_MEASURED_VALUES_FLOAT)
-
-                result = {
-                    "mass_density": self.__mass_density_measurement(data[:24]),
-                    "particle_count": self.__particle_count_measurement(data[24:54]),
-                    "particle_size": self.__particle_size_measurement(data[54:]),
-                    "mass_density_unit": "ug/m3",
-                    "particle_count_unit": "#/cm3",
-                    "particle_size_unit": "um"
-                }
-
-                return result 
+                # Sleep until the next sample is predicted, not a fixed period
+                sleep(self.ready.remaining_ms() / 1000)
+                sample = self.poll()
+                if self.ready.ticks != last:
+                    return sample.value
 
             except KeyboardInterrupt:
                 if self.logger:
@@ -331,13 +270,11 @@ class SPS30:
                 sys.exit()
 
             except Exception as e:
-                if self.logger:
-                    self.logger.warning("{type(e).__name__}: {e}")
-                else:
-                    print("{type(e).__name__}: {e}")
+                self.__warn("{}: {}".format(type(e).__name__, e))
+                self.ready.miss()
 
-            finally:
-                sleep(self.sampling_period)
+        self.__warn("'__read_measured_value' no sample within {} ms".format(self.ready.stale_ms))
+        return None
 
     def start_measurement(self) -> None:
         data_format = {
@@ -345,10 +282,7 @@ class SPS30:
             "unsigned_16_bit_integer": 0x05
         }
 
-        data = CMD_START_MEASUREMENT
-        data.extend([data_format["IEEE754_float"], 0x00])
-        data.append(self.crc_calc(data[2:4]))
-        self.i2c.write(data)
+        self.i2c.write_word(CMD_START_MEASUREMENT, data_format["IEEE754_float"] << 8)
         sleep(0.05)
 
 
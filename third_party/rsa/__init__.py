@@ -24,7 +24,7 @@ prevent repetitions, or other common security improvements. Use with care.
 """
 
 # Nothing
-from third_party.rsa.key import newkeys, PrivateKey, PublicKey
+from third_party.rsa.key import newkeys, PrivateKey, PublicKey, BlindingPool
 from third_party.rsa.pkcs1 import encrypt, decrypt, sign, verify, DecryptionError, \
     VerificationError, find_signature_hash,  sign_hash, compute_hash
 
@@ -39,5 +39,5 @@ if __name__ == "__main__":
     doctest.testmod()
 
 __all__ = ["newkeys", "encrypt", "decrypt", "sign", "verify", 'PublicKey',
-           'PrivateKey', 'DecryptionError', 'VerificationError',
+           'PrivateKey', 'BlindingPool', 'DecryptionError', 'VerificationError',
            'compute_hash', 'sign_hash']
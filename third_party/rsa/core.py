@@ -22,18 +22,122 @@ mathematically on integers.
 
 from third_party.rsa._compat import is_integer
 
-def fast_pow(x,e,m):
-    X = x
-    E = e
-    Y = 1
-    while E > 0:
-        if E % 2 == 0:
-            X = (X * X) % m
-            E = E//2
-        else:
-            Y = (X * Y) % m
-            E = E - 1
-    return Y
+def binary_pow(x, e, m):
+    """Right-to-left square-and-multiply, one bit of the exponent per step.
+
+    >>> binary_pow(4, 13, 497)
+    445
+    """
+    result = 1 % m
+    x %= m
+    while e:
+        if e & 1:
+            result = (result * x) % m
+        e >>= 1
+        if e:
+            x = (x * x) % m
+    return result
+
+
+def _window_size(nbits):
+    if nbits <= 32:
+        return 1
+    if nbits <= 512:
+        return 4
+    return 5
+
+
+def window_pow(x, e, m):
+    """Left-to-right sliding-window exponentiation.
+
+    Precomputes the odd powers of x up to the window size, then walks the
+    exponent once as a binary string so that no big-int temporaries are
+    created for the exponent bookkeeping.
+
+    >>> window_pow(4, 13, 497)
+    445
+    >>> window_pow(3, 0, 7), window_pow(3, 5, 1)
+    (1, 0)
+    >>> e = (1 << 100) + 12345
+    >>> window_pow(123456789, e, 1000000007) == binary_pow(123456789, e, 1000000007)
+    True
+    """
+    if e == 0:
+        return 1 % m
+    x %= m
+
+    bits = '{:b}'.format(e)
+    nbits = len(bits)
+    window = _window_size(nbits)
+
+    # table[i] holds x ** (2 * i + 1)
+    table = [x]
+    if window > 1:
+        x2 = (x * x) % m
+        for _ in range((1 << (window - 1)) - 1):
+            table.append((table[-1] * x2) % m)
+
+    result = 1
+    i = 0
+    while i < nbits:
+        if bits[i] == '0':
+            result = (result * result) % m
+            i += 1
+            continue
+
+        j = min(i + window, nbits)
+        while bits[j - 1] == '0':
+            j -= 1
+        for _ in range(j - i):
+            result = (result * result) % m
+        result = (result * table[int(bits[i:j], 2) >> 1]) % m
+        i = j
+
+    return result % m
+
+
+def _has_native_pow():
+    """Returns True when the runtime supports three-argument pow()."""
+    try:
+        return pow(4, 13, 497) == 445
+    except Exception:
+        return False
+
+
+BACKENDS = {
+    'binary': binary_pow,
+    'window': window_pow,
+}
+if _has_native_pow():
+    BACKENDS['native'] = pow
+
+_backend = BACKENDS.get('native', window_pow)
+
+
+def set_backend(name):
+    """Selects the modular exponentiation backend used by fast_pow.
+
+    :param name: one of the keys of ``BACKENDS``; 'native' is only available
+        when the runtime implements three-argument pow().
+    """
+    global _backend
+    try:
+        _backend = BACKENDS[name]
+    except KeyError:
+        raise ValueError('Unsupported pow backend: %r, try one of %s' %
+                         (name, ', '.join(sorted(BACKENDS))))
+
+
+def fast_pow(x, e, m):
+    """Returns (x ** e) % m using the selected backend.
+
+    Defaults to the native three-argument pow() when the runtime has one, and
+    to :py:func:`window_pow` otherwise.
+
+    >>> fast_pow(4, 13, 497)
+    445
+    """
+    return _backend(x, e, m)
 
 
 def assert_int(var, name):
@@ -68,3 +172,28 @@ def decrypt_int(cyphertext, dkey, n):
 
     message = fast_pow(cyphertext, dkey, n)
     return message
+
+
+def decrypt_int_crt(cyphertext, p, q, exp1, exp2, coef):
+    """Decrypts a cypher text using the Chinese Remainder Theorem.
+
+    Equivalent to ``decrypt_int(cyphertext, d, p * q)``, but performs two
+    half-width exponentiations modulo p and q instead of one full-width
+    exponentiation modulo n, which is roughly four times cheaper.
+
+    :param exp1: d mod (p-1)
+    :param exp2: d mod (q-1)
+    :param coef: (inverse of q) mod p
+
+    >>> decrypt_int_crt(12345, 65063, 57287, 55063, 10095, 50797)
+    2722184112
+    >>> decrypt_int(12345, 3349121513, 3727264081)
+    2722184112
+    """
+
+    assert_int(cyphertext, 'cyphertext')
+
+    m1 = fast_pow(cyphertext % p, exp1, p)
+    m2 = fast_pow(cyphertext % q, exp2, q)
+    h = (coef * (m1 - m2)) % p
+    return m2 + h * q
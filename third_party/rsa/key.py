@@ -367,7 +367,7 @@ class PrivateKey(AbstractKey):
 
     """
 
-    __slots__ = ('n', 'e', 'd', 'p', 'q', 'exp1', 'exp2', 'coef')
+    __slots__ = ('n', 'e', 'd', 'p', 'q', 'exp1', 'exp2', 'coef', 'blinding')
 
     def __init__(self, n, e, d, p, q):
         AbstractKey.__init__(self, n, e)
@@ -380,6 +380,9 @@ class PrivateKey(AbstractKey):
         self.exp2 = int(d % (q - 1))
         self.coef = third_party.rsa.common.inverse(q, p)
 
+        # Optional BlindingPool with precomputed blinding pairs.
+        self.blinding = None
+
     def __getitem__(self, key):
         return getattr(self, key)
 
@@ -393,6 +396,7 @@ class PrivateKey(AbstractKey):
     def __setstate__(self, state):
         """Sets the key from tuple."""
         self.n, self.e, self.d, self.p, self.q, self.exp1, self.exp2, self.coef = state
+        self.blinding = None
 
     def __eq__(self, other):
         if other is None:
@@ -426,9 +430,14 @@ class PrivateKey(AbstractKey):
         :rtype: int
         """
 
+        if self.blinding is not None:
+            blind_re, blind_inv = self.blinding.take()
+            decrypted = self._private_pow((encrypted * blind_re) % self.n)
+            return (decrypted * blind_inv) % self.n
+
         blind_r = third_party.rsa.randnum.randint(self.n - 1)
         blinded = self.blind(encrypted, blind_r)  # blind before decrypting
-        decrypted = third_party.rsa.core.decrypt_int(blinded, self.d, self.n)
+        decrypted = self._private_pow(blinded)
 
         return self.unblind(decrypted, blind_r)
 
@@ -442,11 +451,44 @@ class PrivateKey(AbstractKey):
         :rtype: int
         """
 
+        if message > self.n:
+            raise OverflowError("The message %i is too long for n=%i" % (message, self.n))
+
+        if self.blinding is not None:
+            blind_re, blind_inv = self.blinding.take()
+            encrypted = self._private_pow((message * blind_re) % self.n)
+            return (encrypted * blind_inv) % self.n
+
         blind_r = third_party.rsa.randnum.randint(self.n - 1)
         blinded = self.blind(message, blind_r)  # blind before encrypting
-        encrypted = third_party.rsa.core.encrypt_int(blinded, self.d, self.n)
+        encrypted = self._private_pow(blinded)
         return self.unblind(encrypted, blind_r)
 
+    def _private_pow(self, value):
+        """Raises 'value' to the private exponent 'd' modulo 'n'.
+
+        Uses the Chinese Remainder Theorem with the precomputed exp1, exp2 and
+        coef values. A faulty CRT result leaks the factors of n, so the result
+        is checked with the (cheap) public exponent and the full-width
+        exponentiation is used as a fallback.
+
+        :param value: the (blinded) value to raise
+        :type value: int
+        :rtype: int
+
+        >>> pk = PrivateKey(3727264081, 65537, 3349121513, 65063, 57287)
+        >>> pk._private_pow(12345) == pow(12345, pk.d, pk.n)
+        True
+        """
+
+        result = third_party.rsa.core.decrypt_int_crt(value, self.p, self.q,
+                                                      self.exp1, self.exp2, self.coef)
+        if third_party.rsa.core.fast_pow(result, self.e, self.n) != value % self.n:
+            log.warning('CRT exponentiation failed verification, using full exponent')
+            result = third_party.rsa.core.decrypt_int(value, self.d, self.n)
+
+        return result
+
     @classmethod
     def _load_pkcs1_der(cls, keyfile):
         """Loads a key in PKCS#1 DER format.
@@ -569,6 +611,74 @@ class PrivateKey(AbstractKey):
         return third_party.rsa.pem.save_pem(der, b'RSA PRIVATE KEY')
 
 
+class BlindingPool(object):
+    """Cache of precomputed blinding pairs (r ** e mod n, r ** -1 mod n).
+
+    Creating a pair costs a random number, a public exponentiation and an
+    extended GCD. Taking a pair from the pool costs nothing; the used pair is
+    squared (two multiplications) and put back, since squaring both halves
+    yields another valid pair. A pair is retired after ``max_uses`` squarings
+    and replaced by a fresh one the next time :py:meth:`fill` runs, which is
+    meant to be called when the device is otherwise idle.
+
+    >>> pk = PrivateKey(3727264081, 65537, 3349121513, 65063, 57287)
+    >>> pk.blinding = BlindingPool(pk, size=2)
+    >>> pk.blinding.fill()
+    2
+    >>> all(pk.blinded_encrypt(m) == pow(m, pk.d, pk.n) for m in range(1, 100))
+    True
+    >>> blind_re, blind_inv = pk.blinding.take()
+    >>> (blind_re * pow(blind_inv, pk.e, pk.n)) % pk.n
+    1
+    """
+
+    __slots__ = ('key', 'size', 'max_uses', '_pairs')
+
+    def __init__(self, key, size=2, max_uses=32):
+        self.key = key
+        self.size = size
+        self.max_uses = max_uses
+        self._pairs = []
+
+    def __len__(self):
+        return len(self._pairs)
+
+    def _new_pair(self):
+        n = self.key.n
+        blind_r = third_party.rsa.randnum.randint(n - 1)
+        return [third_party.rsa.core.fast_pow(blind_r, self.key.e, n),
+                third_party.rsa.common.inverse(blind_r, n),
+                0]
+
+    def fill(self, count=None):
+        """Adds up to 'count' fresh pairs (default: until the pool is full).
+
+        :returns: the number of pairs added.
+        """
+        added = 0
+        while len(self._pairs) < self.size and (count is None or added < count):
+            self._pairs.append(self._new_pair())
+            added += 1
+        return added
+
+    def take(self):
+        """Returns a (r ** e mod n, r ** -1 mod n) pair, never the same one twice."""
+        if self._pairs:
+            pair = self._pairs.pop(0)
+        else:
+            pair = self._new_pair()
+        blind_re, blind_inv, uses = pair
+
+        if uses < self.max_uses:
+            n = self.key.n
+            pair[0] = (blind_re * blind_re) % n
+            pair[1] = (blind_inv * blind_inv) % n
+            pair[2] = uses + 1
+            self._pairs.append(pair)
+
+        return blind_re, blind_inv
+
+
 def find_p_q(nbits, getprime_func=third_party.rsa.prime.getprime, accurate=True):
     """Returns a tuple of two different primes of nbits bits each.
 
@@ -771,7 +881,7 @@ def newkeys(nbits, accurate=True, poolsize=1, exponent=DEFAULT_EXPONENT):
     )
 
 
-__all__ = ['PublicKey', 'PrivateKey', 'newkeys']
+__all__ = ['PublicKey', 'PrivateKey', 'BlindingPool', 'newkeys']
 
 if __name__ == '__main__':
     import doctest
@@ -0,0 +1,22 @@
+"""The MicroPython ticks functions, with a fallback when the firmware modules
+run with CPython on a host.
+
+On the host the ticks come from perf_counter() and do not wrap around, so
+ticks_diff() and ticks_add() are plain arithmetic.
+"""
+try:
+    from time import ticks_ms, ticks_us, ticks_diff, ticks_add
+except ImportError: # CPython host
+    from time import perf_counter
+
+    def ticks_ms():
+        return int(perf_counter() * 1000)
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(end, start):
+        return end - start
+
+    def ticks_add(ticks, delta):
+        return ticks + delta
@@ -0,0 +1,46 @@
+import utime
+
+
+class TokenManager:
+    """Keeps the signed JWT used as the MQTT password together with its expiry.
+
+    :param sign: callable taking the issue time (device seconds, as returned
+        by utime.time()) and returning the signed JWT for it.
+    :param int token_ttl: lifetime of a token in seconds, as put in the 'exp' claim.
+    :param int refresh_margin: how many seconds before expiry a token is due
+        for renewal. Defaults to a tenth of the TTL, but at least a minute.
+    """
+
+    def __init__(self, sign, token_ttl, refresh_margin=None):
+        self.sign = sign
+        self.token_ttl = token_ttl
+        if refresh_margin is None:
+            refresh_margin = max(60, token_ttl // 10)
+        self.refresh_margin = refresh_margin
+        self.jwt = None
+        self.issued_at = 0
+        self.expires_at = 0
+
+    def remaining(self, now=None):
+        """Seconds until the current token expires (negative once expired)."""
+        if now is None:
+            now = utime.time()
+        return self.expires_at - now
+
+    def due(self, now=None):
+        """True when there is no token yet or it expires within the refresh margin."""
+        return self.jwt is None or self.remaining(now) <= self.refresh_margin
+
+    def refresh(self):
+        """Signs a new token and returns it."""
+        now = utime.time()
+        self.jwt = self.sign(now)
+        self.issued_at = now
+        self.expires_at = now + self.token_ttl
+        return self.jwt
+
+    def get(self):
+        """Returns the cached token, signing a new one only if it has expired."""
+        if self.jwt is None or self.remaining() <= 0:
+            self.refresh()
+        return self.jwt